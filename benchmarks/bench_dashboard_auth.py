@@ -0,0 +1,123 @@
+"""
+Benchmark de la dependencia de autenticación del dashboard.
+
+Compara las rutas /api/me/* con las cachés de JWT y de contexto de usuario
+vaciadas antes de cada request (comportamiento anterior) frente a las cachés
+activas, midiendo latencia media y sentencias SQL por request.
+
+Uso:
+    python -m benchmarks.bench_dashboard_auth --requests 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("TELEGRAM_TOKEN", "bench_token")
+os.environ.setdefault("MORALIS_API_KEY", "bench_key")
+_tmp_dir = tempfile.mkdtemp(prefix="bench_dashboard_")
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+)
+
+import httpx  # noqa: E402
+from jose import jwt  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import dashboardApp  # noqa: E402
+from src.models import Base, Transaction, User, UserToken, engine  # noqa: E402
+from src.models import AsyncSessionLocal  # noqa: E402
+
+USER_ID = 1
+ENDPOINTS = ["/api/me/tokens", "/api/me/transactions"]
+
+
+async def _populate():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            session.add(User(user_id=USER_ID, wallet_address="0x" + "a" * 40))
+            for i in range(5):
+                session.add(
+                    UserToken(
+                        user_id=USER_ID,
+                        token_address=f"0x{i:040x}",
+                        token_symbol=f"TK{i}",
+                    )
+                )
+            for i in range(50):
+                session.add(
+                    Transaction(
+                        user_id=USER_ID,
+                        token_address=f"0x{i % 5:040x}",
+                        token_symbol=f"TK{i % 5}",
+                        amount=str(10**18 * i),
+                        tx_hash=f"0x{i:064x}",
+                        block_timestamp=f"2024-01-01T00:{i:02d}:00.000Z",
+                        from_address="0x" + "b" * 40,
+                    )
+                )
+
+
+def _make_token() -> str:
+    expire = datetime.now(timezone.utc) + timedelta(minutes=60)
+    return jwt.encode(
+        {"sub": str(USER_ID), "id": USER_ID, "exp": expire},
+        dashboardApp.SECRET_KEY,
+        algorithm=dashboardApp.ALGORITHM,
+    )
+
+
+async def _run(n_requests: int, cached: bool, statements: list) -> dict:
+    token = _make_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    transport = httpx.ASGITransport(app=dashboardApp.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        statements.clear()
+        for i in range(n_requests):
+            if not cached:
+                dashboardApp._verified_tokens.clear()
+                dashboardApp._user_contexts.clear()
+            start = time.perf_counter()
+            resp = await client.get(ENDPOINTS[i % len(ENDPOINTS)], headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert resp.status_code == 200, resp.text
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95)] * 1000,
+        "sql_per_request": len(statements) / n_requests,
+    }
+
+
+async def main(n_requests: int):
+    logging.getLogger("dashboard_app").setLevel(logging.WARNING)
+    await _populate()
+    statements = []
+    event.listen(
+        engine.sync_engine,
+        "before_cursor_execute",
+        lambda *args, **kwargs: statements.append(1),
+    )
+    # Calentamiento para no medir imports perezosos ni la primera conexión
+    await _run(10, cached=True, statements=statements)
+    for label, cached in (("sin caché", False), ("con caché", True)):
+        result = await _run(n_requests, cached, statements)
+        print(
+            f"{label:>10}: media {result['mean_ms']:.3f} ms | "
+            f"p95 {result['p95_ms']:.3f} ms | "
+            f"SQL/request {result['sql_per_request']:.2f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
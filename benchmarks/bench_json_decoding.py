@@ -0,0 +1,163 @@
+"""
+Benchmark de decodificación de páginas del historial de Moralis.
+
+Compara los decodificadores de src/watcher/decoding.py (json, orjson y
+msgspec, según estén instalados) frente a `json.loads` a dicts, que es lo que
+hacía `resp.json()`. Mide el tiempo medio por página y, con tracemalloc, la
+memoria que retiene el resultado decodificado y el pico durante la
+decodificación.
+
+Sin --file se usa una página sintética con la forma de la respuesta real de
+/wallets/{addr}/history (logs, transfers nativos, etiquetas...). Con --file se
+decodifican páginas grabadas (un JSON por fichero).
+
+Uso:
+    python -m benchmarks.bench_json_decoding --transactions 100 --repeat 50
+    python -m benchmarks.bench_json_decoding --file pagina1.json pagina2.json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("TELEGRAM_TOKEN", "bench_token")
+os.environ.setdefault("MORALIS_API_KEY", "bench_key")
+
+from src.watcher import decoding  # noqa: E402
+
+WALLET = "0x" + "a" * 40
+
+
+def _synthetic_transaction(n: int) -> dict:
+    tx_hash = f"0x{n:064x}"
+    return {
+        "hash": tx_hash,
+        "nonce": str(n),
+        "transaction_index": "12",
+        "from_address": "0x" + "5" * 40,
+        "from_address_label": None,
+        "to_address": "0x" + "3" * 40,
+        "to_address_label": "MYST Token",
+        "value": "0",
+        "gas": "90000",
+        "gas_price": "30000000000",
+        "receipt_cumulative_gas_used": "1234567",
+        "receipt_gas_used": "52000",
+        "receipt_status": "1",
+        "block_timestamp": f"2024-01-01T00:{n // 60 % 60:02d}:{n % 60:02d}.000Z",
+        "block_number": str(50_000_000 - n),
+        "block_hash": f"0x{n + 1:064x}",
+        "category": "token receive",
+        "summary": "Received 1 MYST from 0x5555...5555",
+        "possible_spam": False,
+        "method_label": "transfer",
+        "logs": [
+            {
+                "log_index": str(i),
+                "address": "0x" + "3" * 40,
+                "data": "0x" + "0" * 64,
+                "topic0": "0x" + "d" * 64,
+                "topic1": "0x" + "0" * 24 + "5" * 40,
+                "topic2": "0x" + "0" * 24 + "a" * 40,
+                "topic3": None,
+            }
+            for i in range(3)
+        ],
+        "native_transfers": [],
+        "nft_transfers": [],
+        "erc20_transfers": [
+            {
+                "token_name": "Mysterium",
+                "token_symbol": "MYST",
+                "token_logo": "https://logo.moralis.io/0x89_0x3c3e8eb3.png",
+                "token_decimals": "18",
+                "address": "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce",
+                "block_timestamp": "2024-01-01T00:00:00.000Z",
+                "to_address": WALLET,
+                "to_address_label": None,
+                "from_address": "0x" + "5" * 40,
+                "from_address_label": None,
+                "value": "1000000000000000000",
+                "value_formatted": "1",
+                "log_index": 2,
+                "possible_spam": False,
+                "verified_contract": True,
+                "security_score": 80,
+            }
+        ],
+    }
+
+
+def _synthetic_page(transactions: int) -> bytes:
+    page = {
+        "cursor": "eyJhbGciOiJIUzI1NiJ9",
+        "page_size": transactions,
+        "limit": str(transactions),
+        "page": "0",
+        "result": [_synthetic_transaction(n) for n in range(transactions)],
+    }
+    return json.dumps(page).encode()
+
+
+def _measure(decode, pages, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for body in pages:
+            decode(body)
+        timings.append((time.perf_counter() - started) / len(pages))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    decoded = [decode(body) for body in pages]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return {
+        "ms_per_page": statistics.mean(timings) * 1000,
+        "retained_kib": (retained - before) / 1024 / len(pages),
+        "peak_kib": (peak - before) / 1024 / len(pages),
+    }
+
+
+def main(args):
+    if args.file:
+        pages = []
+        for path in args.file:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+    else:
+        pages = [_synthetic_page(args.transactions)]
+    size_kib = sum(len(p) for p in pages) / 1024 / len(pages)
+    print(f"{len(pages)} páginas, {size_kib:.0f} KiB de media")
+
+    candidates = {"json.loads (dicts)": json.loads}
+    for name in ("json", "orjson", "msgspec"):
+        try:
+            decoding.resolve_decoder(name)
+        except ValueError:
+            print(f"{name}: no instalado, se omite")
+            continue
+        candidates[f"{name} (registros)"] = (
+            lambda body, name=name: decoding.decode_history_page(body, name)
+        )
+
+    print(f"{'decodificador':>20} | {'ms/página':>10} | {'retenido KiB':>12} | {'pico KiB':>9}")
+    for label, decode in candidates.items():
+        result = _measure(decode, pages, args.repeat)
+        print(
+            f"{label:>20} | {result['ms_per_page']:>10.3f} | "
+            f"{result['retained_kib']:>12.1f} | {result['peak_kib']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--transactions", type=int, default=100, help="Por página sintética")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--file", nargs="+", help="Páginas grabadas de Moralis")
+    main(parser.parse_args())
@@ -0,0 +1,280 @@
+"""
+Benchmark offline del ciclo de sondeo por usuario (`run_poll_cycle`).
+
+Levanta un servidor Moralis falso en local (tests/fakeMoralisServer.py) con
+páginas, latencia y tasas de error configurables, crea N usuarios sintéticos
+con su wallet y un token vigilado, y ejecuta dos ciclos: uno en frío (todo el
+historial es nuevo) y otro estable tras un depósito nuevo por wallet. Mide
+tiempo de ciclo, llamadas a la API, bytes recibidos, tiempo y sentencias SQL,
+notificaciones y pico de RSS.
+
+Cada escala corre en un subproceso propio para que el pico de RSS sea el
+suyo. Con --save-baseline se guardan los resultados; con --compare se
+comparan con la línea base y el proceso sale con código 1 si hay regresión
+(útil en CI).
+
+Uso:
+    python -m benchmarks.bench_polling --scales 10 1000
+    python -m benchmarks.bench_polling --scales 10 1000 10000 --save-baseline
+    python -m benchmarks.bench_polling --compare --tolerance 0.5
+
+Con --error-rate o --rate-limit-rate los reintentos de tenacity esperan entre
+4 y 10 segundos, así que conviene usarlos solo con escalas pequeñas.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("TELEGRAM_TOKEN", "bench_token")
+os.environ.setdefault("MORALIS_API_KEY", "bench_key")
+_tmp_dir = tempfile.mkdtemp(prefix="bench_polling_")
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+)
+
+from aiohttp.test_utils import TestServer  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from src.bot.main import init_db, run_poll_cycle  # noqa: E402
+from src.models import AsyncSessionLocal, User, UserToken, engine  # noqa: E402
+from src.watcher import moralis  # noqa: E402
+from src.utils.http import create_client_session  # noqa: E402
+from tests.fakeMoralisServer import DEFAULT_TOKEN, FakeMoralisServer  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "polling.json")
+# Métricas deterministas: cualquier aumento respecto a la línea base es regresión
+EXACT_KEYS = ("api_calls", "db_statements", "notifications")
+# Métricas con ruido: se comparan con tolerancia relativa
+TIMED_KEYS = ("seconds", "db_seconds")
+
+
+class NullBot:
+    """Sustituye a telegram.Bot: cuenta los mensajes sin enviarlos."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, **kwargs):
+        self.sent += 1
+
+
+class DbTimer:
+    """Suma el tiempo y el número de sentencias SQL ejecutadas por el engine."""
+
+    def __init__(self, sync_engine):
+        self.seconds = 0.0
+        self.statements = 0
+        event.listen(sync_engine, "before_cursor_execute", self._before)
+        event.listen(sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.seconds += time.perf_counter() - conn.info["bench_started"].pop()
+        self.statements += 1
+
+    def reset(self):
+        self.seconds = 0.0
+        self.statements = 0
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _populate(n_users: int):
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            for user_id in range(1, n_users + 1):
+                session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+                session.add(
+                    UserToken(
+                        user_id=user_id, token_address=DEFAULT_TOKEN, token_symbol="MYST"
+                    )
+                )
+
+
+async def _measure_cycle(fake, bot, db_timer, client_session) -> dict:
+    calls_before, bytes_before, sent_before = fake.total_calls, fake.bytes_sent, bot.sent
+    db_timer.reset()
+    started = time.perf_counter()
+    await run_poll_cycle(bot, client_session)
+    return {
+        "seconds": round(time.perf_counter() - started, 4),
+        "api_calls": fake.total_calls - calls_before,
+        "bytes": fake.bytes_sent - bytes_before,
+        "db_seconds": round(db_timer.seconds, 4),
+        "db_statements": db_timer.statements,
+        "notifications": bot.sent - sent_before,
+    }
+
+
+async def run_single(n_users: int, args) -> dict:
+    """Ejecuta una escala en este proceso y devuelve sus resultados."""
+    logging.getLogger("token_tracker_bot").setLevel(logging.WARNING)
+    fake = FakeMoralisServer(
+        pages_per_wallet=args.pages,
+        page_size=args.page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    moralis.MORALIS_BASE = str(server.make_url("")).rstrip("/")
+
+    await _populate(n_users)
+    db_timer = DbTimer(engine.sync_engine)
+    bot = NullBot()
+    try:
+        async with create_client_session("bench") as client_session:
+            cold = await _measure_cycle(fake, bot, db_timer, client_session)
+            fake.advance(1)
+            steady = await _measure_cycle(fake, bot, db_timer, client_session)
+    finally:
+        await server.close()
+        await engine.dispose()
+    return {
+        "users": n_users,
+        "cold": cold,
+        "steady": steady,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _run_scale(n_users: int, args) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_polling",
+        "--run-single",
+        str(n_users),
+        "--pages",
+        str(args.pages),
+        "--page-size",
+        str(args.page_size),
+        "--latency",
+        str(args.latency),
+        "--error-rate",
+        str(args.error_rate),
+        "--rate-limit-rate",
+        str(args.rate_limit_rate),
+    ]
+    # Sin DATABASE_URL heredada: cada subproceso crea su propia BD temporal
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    output = subprocess.run(
+        command, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Devuelve la lista de regresiones respecto a la línea base."""
+    regressions = []
+    for scale, result in results["scales"].items():
+        base = baseline["scales"].get(scale)
+        if base is None:
+            continue
+        for phase in ("cold", "steady"):
+            for key in EXACT_KEYS:
+                if result[phase][key] > base[phase][key]:
+                    regressions.append(
+                        f"{scale} {phase}.{key}: {result[phase][key]} > {base[phase][key]}"
+                    )
+            for key in TIMED_KEYS:
+                limit = base[phase][key] * (1 + tolerance)
+                # Margen absoluto para que los ciclos de milisegundos no fallen por ruido
+                if result[phase][key] > max(limit, base[phase][key] + 0.05):
+                    regressions.append(
+                        f"{scale} {phase}.{key}: {result[phase][key]} > {limit:.4f}"
+                    )
+        limit = base["peak_rss_mb"] * (1 + tolerance)
+        if result["peak_rss_mb"] > limit:
+            regressions.append(
+                f"{scale} peak_rss_mb: {result['peak_rss_mb']} > {limit:.1f}"
+            )
+    return regressions
+
+
+def _print_table(results: dict):
+    print(
+        f"{'usuarios':>9} | {'fase':>6} | {'ciclo s':>8} | {'API':>7} | "
+        f"{'KiB':>8} | {'BD s':>7} | {'SQL':>7} | {'avisos':>7} | {'RSS MiB':>8}"
+    )
+    for result in results["scales"].values():
+        for phase in ("cold", "steady"):
+            r = result[phase]
+            print(
+                f"{result['users']:>9} | {phase:>6} | {r['seconds']:>8.3f} | "
+                f"{r['api_calls']:>7} | {r['bytes'] / 1024:>8.0f} | "
+                f"{r['db_seconds']:>7.3f} | {r['db_statements']:>7} | "
+                f"{r['notifications']:>7} | {result['peak_rss_mb']:>8.1f}"
+            )
+
+
+def main(args):
+    if args.run_single:
+        print(json.dumps(asyncio.run(run_single(args.run_single, args))))
+        return
+
+    results = {
+        "params": {
+            "pages": args.pages,
+            "page_size": args.page_size,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+        },
+        "scales": {str(n): _run_scale(n, args) for n in args.scales},
+    }
+    _print_table(results)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Línea base guardada en {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["params"] != results["params"]:
+            sys.exit("Los parámetros no coinciden con los de la línea base.")
+        regressions = _compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        if regressions:
+            sys.exit(1)
+        print("Sin regresiones respecto a la línea base.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--pages", type=int, default=2, help="Páginas por wallet")
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos por petición")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5, help="Empeoramiento relativo admitido"
+    )
+    parser.add_argument("--run-single", type=int, help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+"""
+Benchmark de escalado horizontal del sondeo por usuario.
+
+Crea N usuarios sintéticos en una BD SQLite temporal y lanza 1, 2, 4...
+procesos de sondeo (tests/pollerWorker.py) que se reparten las franjas de un
+ciclo a través de `poll_lease`, contra un Moralis falso en local con latencia
+por petición. Para cada número de procesos muestra el tiempo hasta que el
+ciclo está completo, usuarios por segundo, aceleración frente a un solo
+proceso y si algún usuario se ha consultado o notificado dos veces.
+
+El sondeo espera sobre todo a Moralis, así que con una latencia realista la
+aceleración es casi lineal; con latencias muy bajas manda la CPU y la
+aceleración queda limitada por los núcleos de la máquina.
+
+Uso:
+    python -m benchmarks.bench_workers --workers 1 2 4 --users 120 --latency 0.1
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("TELEGRAM_TOKEN", "bench_token")
+os.environ.setdefault("MORALIS_API_KEY", "bench_key")
+
+from aiohttp.test_utils import TestServer  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from src.models import Base, User, UserToken  # noqa: E402
+from tests.fakeMoralisServer import DEFAULT_TOKEN, FakeMoralisServer  # noqa: E402
+from tests.pollerWorker import spawn_workers  # noqa: E402
+
+
+async def _populate(database_url: str, n_users: int):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            for user_id in range(1, n_users + 1):
+                session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+                session.add(
+                    UserToken(
+                        user_id=user_id, token_address=DEFAULT_TOKEN, token_symbol="MYST"
+                    )
+                )
+    await engine.dispose()
+
+
+async def run_workers(n_workers: int, args) -> dict:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    database_url = f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    await _populate(database_url, args.users)
+
+    fake = FakeMoralisServer(
+        pages_per_wallet=args.pages, page_size=args.page_size, latency=args.latency
+    )
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    started = time.perf_counter()
+    try:
+        results = await spawn_workers(
+            n_workers, database_url, str(server.make_url("")), args.slots
+        )
+    finally:
+        seconds = time.perf_counter() - started
+        await server.close()
+
+    notifications = [tuple(n) for r in results for n in r["notifications"]]
+    return {
+        "workers": n_workers,
+        "seconds": seconds,
+        # El tiempo de trabajo excluye el arranque de los procesos
+        "work_seconds": max(r["seconds"] for r in results),
+        "slots_per_worker": [len(r["slots"]) for r in results],
+        "history_calls": fake.calls.get("history", 0),
+        "duplicates": len(notifications) - len(set(notifications)),
+    }
+
+
+async def main(args):
+    print(
+        f"{args.users} usuarios, {args.slots} franjas, "
+        f"{args.latency * 1000:.0f} ms por petición a Moralis"
+    )
+    print(
+        f"{'procesos':>8} | {'total s':>8} | {'trabajo s':>9} | {'usuarios/s':>10} | "
+        f"{'acelera':>7} | {'franjas':>16} | {'API':>6} | {'dups':>4}"
+    )
+    base = None
+    for n in args.workers:
+        r = await run_workers(n, args)
+        base = base or r["work_seconds"]
+        print(
+            f"{n:>8} | {r['seconds']:>8.2f} | {r['work_seconds']:>9.2f} | "
+            f"{args.users / r['work_seconds']:>10.1f} | "
+            f"{base / r['work_seconds']:>6.2f}x | "
+            f"{','.join(map(str, r['slots_per_worker'])):>16} | "
+            f"{r['history_calls']:>6} | {r['duplicates']:>4}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=120)
+    parser.add_argument("--slots", type=int, default=24)
+    parser.add_argument("--pages", type=int, default=1, help="Páginas por wallet")
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1, help="Segundos por petición")
+    asyncio.run(main(parser.parse_args()))
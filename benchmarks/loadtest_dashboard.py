@@ -0,0 +1,106 @@
+"""
+Prueba de carga del dashboard en modo multi-worker.
+
+Arranca `uvicorn dashboardApp:app --workers N` para cada N indicado sobre una
+BD temporal con datos sintéticos, lanza peticiones concurrentes a /api/me/*
+durante unos segundos y muestra las peticiones por segundo de cada
+configuración.
+
+Uso:
+    python -m benchmarks.loadtest_dashboard --workers 1 2 4 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.bench_dashboard_auth import ENDPOINTS, _make_token, _populate
+from src.models import engine
+
+
+async def _wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/api/stats") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"El dashboard no arrancó en {timeout}s")
+
+
+async def _load(base_url: str, token: str, duration: float, concurrency: int) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    counts = {"ok": 0, "errors": 0}
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+
+        async def worker(offset: int):
+            i = offset
+            while time.monotonic() < deadline:
+                try:
+                    async with session.get(
+                        f"{base_url}{ENDPOINTS[i % len(ENDPOINTS)]}"
+                    ) as resp:
+                        await resp.read()
+                        counts["ok" if resp.status == 200 else "errors"] += 1
+                except aiohttp.ClientError:
+                    counts["errors"] += 1
+                i += 1
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return {**counts, "rps": counts["ok"] / elapsed}
+
+
+async def main(worker_counts, duration: float, concurrency: int, port: int):
+    await _populate()
+    await engine.dispose()
+    token = _make_token()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "DASHBOARD_RATE_LIMIT": "0",  # Sin rate limit: medimos el throughput bruto
+        "DEBUG_MODE": "False",
+    }
+
+    print(f"{'workers':>8} | {'req/s':>10} | {'ok':>8} | {'errores':>8}")
+    for workers in worker_counts:
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "dashboardApp:app",
+                "--workers", str(workers), "--port", str(port),
+                "--log-level", "warning", "--no-access-log",
+            ],
+            env=env,
+        )
+        try:
+            await _wait_ready(base_url)
+            result = await _load(base_url, token, duration, concurrency)
+            print(
+                f"{workers:>8} | {result['rps']:>10.1f} | "
+                f"{result['ok']:>8} | {result['errors']:>8}"
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.duration, args.concurrency, args.port))
@@ -1,27 +1,63 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import select, func
 from src.models import AsyncSessionLocal, User, Transaction, UserToken
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
+from dataclasses import dataclass, field
 import hmac
 import hashlib
 import time
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
 from src.config.settings import settings
+from src.chains import DEFAULT_CHAIN
+from src.utils.cache import TTLCache
+from src.utils.circuitbreaker import CircuitOpenError
+from src.utils.ratelimit import RateLimiter
+from src.utils.http import create_client_session
+from src.utils.static_assets import CachedStaticFiles, resolve_dashboard_dir
+from src.portfolio import get_portfolio
+from src import metrics
+from src.bot.webhook import TelegramWebhook
+from src.export import EXPORT_FORMATS, parquet_available, stream_csv, stream_parquet
+from contextlib import asynccontextmanager
 import logging
 
 # Configure logging for the dashboard app
 logger = logging.getLogger("dashboard_app")
-logger.setLevel(logging.DEBUG)  # Set to DEBUG for more verbose output
-handler = logging.StreamHandler()
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logger.setLevel(logging.DEBUG if settings.debug_mode else logging.INFO)
+if not logger.handlers:  # Evita handlers duplicados al reimportar en cada worker
+    handler = logging.StreamHandler()
+    # El pid distingue las líneas de cada worker en modo multi-proceso
+    formatter = logging.Formatter(
+        "%(asctime)s - %(name)s[%(process)d] - %(levelname)s - %(message)s"
+    )
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+
+# Con TELEGRAM_WEBHOOK_URL el dashboard recibe también los updates del bot
+telegram_webhook = TelegramWebhook() if settings.telegram_webhook_url else None
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sesión HTTP compartida para las llamadas a Moralis del dashboard
+    async with create_client_session("dashboard") as client_session:
+        app.state.client_session = client_session
+        if telegram_webhook:
+            await telegram_webhook.start(client_session)
+        try:
+            yield
+        finally:
+            if telegram_webhook:
+                await telegram_webhook.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Pydantic models for API responses and requests
@@ -38,6 +74,7 @@ class TelegramUser(BaseModel):
 class UserTokenResponse(BaseModel):
     token_address: str
     token_symbol: Optional[str] = "UNKNOWN"
+    chain: str = DEFAULT_CHAIN
 
 
 class TransactionResponse(BaseModel):
@@ -48,6 +85,24 @@ class TransactionResponse(BaseModel):
     from_address: str
     amount: str  # Matches Transaction model
     block_timestamp: str  # Matches Transaction model
+    status: str = "confirmed"  # "pending" hasta alcanzar la profundidad de confirmación
+    chain: str = DEFAULT_CHAIN
+
+
+class TokenBalanceResponse(BaseModel):
+    token_address: str
+    token_symbol: str
+    balance: str
+    usd_value: str
+
+
+class PortfolioResponse(BaseModel):
+    wallet_address: str
+    balances: List[TokenBalanceResponse]
+    total_usd: str  # Solo tokens monitorizados
+    net_worth_usd: Optional[str] = None
+    updated_at: int  # Epoch de la última respuesta de Moralis
+    stale: bool
 
 
 # --- Authentication ---
@@ -56,6 +111,32 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/telegram")
 
+# Tokens ya verificados: sha256(token) -> user_id, caducan junto con el claim "exp"
+_verified_tokens = TTLCache(maxsize=settings.jwt_cache_size)
+# Contextos de usuario recientes: evita releer la BD en cargas seguidas del dashboard
+_user_contexts = TTLCache(
+    maxsize=settings.jwt_cache_size, default_ttl=settings.user_context_ttl
+)
+# Límite por usuario en /api/me/*: en memoria por worker o compartido vía SQLite local
+_rate_limiter = RateLimiter(
+    limit=settings.dashboard_rate_limit,
+    window=settings.dashboard_rate_window,
+    shared_path=settings.dashboard_shared_state_path,
+)
+
+
+@dataclass
+class UserContext:
+    """Datos del usuario autenticado, cargados una sola vez por request."""
+
+    user_id: int
+    wallet_address: str = ""
+    # (cadena, contrato) -> símbolo: el mismo contrato puede seguirse en varias cadenas
+    tracked_tokens: Dict[Tuple[str, str], Optional[str]] = field(default_factory=dict)
+
+    def token_addresses(self, chain: str) -> List[str]:
+        return [address for c, address in self.tracked_tokens if c == chain]
+
 
 def check_telegram_authorization(data: dict, bot_token: str) -> bool:
     data_check_string = []
@@ -71,12 +152,18 @@ def check_telegram_authorization(data: dict, bot_token: str) -> bool:
 
 
 def verify_access_token(token: str, credentials_exception) -> int:
+    token_digest = hashlib.sha256(token.encode("utf-8")).digest()
+    cached_user_id = _verified_tokens.get(token_digest)
+    if cached_user_id is not None:
+        return cached_user_id
     try:
         # Intenta decodificar el token con la clave secreta
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("id")
         if user_id is None:
             raise credentials_exception
+        if payload.get("exp") is not None:
+            _verified_tokens.set(token_digest, user_id, expires_at=payload["exp"])
         return user_id
     except JWTError as e:  # Si la firma no coincide o el token ha expirado, entra aquí
         logger.warning(f"JWT validation failed: {e}")
@@ -89,7 +176,46 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> int:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    return verify_access_token(token, credentials_exception)
+    user_id = verify_access_token(token, credentials_exception)
+    if not await _rate_limiter.hit(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(settings.dashboard_rate_window)},
+        )
+    return user_id
+
+
+async def get_user_context(
+    current_user_id: int = Depends(get_current_user),
+) -> UserContext:
+    """
+    Carga wallet y tokens monitorizados del usuario en una única sesión.
+    FastAPI cachea las dependencias por request, así que todos los endpoints y
+    sub-dependencias que la usen comparten el mismo objeto sin volver a la BD.
+    Entre requests se reutiliza durante `settings.user_context_ttl` segundos.
+    """
+    cached_context = _user_contexts.get(current_user_id)
+    if cached_context is not None:
+        return cached_context
+    async with AsyncSessionLocal() as session:
+        rows = await session.execute(
+            select(
+                User.wallet_address,
+                UserToken.chain,
+                UserToken.token_address,
+                UserToken.token_symbol,
+            )
+            .outerjoin(UserToken, UserToken.user_id == User.user_id)
+            .where(User.user_id == current_user_id)
+        )
+        context = UserContext(user_id=current_user_id)
+        for wallet_address, chain, token_address, token_symbol in rows.all():
+            context.wallet_address = wallet_address or ""
+            if token_address is not None:
+                context.tracked_tokens[chain, token_address] = token_symbol
+    _user_contexts.set(current_user_id, context)
+    return context
 
 
 # --- API Endpoints ---
@@ -149,57 +275,61 @@ async def get_general_stats():
     return {"total_users": total_users, "total_transactions": total_transactions}
 
 
+_LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    Métricas de este worker en formato Prometheus. Con `dashboard_metrics_token`
+    exige `Authorization: Bearer <token>`; sin él solo responde a localhost.
+    """
+    token = settings.dashboard_metrics_token
+    if token:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {token}"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    elif request.client is None or request.client.host not in _LOCAL_HOSTS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return Response(
+        content=metrics.generate_latest(), media_type=metrics.CONTENT_TYPE_LATEST
+    )
+
+
 @app.get("/api/me/tokens", response_model=List[UserTokenResponse])
-async def get_user_tokens(current_user_id: int = Depends(get_current_user)):
+async def get_user_tokens(user_context: UserContext = Depends(get_user_context)):
     """
     Returns a list of tokens monitored by the currently authenticated user.
     """
-    logger.debug(f"Request received for /api/me/tokens from user {current_user_id}")
-    try:
-        async with AsyncSessionLocal() as session:
-            tracked_tokens_results = await session.execute(
-                select(UserToken.token_address, UserToken.token_symbol).where(
-                    UserToken.user_id == current_user_id
-                )
-            )
-            tracked_tokens = tracked_tokens_results.all()
-            response_data = [
-                {"token_address": address, "token_symbol": symbol or "UNKNOWN"}
-                for address, symbol in tracked_tokens
-            ]
-            return response_data
-    except Exception as e:
-        logger.error(
-            f"Error fetching tokens for user {current_user_id}: {e}", exc_info=True
-        )
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to fetch user tokens",
-        )
+    logger.debug(
+        f"Request received for /api/me/tokens from user {user_context.user_id}"
+    )
+    return [
+        {"token_address": address, "token_symbol": symbol or "UNKNOWN", "chain": chain}
+        for (chain, address), symbol in user_context.tracked_tokens.items()
+    ]
 
 
 @app.get("/api/me/transactions", response_model=List[TransactionResponse])
-async def get_user_transactions(current_user_id: int = Depends(get_current_user)):
+async def get_user_transactions(user_context: UserContext = Depends(get_user_context)):
     """
     Devuelve una lista de las transacciones recientes del usuario loggeado.
     """
+    current_user_id = user_context.user_id
     logger.debug(f"Request received for /api/me/transactions from user {current_user_id}")
     try:
-        async with AsyncSessionLocal() as session: # Re-introducir este bloque
+        async with AsyncSessionLocal() as session:
+            # Los símbolos ya vienen en el contexto del usuario: no hace falta el join
             query = (
                 select(
                     Transaction.id,
                     Transaction.token_address,
-                    UserToken.token_symbol, # Assuming UserToken is imported and joined
                     Transaction.tx_hash,
                     Transaction.from_address,
                     Transaction.amount,
                     Transaction.block_timestamp,
-                )
-                .outerjoin(
-                    UserToken,
-                    (UserToken.user_id == Transaction.user_id) &
-                    (UserToken.token_address == Transaction.token_address)
+                    Transaction.status,
+                    Transaction.chain,
                 )
                 .where(Transaction.user_id == current_user_id)
                 .order_by(Transaction.block_timestamp.desc())
@@ -212,11 +342,16 @@ async def get_user_transactions(current_user_id: int = Depends(get_current_user)
                 {
                     "id": tx["id"],
                     "token_address": tx["token_address"],
-                    "token_symbol": tx["token_symbol"] or "UNKNOWN", # Handle None for symbol
+                    "token_symbol": user_context.tracked_tokens.get(
+                        (tx["chain"], tx["token_address"])
+                    )
+                    or "UNKNOWN",
                     "tx_hash": tx["tx_hash"],
                     "from_address": tx["from_address"],
                     "amount": tx["amount"],
-                    "block_timestamp": tx["block_timestamp"]
+                    "block_timestamp": tx["block_timestamp"],
+                    "status": tx["status"],
+                    "chain": tx["chain"],
                 }
                 for tx in transactions
             ]
@@ -228,5 +363,107 @@ async def get_user_transactions(current_user_id: int = Depends(get_current_user)
             detail="Failed to fetch user transactions",
         )
 
+@app.get("/api/me/transactions/export")
+async def export_user_transactions(
+    format: str = "csv", current_user_id: int = Depends(get_current_user)
+):
+    """
+    Exporta todo el historial de depósitos del usuario como descarga en streaming.
+    Formatos: `csv` (por defecto) o `parquet` (requiere pyarrow).
+    """
+    logger.debug(
+        f"Request received for /api/me/transactions/export ({format}) from user {current_user_id}"
+    )
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}",
+        )
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Parquet export is not available on this server",
+        )
+
+    stream = stream_csv if format == "csv" else stream_parquet
+    return StreamingResponse(
+        stream(current_user_id, settings.export_chunk_size),
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="deposits_{current_user_id}.{format}"'
+        },
+    )
+
+
+@app.get("/api/me/portfolio", response_model=PortfolioResponse)
+async def get_user_portfolio(
+    request: Request, user_context: UserContext = Depends(get_user_context)
+):
+    """
+    Balances y valor en USD de los tokens monitorizados por el usuario.
+    Se sirve desde la caché del portfolio; solo espera a Moralis la primera vez.
+    """
+    current_user_id = user_context.user_id
+    logger.debug(f"Request received for /api/me/portfolio from user {current_user_id}")
+    if not user_context.wallet_address:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No wallet configured",
+        )
+    try:
+        portfolio = await get_portfolio(
+            user_context.wallet_address,
+            # Los balances salen de Moralis en la cadena por defecto
+            user_context.token_addresses(DEFAULT_CHAIN),
+            request.app.state.client_session,
+        )
+    except CircuitOpenError as e:
+        # Moralis no responde y la wallet no tiene nada en caché
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Wallet balances are temporarily unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        )
+    except Exception as e:
+        logger.error(
+            f"Error fetching portfolio for user {current_user_id}: {e}", exc_info=True
+        )
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Failed to fetch wallet balances",
+        )
+    return {
+        "wallet_address": portfolio.wallet_address,
+        "balances": [
+            {
+                "token_address": token.token_address,
+                "token_symbol": user_context.tracked_tokens.get(
+                    (DEFAULT_CHAIN, token.token_address)
+                )
+                or token.symbol,
+                "balance": token.formatted_balance,
+                "usd_value": f"{token.usd_value:.2f}",
+            }
+            for token in portfolio.balances
+        ],
+        "total_usd": f"{portfolio.total_usd:.2f}",
+        "net_worth_usd": portfolio.net_worth_usd,
+        "updated_at": int(portfolio.fetched_at),
+        "stale": portfolio.stale or portfolio.degraded,
+    }
+
+
+@app.post(settings.telegram_webhook_path, include_in_schema=False)
+async def telegram_update(request: Request):
+    if telegram_webhook is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return await telegram_webhook.handle(request)
+
+
 # Mount static files - Must be the last thing before running the app
-app.mount("/", StaticFiles(directory="static/dashboard", html=True), name="dashboard")
\ No newline at end of file
+# Si existe el build (python -m src.utils.static_assets) se sirven los assets con hash
+app.mount(
+    "/",
+    CachedStaticFiles(directory=resolve_dashboard_dir("static/dashboard"), html=True),
+    name="dashboard",
+)
\ No newline at end of file
@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+# Perfil de despliegue multi-worker del dashboard:
+#   gunicorn dashboardApp:app -c gunicorn.conf.py
+# Alternativa sin gunicorn: uvicorn dashboardApp:app --workers 4
+#
+# Estado por worker: cachés de JWT, contexto de usuario y portfolio (acotadas en
+# memoria). Para que el rate limit sea global entre workers, define
+# DASHBOARD_SHARED_STATE_PATH=/ruta/a/dashboard_state.db
+#
+# Con TELEGRAM_WEBHOOK_URL el webhook necesita un único worker: cada worker
+# registraría el webhook y las conversaciones del bot viven en memoria.
+import multiprocessing
+import os
+
+bind = os.getenv("DASHBOARD_BIND", "127.0.0.1:8000")
+workers = int(
+    os.getenv(
+        "WEB_CONCURRENCY",
+        1 if os.getenv("TELEGRAM_WEBHOOK_URL") else multiprocessing.cpu_count(),
+    )
+)
+worker_class = "uvicorn.workers.UvicornWorker"
+# Con preload la app se importa una vez en el master; el engine de SQLAlchemy se
+# descarta automáticamente en cada hijo (ver src.models) para no compartir conexiones.
+preload_app = True
+keepalive = 5
+graceful_timeout = 30
+accesslog = None  # El dashboard ya registra cada request en su logger
+
+
+def on_starting(server):
+    # Con preload la app (y sus settings, incluido el .env) ya está cargada
+    from src.config.settings import settings
+
+    if settings.telegram_webhook_url and server.cfg.workers > 1:
+        raise RuntimeError(
+            f"El webhook de Telegram necesita un único worker ({server.cfg.workers} configurados): "
+            "usa WEB_CONCURRENCY=1 o sirve el webhook en un proceso aparte."
+        )
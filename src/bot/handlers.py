@@ -15,16 +15,27 @@ from src.models import (
     LastTx,
 )
 from sqlalchemy import delete
-from src.watcher.moralis import (
-    get_wallet_token_balances,
-    get_token_metadata,
+from src.watcher.moralis import get_token_metadata
+from src.portfolio import get_portfolio
+from src.services import (  # Importar el nuevo servicio
+    check_and_process_all_chains,
+    notifies_on_detection,
+    reset_check_cooldown,
+)
+from src.chains import CHAINS, DEFAULT_CHAIN, get_chain
+from src.utils.decorators import require_admin, require_wallet
+from src import profiling, workqueue
+from src.walletindex import wallet_index
+from src.config.settings import settings
+from src.utils.circuitbreaker import CircuitOpenError
+from src.utils.format import (
+    format_check_summary,
+    format_deposit_msg,
+    format_stale_note,
+    escape_md2,
 )
-from src.services import check_and_process_deposits  # Importar el nuevo servicio
-from src.utils.decorators import require_wallet  # Importar el decorador
-from src.utils.format import format_deposit_msg, escape_md2
 from sqlalchemy import select, func
 import re
-from decimal import Decimal
 from src.config.logger_config import logger  # Importar el logger
 
 # Definir estados para conversaciones
@@ -43,7 +54,10 @@ BOT_COMMANDS = [
         "description": "Configura la dirección de tu wallet para monitorizar.",
     },
     {"command": "wallet", "description": "Muestra tu dirección de wallet configurada."},
-    {"command": "addtoken", "description": "Añade un token ERC-20 para monitorizar."},
+    {
+        "command": "addtoken",
+        "description": "Añade un token ERC-20 para monitorizar (opcionalmente en otra red).",
+    },
     {
         "command": "removetoken",
         "description": "Elimina un token (o todos) de tu lista.",
@@ -74,6 +88,26 @@ BOT_COMMANDS = [
 ERC20_ADDRESS_PATTERN = re.compile(r"^0x[a-fA-F0-9]{40}$")
 
 
+def monitored_chains() -> list:
+    """Redes que sondea este despliegue (`settings.chains`)."""
+    return [get_chain(name).name for name in settings.chains]
+
+
+def parse_chain_arg(args: list, position: int, monitored_only: bool = True) -> str | None:
+    """
+    Red opcional en `args[position]`; None si no es una red conocida o, con
+    `monitored_only`, si el despliegue no la sondea (sus tokens nunca se
+    comprobarían).
+    """
+    chain = args[position].lower() if len(args) > position else DEFAULT_CHAIN
+    allowed = monitored_chains() if monitored_only else CHAINS
+    return chain if chain in allowed else None
+
+
+def chain_usage() -> str:
+    return f"Redes disponibles: {', '.join(monitored_chains())} (por defecto {DEFAULT_CHAIN})."
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Comando /start recibido de usuario {update.effective_user.id}")
     await update.message.reply_text(
@@ -115,6 +149,7 @@ async def set_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     session.add(user)
                     logger.info(f"Nueva wallet establecida para {user_id}: {wallet}")
                 await session.commit()
+        wallet_index.set_wallet(user_id, wallet)
         await update.message.reply_text(f"Wallet set: {wallet}")
     except Exception as e:
         logger.error(f"Error en set_wallet para usuario {user_id}: {e}", exc_info=True)
@@ -135,11 +170,17 @@ async def add_token_start(
         f"Comando /addtoken (inicio conversación) recibido de usuario {user_id} con args: {context.args}"
     )
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Uso: /addtoken <contract_address>")
+    if len(context.args) not in (1, 2):
+        await update.message.reply_text(
+            f"Uso: /addtoken <contract_address> [red]\n{chain_usage()}"
+        )
         return ConversationHandler.END
 
     token_address = context.args[0].lower()
+    chain = parse_chain_arg(context.args, 1)
+    if chain is None:
+        await update.message.reply_text(f"❌ Red desconocida o no vigilada. {chain_usage()}")
+        return ConversationHandler.END
 
     if not ERC20_ADDRESS_PATTERN.match(token_address):
         await update.message.reply_text(
@@ -149,7 +190,9 @@ async def add_token_start(
 
     try:
         async with AsyncSessionLocal() as session:
-            existing_token = await session.get(UserToken, (user_id, token_address))
+            existing_token = await session.get(
+                UserToken, (user_id, chain, token_address)
+            )
             if existing_token:
                 display_symbol = (
                     existing_token.token_symbol
@@ -164,21 +207,23 @@ async def add_token_start(
             try:
                 # Pasar la wallet_address del usuario a la función
                 metadata = await get_token_metadata(
-                    user.wallet_address, token_address, client_session
+                    user.wallet_address, token_address, client_session, chain
                 )
-                if metadata and metadata.get("symbol"):
-                    token_symbol = metadata["symbol"]
+                if metadata and metadata.symbol:
+                    token_symbol = metadata.symbol
                     logger.debug(
                         f"Metadatos del token {token_address} obtenidos: {metadata}. Símbolo: {token_symbol}"
                     )
 
                     new_user_token = UserToken(
                         user_id=user_id,
+                        chain=chain,
                         token_address=token_address,
                         token_symbol=token_symbol,
                     )
                     session.add(new_user_token)
                     await session.commit()
+                    wallet_index.add_token(user_id, chain, token_address)
                     logger.info(
                         f"Token {token_symbol} ({token_address}) añadido para monitorización por {user_id}."
                     )
@@ -191,6 +236,7 @@ async def add_token_start(
                         f"No se pudieron obtener metadatos para {token_address}. Pidiendo símbolo personalizado."
                     )
                     context.user_data["add_token_address"] = token_address
+                    context.user_data["add_token_chain"] = chain
                     await update.message.reply_text(
                         "⚠️ No se pudo encontrar el símbolo para el token. \n\n"
                         "Por favor, introduce un nombre personalizado para este token (máx. 10 caracteres) o envía /cancel para cancelar."
@@ -220,6 +266,7 @@ async def add_token_start(
 async def add_token_custom_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     token_address = context.user_data.get("add_token_address")
+    chain = context.user_data.get("add_token_chain", DEFAULT_CHAIN)
     custom_symbol = update.message.text
 
     logger.info(
@@ -242,11 +289,13 @@ async def add_token_custom_symbol(update: Update, context: ContextTypes.DEFAULT_
         async with AsyncSessionLocal() as session:
             new_user_token = UserToken(
                 user_id=user_id,
+                chain=chain,
                 token_address=token_address,
                 token_symbol=custom_symbol.upper(),
             )
             session.add(new_user_token)
             await session.commit()
+            wallet_index.add_token(user_id, chain, token_address)
             logger.info(
                 f"Token {custom_symbol.upper()} ({token_address}) añadido para monitorización por {user_id}."
             )
@@ -263,8 +312,8 @@ async def add_token_custom_symbol(update: Update, context: ContextTypes.DEFAULT_
         )
     finally:
         # Limpiar user_data
-        if "add_token_address" in context.user_data:
-            del context.user_data["add_token_address"]
+        context.user_data.pop("add_token_address", None)
+        context.user_data.pop("add_token_chain", None)
 
     return ConversationHandler.END
 
@@ -274,8 +323,8 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Usuario {user_id} ha cancelado una operación.")
 
     # Limpieza genérica de datos de conversación
-    if "add_token_address" in context.user_data:
-        del context.user_data["add_token_address"]
+    context.user_data.pop("add_token_address", None)
+    context.user_data.pop("add_token_chain", None)
 
     await update.message.reply_text("Operación cancelada.")
     return ConversationHandler.END
@@ -292,7 +341,7 @@ async def remove_token_start(
 
     if not context.args:
         await update.message.reply_text(
-            "Uso: /removetoken <contract_address> o /removetoken all"
+            f"Uso: /removetoken <contract_address> [red] o /removetoken all\n{chain_usage()}"
         )
         return ConversationHandler.END
 
@@ -317,6 +366,11 @@ async def remove_token_start(
 
     # Lógica para eliminar un solo token
     token_address = arg
+    # Se pueden quitar tokens de redes que ya no se sondean
+    chain = parse_chain_arg(context.args, 1, monitored_only=False)
+    if chain is None:
+        await update.message.reply_text(f"❌ Red desconocida. {chain_usage()}")
+        return ConversationHandler.END
     if not ERC20_ADDRESS_PATTERN.match(token_address):
         await update.message.reply_text(
             "❌ Dirección de contrato inválida. Asegúrate de que sea una dirección Ethereum/Polygon ERC-20 válida (ej. 0x...)."
@@ -325,11 +379,14 @@ async def remove_token_start(
 
     try:
         async with AsyncSessionLocal() as session:
-            token_to_delete = await session.get(UserToken, (user_id, token_address))
+            token_to_delete = await session.get(
+                UserToken, (user_id, chain, token_address)
+            )
             if token_to_delete:
                 token_symbol = token_to_delete.token_symbol or token_address
                 await session.delete(token_to_delete)
                 await session.commit()
+                wallet_index.remove_token(user_id, chain, token_address)
                 logger.info(
                     f"Token {token_symbol} ({token_address}) eliminado para el usuario {user_id}."
                 )
@@ -378,6 +435,7 @@ async def remove_all_tokens_confirm(update: Update, context: ContextTypes.DEFAUL
                 await session.delete(token)
 
             await session.commit()
+            wallet_index.remove_user_tokens(user_id)
             logger.info(
                 f"Todos los tokens han sido eliminados para el usuario {user_id}."
             )
@@ -410,8 +468,11 @@ async def stats(
     try:
         token_addresses_to_monitor = set()
         async with AsyncSessionLocal() as session:
+            # Los balances salen de Moralis en la cadena por defecto
             tracked_tokens_results = await session.execute(
-                select(UserToken.token_address).where(UserToken.user_id == user_id)
+                select(UserToken.token_address).where(
+                    UserToken.user_id == user_id, UserToken.chain == DEFAULT_CHAIN
+                )
             )
             token_addresses_to_monitor = set(tracked_tokens_results.scalars().all())
             logger.debug(
@@ -425,16 +486,16 @@ async def stats(
             )
             return
 
-        # Ejecutar solo la llamada a get_wallet_token_balances
-        logger.debug(
-            f"Iniciando llamada a Moralis para obtener balances para {user_id}..."
+        # Balances desde la caché del portfolio (solo bloquea si la wallet no está cacheada)
+        logger.debug(f"Obteniendo portfolio para {user_id}...")
+        portfolio = await get_portfolio(
+            wallet_address, token_addresses_to_monitor, client_session
         )
-        token_balances = await get_wallet_token_balances(wallet_address, client_session)
         logger.debug(
-            f"Llamada a Moralis get_wallet_token_balances completada para {user_id}."
+            f"Portfolio obtenido para {user_id} (stale={portfolio.stale})."
         )
 
-        if not token_balances:
+        if not portfolio.balances:
             logger.info(
                 f"No se encontraron balances de tokens para la wallet {wallet_address} de {user_id}."
             )
@@ -443,43 +504,11 @@ async def stats(
             )
             return
 
-        summary_lines = []
-        total_net_worth_usd = Decimal(0)  # Initialize total net worth
-
-        for token in token_balances:
-            token_address = token.get("token_address")
-            if token_address not in token_addresses_to_monitor:
-                continue
-
-            balance_raw = token.get("balance", "0")
-            decimals = token.get("decimals", 18)
-            symbol = token.get("symbol", "N/A")
-            usd_value = token.get("usd_value", 0)  # Get USD value from the response
-
-            try:
-                balance_decimal = Decimal(balance_raw) / (10**decimals)
-                formatted_balance = f"{balance_decimal:.8f}".rstrip("0").rstrip(".")
-            except Exception:
-                formatted_balance = "Error"
-                logger.error(
-                    f"Error formateando balance {balance_raw} para token {symbol} ({decimals} decs) para {user_id}",
-                    exc_info=True,
-                )
-
-            escaped_symbol = escape_md2(symbol)
-            escaped_balance = escape_md2(formatted_balance)
-
-            summary_lines.append(f"• {escaped_symbol}: {escaped_balance}")
-
-            # Add to total net worth only for monitored tokens
-            try:
-                total_net_worth_usd += Decimal(str(usd_value))
-            except Exception as e:
-                logger.error(
-                    f"Error sumando usd_value para token {symbol}: {e}", exc_info=True
-                )
-
-        non_zero_balances = [line for line in summary_lines if not line.endswith(": 0")]
+        non_zero_balances = [
+            f"• {escape_md2(token.symbol)}: {escape_md2(token.formatted_balance)}"
+            for token in portfolio.balances
+            if token.formatted_balance != "0"
+        ]
 
         if not non_zero_balances:
             logger.info(
@@ -498,7 +527,7 @@ async def stats(
         # Añadir el valor neto total calculado localmente
         # NOTA: Este valor es solo para los tokens monitorizados.
         try:
-            formatted_net_worth = f"{total_net_worth_usd:,.2f}"
+            formatted_net_worth = f"{portfolio.total_usd:,.2f}"
             msg += f"\n\n*Valor Total Estimado \\(USD\\) \\(Solo monitorizados\\):* ${escape_md2(formatted_net_worth)}"
             logger.debug(
                 f"Valor neto formateado para {user_id}: ${formatted_net_worth}"
@@ -509,9 +538,18 @@ async def stats(
                 exc_info=True,
             )
 
+        if portfolio.degraded:
+            msg += f"\n\n_{escape_md2(format_stale_note(portfolio.fetched_at))}_"
+
         await update.message.reply_markdown_v2(msg)
         logger.info(f"Comando /stats ejecutado con éxito para usuario {user_id}.")
 
+    except CircuitOpenError as e:
+        logger.info(f"/stats de {user_id} sin datos en caché: {e}")
+        await update.message.reply_text(
+            "⚠️ Moralis no responde ahora mismo y no hay balances guardados de tu wallet. "
+            "Inténtalo de nuevo en unos minutos."
+        )
     except Exception as e:
         logger.error(
             f"Error general en stats para usuario {user_id}: {e}", exc_info=True
@@ -530,21 +568,32 @@ async def check_deposits(
     logger.info(f"Comando /check recibido de usuario {user_id}")
     await update.message.reply_text("Buscando nuevos depósitos...")
 
+    if settings.process_role == "bot":
+        # La comprobación la hace el proceso sondeador, que envía el resultado
+        await workqueue.enqueue(workqueue.TOPIC_CHECK, {"user_id": user_id})
+        return
+
     try:
         # Llamada al servicio centralizado
-        new_deposits = await check_and_process_deposits(user_id, client_session)
+        result = await check_and_process_all_chains(user_id, client_session)
 
-        if new_deposits:
+        # Con confirmaciones activas el aviso puede esperar a confirm_pending
+        send_deposits = (
+            bool(result.deposits) and not result.cached and notifies_on_detection()
+        )
+        if send_deposits:
             logger.info(
-                f"Enviando notificaciones para /check de {user_id}: {len(new_deposits)}"
+                f"Enviando notificaciones para /check de {user_id}: {len(result.deposits)}"
             )
-            for d in new_deposits:
+            for d in result.deposits:
                 msg = format_deposit_msg(d)
                 await update.message.reply_markdown_v2(msg)
         else:
-            logger.info(f"No hay depósitos nuevos para /check de {user_id}.")
+            logger.info(f"Sin depósitos que avisar en /check de {user_id}.")
+        # Con cadenas sin comprobar se avisa aunque otras hayan traído depósitos
+        if not send_deposits or result.degraded:
             await update.message.reply_text(
-                "No hay depósitos nuevos de los tokens monitorizados."
+                format_check_summary(result, settings.check_cooldown)
             )
 
     except Exception as e:
@@ -564,6 +613,15 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
         async with AsyncSessionLocal() as session:
             async with session.begin():
                 await session.execute(delete(LastTx).where(LastTx.user_id == user_id))
+        # Sin esto, un /check dentro del cooldown repetiría el resultado anterior
+        if settings.process_role == "bot":
+            # El cooldown vive en el sondeador; por la misma cola llega antes que el /check
+            await workqueue.enqueue(
+                workqueue.TOPIC_CHECK, {"user_id": user_id, "reset": True}
+            )
+        else:
+            reset_check_cooldown(user_id)
+        await wallet_index.refresh_user(user_id)
         logger.info(f"Storage reseteado para {user_id}.")
         await update.message.reply_text(
             "🔄 Storage reseteado\n"
@@ -613,23 +671,24 @@ async def tokens_command(
     try:
         async with AsyncSessionLocal() as session:
             tracked_tokens_results = await session.execute(
-                select(UserToken.token_address, UserToken.token_symbol).where(
-                    UserToken.user_id == user_id
-                )
+                select(
+                    UserToken.token_address, UserToken.token_symbol, UserToken.chain
+                ).where(UserToken.user_id == user_id)
             )
             tracked_tokens_data = (
                 tracked_tokens_results.all()
-            )  # Fetch as list of (token_address, token_symbol) tuples
+            )  # Fetch as list of (token_address, token_symbol, chain) tuples
             logger.debug(f"Tokens monitorizados por {user_id}: {tracked_tokens_data}")
 
             if tracked_tokens_data:
                 token_list_msg = "Tokens monitorizados:\n"
-                for token_address, token_symbol in tracked_tokens_data:
+                for token_address, token_symbol, chain in tracked_tokens_data:
                     display_symbol = token_symbol if token_symbol else "UNKNOWN"
                     escaped_display_symbol = escape_md2(display_symbol)
                     escaped_token_address = escape_md2(token_address)
                     token_list_msg += (
-                        f"\\- *{escaped_display_symbol}*: `{escaped_token_address}`\n"
+                        f"\\- *{escaped_display_symbol}* \\({escape_md2(chain)}\\): "
+                        f"`{escaped_token_address}`\n"
                     )
                 await update.message.reply_markdown_v2(token_list_msg)
                 logger.info(
@@ -649,6 +708,65 @@ async def tokens_command(
         )
 
 
+@require_admin
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profile [ciclos] [cprofile|sample]: perfila los próximos ciclos de sondeo.
+    Sin argumentos muestra el estado y los últimos resultados.
+    """
+    profiler = profiling.profiler
+    if not context.args:
+        if profiler.armed:
+            status = (
+                f"Perfilado {profiler.mode} en curso: {profiler.cycles_done} ciclos "
+                f"hechos, {profiler.cycles_left} pendientes."
+            )
+        else:
+            status = "No hay perfilado en curso."
+        if profiler.last_results:
+            status += "\nÚltimos resultados:\n" + "\n".join(profiler.last_results)
+        await update.message.reply_text(status)
+        return
+
+    if not profiler.runs_cycles:
+        await update.message.reply_text(
+            "Este proceso no ejecuta ciclos de sondeo (process_role="
+            f"{settings.process_role} o webhook del dashboard), así que el perfilado "
+            "no terminaría nunca. /profile solo funciona con process_role=all."
+        )
+        return
+
+    try:
+        cycles = int(context.args[0])
+        mode = context.args[1] if len(context.args) > 1 else "cprofile"
+        profiler.request(cycles, mode)
+    except (ValueError, RuntimeError) as e:
+        await update.message.reply_text(
+            f"No se pudo armar el perfilado: {e}\n"
+            f"Uso: /profile [ciclos] [{'|'.join(profiling.PROFILE_MODES)}]"
+        )
+        return
+    logger.info(f"Perfilado pedido por {update.effective_user.id}: {cycles} ({mode})")
+    await update.message.reply_text(
+        f"Perfilado {mode} armado para los próximos {cycles} ciclos. "
+        "Usa /profile para ver el estado."
+    )
+
+
+@require_admin
+async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/tasks: vuelca las tareas asyncio con su pila y mide el retraso del loop."""
+    path, count = profiling.dump_tasks()
+    lag = await profiling.measure_loop_lag()
+    msg = f"{count} tareas volcadas en {path}\nRetraso del event loop: {lag * 1000:.1f} ms"
+    if profiling.watchdog is not None:
+        msg += (
+            f"\nMáximo desde el arranque: {profiling.watchdog.max_lag * 1000:.1f} ms, "
+            f"bloqueos: {profiling.watchdog.stalls}"
+        )
+    await update.message.reply_text(msg)
+
+
 def get_handlers(client_session: aiohttp.ClientSession):
     add_token_handler = ConversationHandler(
         entry_points=[
@@ -687,6 +805,9 @@ def get_handlers(client_session: aiohttp.ClientSession):
         CommandHandler("check", partial(check_deposits, client_session=client_session)),
         CommandHandler("stats", partial(stats, client_session=client_session)),
         CommandHandler("reset", reset),
+        # Comandos de admin: fuera de BOT_COMMANDS para no mostrarlos en el menú
+        CommandHandler("profile", profile_command),
+        CommandHandler("tasks", tasks_command),
     ]
 
 
@@ -1,12 +1,39 @@
 import aiohttp
 import asyncio
+import time
+from functools import partial
+from typing import List, Optional
 from telegram.ext import Application
 from telegram import Bot, BotCommand
 from src.bot.handlers import get_handlers, BOT_COMMANDS
+from src.bot.webhook import build_application
 from src.config.settings import settings
-from src.models import engine, Base, User, AsyncSessionLocal
-from src.services import check_and_process_deposits  # Importar el nuevo servicio
-from src.utils.format import format_deposit_msg
+from src.models import engine, Base, UserToken, AsyncSessionLocal, upgrade_schema
+from src.services import (  # Importar el nuevo servicio
+    check_and_process_all_chains,
+    check_deposits_once,
+    notifies_on_detection,
+    recently_checked,
+    reset_check_cooldown,
+)
+from src.confirmations import confirm_pending
+from src.chains import DEFAULT_CHAIN, get_chain
+from src import leases, metrics, profiling, tracing, workqueue
+from src.scheduler import (
+    PollScheduler,
+    SlotClock,
+    abandoned_slots,
+    claim_slot,
+    finish_slot,
+    renew_slot,
+    slot_for,
+)
+from src.walletindex import wallet_index
+from src.watcher.base import WatcherBackend, get_backend
+from src.watcher.scanner import BlockScanner
+from src.utils.circuitbreaker import CircuitOpenError
+from src.utils.http import create_client_session
+from src.utils.format import format_check_summary, format_deposit_msg, format_dropped_msg
 from sqlalchemy import select
 from src.config.logger_config import logger
 
@@ -15,91 +42,497 @@ async def init_db():
     logger.info("Inicializando la base de datos...")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
     logger.info("Base de datos inicializada.")
 
 
+async def notify_deposits(bot: Bot, user_id: int, new_deposits: list):
+    logger.info(f"Enviando {len(new_deposits)} notificaciones para {user_id}")
+    for d in new_deposits:
+        msg = format_deposit_msg(d)
+        await send_notification(bot, user_id, msg)
+
+
+async def send_notification(
+    bot: Bot, user_id: int, text: str, parse_mode: Optional[str] = "MarkdownV2"
+):
+    try:
+        await bot.send_message(chat_id=user_id, text=text, parse_mode=parse_mode)
+    except Exception:
+        metrics.NOTIFICATIONS.labels(result="failed").inc()
+        raise
+    metrics.NOTIFICATIONS.labels(result="sent").inc()
+
+
+async def run_poll_cycle(
+    bot: Bot,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+    slot: Optional[int] = None,
+    slots: int = 1,
+):
+    """
+    Un ciclo de sondeo por usuario: comprueba a todos los usuarios que vigilan
+    tokens en la cadena (o solo a los de la franja `slot`) y notifica los
+    depósitos nuevos. Los errores de cada usuario se registran sin cortar el
+    ciclo.
+    """
+    all_user_ids = []
+    async with AsyncSessionLocal() as session:
+        users_result = await session.execute(
+            select(UserToken.user_id).where(UserToken.chain == chain).distinct()
+        )
+        all_user_ids = users_result.scalars().all()
+    if slot is not None:
+        all_user_ids = [u for u in all_user_ids if slot_for(u, slots) == slot]
+    logger.debug(f"Usuarios encontrados para sondeo en {chain}: {len(all_user_ids)}")
+
+    backend = get_backend(chain=chain)
+    with tracing.cycle_report(chain):
+        for user_id in all_user_ids:
+            # Con la fuente caída el resto del ciclo fallaría igual: se salta
+            if not backend.available():
+                logger.warning(
+                    f"{backend.name} no responde: se salta el sondeo de {chain}."
+                )
+                break
+            await poll_user(bot, user_id, client_session, chain)
+
+
+async def poll_user(
+    bot: Bot, user_id: int, client_session: aiohttp.ClientSession, chain: str
+) -> bool:
+    """
+    Comprueba a un usuario y notifica sus depósitos nuevos. Devuelve si los
+    había; los errores se registran y cuentan como comprobación vacía.
+    """
+    if recently_checked(user_id):
+        logger.debug(f"Usuario {user_id} comprobado con /check hace poco, se salta ({chain})")
+        return False
+    logger.debug(f"Procesando usuario {user_id} ({chain})")
+
+    try:
+        with tracing.trace_user(user_id, chain):
+            # Llama al servicio centralizado para hacer todo el trabajo
+            new_deposits, shared = await check_deposits_once(
+                user_id, client_session, chain
+            )
+            if shared:
+                # Se ha unido a un /check en curso: los avisos los envía él
+                return bool(new_deposits)
+
+            # La única responsabilidad que queda es notificar
+            if new_deposits:
+                # Con confirmaciones activas el aviso puede esperar a confirm_pending
+                if notifies_on_detection():
+                    with tracing.span("notify"):
+                        await notify_deposits(bot, user_id, new_deposits)
+                return True
+            logger.info(f"No hay transacciones nuevas para {user_id}")
+
+    except CircuitOpenError as e:
+        logger.debug(f"Usuario {user_id} sin comprobar ({chain}): {e}")
+    except Exception as e:
+        logger.error(
+            f"ERROR en polling_job para user {user_id}: {e}",
+            exc_info=True,
+        )
+    return False
+
+
+async def run_slot(
+    bot: Bot,
+    client_session: aiohttp.ClientSession,
+    chain: str,
+    cycle: int,
+    slot: int,
+    slots: int,
+    owner: Optional[str] = None,
+) -> bool:
+    """
+    Reclama la franja del ciclo y, si la consigue, comprueba a sus usuarios
+    renovando el lease mientras tanto. Devuelve si este proceso la ha hecho.
+    """
+    if not await claim_slot(chain, slot, cycle, owner):
+        logger.debug(f"Franja {slot} del ciclo {cycle} ({chain}) ya reclamada.")
+        return False
+    logger.info(f"Ejecutando sondeo automático ({chain}, franja {slot}/{slots})...")
+    async with leases.heartbeat(
+        lambda: renew_slot(chain, slot, cycle, owner), f"{chain}:{slot}"
+    ):
+        with profiling.profiler.cycle():
+            await run_poll_cycle(bot, client_session, chain, slot, slots)
+    await finish_slot(chain, slot, cycle, owner)
+    return True
+
+
 async def polling_job(
-    bot: Bot, poll_interval: int, client_session: aiohttp.ClientSession
+    bot: Bot,
+    poll_interval: int,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
 ):
-    """Tarea en segundo plano para el sondeo periódico de depósitos."""
+    """
+    Tarea en segundo plano para el sondeo periódico de depósitos de una cadena.
+    Se lanza una por cadena: los ciclos corren en paralelo y comparten el
+    límite de peticiones a Moralis. Cada ciclo se reparte en franjas
+    (settings.poll_slots); una franja solo se comprueba si este proceso la
+    reclama en poll_lease, así varios procesos pueden sondear a la vez. Tras
+    cada franja se retoman las que otro proceso dejó a medias al morir.
+    """
+    slots = max(1, settings.poll_slots)
+    clock = SlotClock(poll_interval, slots, settings.poll_jitter)
     while True:
-        logger.info("Ejecutando sondeo automático...")
+        cycle, slot, at = clock.next()
+        await asyncio.sleep(max(0.0, at - time.time()))
+        cycle_started = time.perf_counter()
         try:
-            all_users = []
-            async with AsyncSessionLocal() as session:
-                users_result = await session.execute(select(User))
-                all_users = users_result.scalars().all()
-            logger.debug(f"Usuarios encontrados para sondeo: {len(all_users)}")
+            if not await run_slot(bot, client_session, chain, cycle, slot, slots):
+                continue
+            for abandoned in await abandoned_slots(chain, cycle):
+                logger.warning(f"Retomando la franja {abandoned} abandonada ({chain}).")
+                await run_slot(bot, client_session, chain, cycle, abandoned, slots)
+        except Exception as e:
+            logger.error(f"ERROR general en polling_job ({chain}): {e}", exc_info=True)
 
-            for user_row in all_users:
-                user_id = user_row.user_id
-                logger.debug(f"Procesando usuario {user_id}")
+        metrics.observe_poll_cycle(
+            chain, "per_user", time.perf_counter() - cycle_started, poll_interval / slots
+        )
 
+
+async def poll_due_users(
+    bot: Bot,
+    scheduler: PollScheduler,
+    due: List[int],
+    client_session: aiohttp.ClientSession,
+    chain: str,
+    backend: WatcherBackend,
+):
+    """
+    Comprueba a los usuarios vencidos y los reprograma. Si la fuente cae a
+    mitad de la tanda, el usuario en curso y los que faltan vuelven a la cola
+    con su vencimiento intacto: sin comprobar no cuentan como vacíos.
+    """
+    for i, user_id in enumerate(due):
+        found = await poll_user(bot, user_id, client_session, chain)
+        if not backend.available():
+            logger.warning(
+                f"{backend.name} no responde: {len(due) - i} usuarios de {chain} esperan."
+            )
+            scheduler.requeue(due[i:])
+            return
+        scheduler.record(user_id, found)
+
+
+async def adaptive_polling_job(
+    bot: Bot,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+    scheduler: Optional[PollScheduler] = None,
+):
+    """
+    Sondeo con intervalo propio por usuario (poll_mode="adaptive"): duerme hasta
+    el siguiente vencimiento, comprueba solo a los usuarios vencidos y los
+    reprograma según hayan tenido depósitos o no. El planificador vive en
+    memoria, así que solo lo ejecuta el proceso que tiene el lease de la cadena.
+    """
+    lease_name = f"adaptive:{chain}"
+    if scheduler is None:
+        scheduler = PollScheduler(chain)
+    backend = get_backend(chain=chain)
+    while True:
+        try:
+            if not await leases.acquire_lease(lease_name):
+                # Al recuperar el lease se recargan las fechas que dejó el otro proceso
+                scheduler = PollScheduler(chain)
+                await asyncio.sleep(settings.lease_ttl / 3)
+                continue
+            if scheduler.needs_refresh():
+                await scheduler.refresh()
+            # Con la fuente caída los vencidos esperan a que vuelva, sin reprogramarse
+            due = scheduler.pop_due() if backend.available() else []
+            if due:
+                cycle_started = time.perf_counter()
+                async with leases.heartbeat(
+                    lambda: leases.acquire_lease(lease_name), lease_name
+                ):
+                    with profiling.profiler.cycle(), tracing.cycle_report(chain):
+                        await poll_due_users(
+                            bot, scheduler, due, client_session, chain, backend
+                        )
+                await scheduler.flush()
+                metrics.observe_poll_cycle(
+                    chain,
+                    "adaptive",
+                    time.perf_counter() - cycle_started,
+                    settings.poll_min_interval,
+                )
+        except Exception as e:
+            logger.error(
+                f"ERROR general en adaptive_polling_job ({chain}): {e}", exc_info=True
+            )
+
+        wait = scheduler.seconds_until_next()
+        # Se despierta a tiempo de renovar el lease
+        limit = min(settings.poll_refresh_interval, settings.lease_ttl / 3)
+        if wait is None or wait > limit or not backend.available():
+            wait = limit
+        await asyncio.sleep(wait)
+
+
+async def scanner_job(
+    bot: Bot,
+    scanner_interval: int,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+):
+    """
+    Tarea en segundo plano del modo escáner: una pasada por bloques nuevos para
+    todos. Con varios procesos solo escanea el que tiene el lease de la cadena.
+    """
+    lease_name = f"scanner:{chain}"
+    scanner = BlockScanner(name=chain)
+    while True:
+        cycle_started = time.perf_counter()
+        try:
+            if not await leases.acquire_lease(lease_name):
+                await asyncio.sleep(min(scanner_interval, settings.lease_ttl / 3))
+                continue
+            async with leases.heartbeat(
+                lambda: leases.acquire_lease(lease_name), lease_name
+            ):
+                with profiling.profiler.cycle():
+                    new_by_user = await scanner.run_cycle(client_session)
+            if not notifies_on_detection():
+                new_by_user = {}
+            for user_id, new_deposits in new_by_user.items():
                 try:
-                    # Llama al servicio centralizado para hacer todo el trabajo
-                    new_deposits = await check_and_process_deposits(
-                        user_id, client_session
+                    await notify_deposits(bot, user_id, new_deposits)
+                except Exception as e:
+                    logger.error(
+                        f"ERROR notificando a user {user_id}: {e}", exc_info=True
                     )
+        except Exception as e:
+            logger.error(f"ERROR general en scanner_job ({chain}): {e}", exc_info=True)
+
+        metrics.observe_poll_cycle(
+            chain, "scanner", time.perf_counter() - cycle_started, scanner_interval
+        )
+        await asyncio.sleep(scanner_interval)
 
-                    # La única responsabilidad que queda es notificar
-                    if new_deposits:
-                        logger.info(
-                            f"Enviando {len(new_deposits)} notificaciones para {user_id}"
-                        )
-                        for d in new_deposits:
-                            msg = format_deposit_msg(d)
-                            await bot.send_message(
-                                chat_id=user_id, text=msg, parse_mode="MarkdownV2"
-                            )
-                    else:
-                        logger.info(f"No hay transacciones nuevas para {user_id}")
 
+async def confirmation_job(
+    bot: Bot,
+    confirmation_interval: int,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+):
+    """
+    Tarea en segundo plano que confirma (o descarta tras un reorg) los depósitos
+    pendientes y envía los avisos correspondientes.
+    """
+    while True:
+        try:
+            confirmed, dropped = await confirm_pending(client_session, chain=chain)
+            for user_id, deposits in confirmed.items():
+                try:
+                    await notify_deposits(bot, user_id, deposits)
                 except Exception as e:
                     logger.error(
-                        f"ERROR en polling_job para user {user_id}: {e}",
-                        exc_info=True,
+                        f"ERROR notificando a user {user_id}: {e}", exc_info=True
                     )
+            # Solo hay que retractarse si ya se avisó al detectar
+            if settings.notify_on == "both":
+                for user_id, deposits in dropped.items():
+                    try:
+                        for d in deposits:
+                            await send_notification(bot, user_id, format_dropped_msg(d))
+                    except Exception as e:
+                        logger.error(
+                            f"ERROR notificando a user {user_id}: {e}", exc_info=True
+                        )
+        except CircuitOpenError as e:
+            logger.warning(f"Confirmaciones de {chain} en espera: {e}")
+        except Exception as e:
+            logger.error(
+                f"ERROR general en confirmation_job ({chain}): {e}", exc_info=True
+            )
+
+        await asyncio.sleep(confirmation_interval)
+
 
+async def wallet_index_job(reconcile_interval: int):
+    """
+    Reconcilia periódicamente el índice de wallets en memoria con la BD: recoge
+    los cambios hechos por otros procesos (o que no pasaron por los comandos).
+    """
+    while True:
+        await asyncio.sleep(reconcile_interval)
+        try:
+            await wallet_index.load()
         except Exception as e:
-            logger.error(f"ERROR general en polling_job: {e}", exc_info=True)
+            logger.error(f"ERROR reconciliando el índice de wallets: {e}", exc_info=True)
 
-        await asyncio.sleep(poll_interval)
 
+async def handle_check_request(
+    bot: Bot, client_session: aiohttp.ClientSession, payload: dict
+):
+    """/check (o /reset) encolado por el proceso del bot (process_role="poller")."""
+    user_id = payload["user_id"]
+    if payload.get("reset"):
+        reset_check_cooldown(user_id)
+        return
+    result = await check_and_process_all_chains(user_id, client_session)
+    send_deposits = (
+        bool(result.deposits) and not result.cached and notifies_on_detection()
+    )
+    if send_deposits:
+        await notify_deposits(bot, user_id, result.deposits)
+    if not send_deposits or result.degraded:
+        await send_notification(
+            bot, user_id, format_check_summary(result, settings.check_cooldown), None
+        )
 
-async def main():
-    logger.info("Iniciando Token Tracker Bot...")
-    await init_db()  # Inicializar la base de datos
-    async with aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=30)
-    ) as client_session:
-        app = Application.builder().token(settings.telegram_token).build()
 
-        # Crear una instancia de Bot para el polling_job
-        bot_instance = Bot(settings.telegram_token)
+def start_polling_jobs(bot: Bot, client_session: aiohttp.ClientSession):
+    # Iniciar las tareas de sondeo en segundo plano: una por cadena, en paralelo
+    chains = [get_chain(name).name for name in settings.chains]
+    profiling.profiler.runs_cycles = True
+    for chain in chains:
+        if settings.poll_mode == "scanner":
+            asyncio.create_task(
+                scanner_job(bot, settings.scanner_interval, client_session, chain)
+            )
+        elif settings.poll_mode == "adaptive":
+            asyncio.create_task(adaptive_polling_job(bot, client_session, chain))
+        else:
+            asyncio.create_task(
+                polling_job(bot, settings.poll_interval, client_session, chain)
+            )
+        if settings.confirmation_depth > 0:
+            asyncio.create_task(
+                confirmation_job(
+                    bot, settings.confirmation_interval, client_session, chain
+                )
+            )
+    if settings.poll_mode == "scanner":
+        logger.info(
+            f"Escáner de bloques iniciado para {', '.join(chains)} con intervalo de {settings.scanner_interval} segundos."
+        )
+    elif settings.poll_mode == "adaptive":
+        logger.info(
+            f"Sondeo adaptativo iniciado para {', '.join(chains)}: entre {settings.poll_min_interval} y {settings.poll_max_interval} segundos por usuario."
+        )
+    else:
+        logger.info(
+            f"Tarea de sondeo en segundo plano iniciada para {', '.join(chains)} con intervalo de {settings.poll_interval} segundos en {settings.poll_slots} franjas."
+        )
+    if settings.confirmation_depth > 0:
+        logger.info(
+            f"Confirmación de depósitos activa: {settings.confirmation_depth} bloques."
+        )
+
 
-        for handler in get_handlers(client_session):
-            app.add_handler(handler)
-        logger.info("Handlers del bot cargados.")
+async def start_telegram(client_session: aiohttp.ClientSession) -> Application:
+    # Sin webhook, el updater hace getUpdates; con él los updates llegan al dashboard
+    app = build_application(updater=not settings.telegram_webhook_url)
 
-        await app.initialize()
-        await app.start()
-        logger.info("Telegram bot iniciado (polling para comandos).")
+    for handler in get_handlers(client_session):
+        app.add_handler(handler)
+    logger.info("Handlers del bot cargados.")
 
+    await app.initialize()
+    await app.start()
+    logger.info("Telegram bot iniciado.")
+
+    async def start_updater():
         # Establecer los comandos del bot para el menú de Telegram
         await app.bot.set_my_commands(
             [BotCommand(cmd["command"], cmd["description"]) for cmd in BOT_COMMANDS]
         )
         logger.info("Comandos del bot establecidos en el menú de Telegram.")
+        await app.updater.start_polling()  # Polling Telegram (no blockchain)
+        logger.info("Updater de Telegram iniciado en este proceso (polling para comandos).")
 
-        # Iniciar la tarea de sondeo en segundo plano
-        asyncio.create_task(
-            polling_job(bot_instance, settings.poll_interval, client_session)
-        )
+    async def stop_updater():
+        if app.updater.running:
+            await app.updater.stop()
+
+    if settings.telegram_webhook_url:
         logger.info(
-            f"Tarea de sondeo en segundo plano iniciada con intervalo de {settings.poll_interval} segundos."
+            f"Updates de Telegram por webhook ({settings.telegram_webhook_url}): los atiende el dashboard."
         )
+        return app
+    # Telegram solo admite un getUpdates a la vez: con varios procesos lo
+    # ejecuta el líder y el resto solo sondea
+    election = leases.LeaderElection("telegram-updater", start_updater, stop_updater)
+    asyncio.create_task(election.run())
+    return app
+
+
+async def serve_metrics() -> bool:
+    """Arranca el servidor /metrics del proceso; devuelve si está sirviendo."""
+    if not settings.metrics_port:
+        return False
+    try:
+        await metrics.start_metrics_server(settings.metrics_host, settings.metrics_port)
+    except OSError as e:
+        # Sin métricas el bot sigue funcionando: no se tumba a medio arrancar
+        logger.error(
+            f"No se pudo servir /metrics en {settings.metrics_host}:{settings.metrics_port} "
+            f"({e}). Cada proceso necesita su propio METRICS_PORT (0 lo desactiva)."
+        )
+        return False
+    logger.info(
+        f"Métricas disponibles en http://{settings.metrics_host}:{settings.metrics_port}/metrics"
+    )
+    return True
+
+
+async def main():
+    logger.info(f"Iniciando Token Tracker Bot (rol {settings.process_role})...")
+    await init_db()  # Inicializar la base de datos
+    tracing.configure_tracing()
+    profiling.start_watchdog()
+    if settings.process_role != "bot":
+        # Destinatarios de cada transferencia para el escáner, sin consultar la BD
+        await wallet_index.load()
+        logger.info(f"Índice de wallets cargado: {wallet_index.stats()}")
+        asyncio.create_task(wallet_index_job(settings.wallet_index_reconcile_interval))
+    async with create_client_session(f"bot-{settings.process_role}") as client_session:
+        if settings.process_role == "poller":
+            # Sin Telegram: los avisos se encolan para el proceso del bot
+            bot_instance = workqueue.QueuedBot()
+            start_polling_jobs(bot_instance, client_session)
+            asyncio.create_task(
+                workqueue.consume(
+                    workqueue.TOPIC_CHECK,
+                    partial(handle_check_request, bot_instance, client_session),
+                )
+            )
+            logger.info("Atendiendo las peticiones de /check encoladas por el bot.")
+        else:
+            app = await start_telegram(client_session)
+            if settings.process_role == "bot":
+                # El sondeo corre en otro proceso: aquí solo se envían sus avisos
+                asyncio.create_task(
+                    workqueue.consume(
+                        workqueue.TOPIC_NOTIFY,
+                        lambda m: send_notification(
+                            app.bot, m["chat_id"], m["text"], m["parse_mode"]
+                        ),
+                    )
+                )
+                logger.info("Enviando los avisos encolados por el sondeador.")
+            else:
+                # Crear una instancia de Bot para el polling_job
+                start_polling_jobs(
+                    Bot(settings.telegram_token, base_url=settings.telegram_api_base_url),
+                    client_session,
+                )
+
+        await serve_metrics()
 
-        await app.updater.start_polling()  # Polling Telegram (no blockchain)
         await asyncio.Event().wait()  # Run forever
         logger.info("Bot detenido.")
 
@@ -0,0 +1,132 @@
+# src/bot/webhook.py
+"""
+Recepción de updates de Telegram y su procesamiento concurrente.
+
+`build_application` crea la Application con `PerUserUpdateProcessor`: hasta
+`telegram_concurrent_updates` updates a la vez, pero los de un mismo chat en
+orden de llegada (una conversación no puede adelantarse a sí misma).
+
+Con `telegram_webhook_url` los updates llegan por webhook en lugar de
+getUpdates: `TelegramWebhook` se monta en una app ASGI (el dashboard) y encola
+cada update en la Application, que responde 200 sin esperar a los handlers.
+"""
+import asyncio
+import hmac
+from typing import Any, Awaitable, Dict, Iterable, Optional
+
+import aiohttp
+from starlette.requests import Request
+from starlette.responses import Response
+from telegram import BotCommand, Update
+from telegram.ext import Application, BaseHandler, BaseUpdateProcessor
+
+from src.bot.handlers import BOT_COMMANDS, get_handlers
+from src.config.settings import settings
+from src.config.logger_config import logger
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Procesa updates en paralelo, serializando los de un mismo chat."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # chat -> [lock, updates pendientes]; se borra al quedar libre
+        self._locks: Dict[int, list] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock es FIFO: se respeta el orden de llegada del chat
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def build_application(updater: bool = True) -> Application:
+    builder = (
+        Application.builder()
+        .token(settings.telegram_token)
+        .base_url(settings.telegram_api_base_url)
+        .concurrent_updates(PerUserUpdateProcessor(settings.telegram_concurrent_updates))
+    )
+    if not updater:
+        builder = builder.updater(None)
+    return builder.build()
+
+
+class TelegramWebhook:
+    """
+    Endpoint de webhook de Telegram para una app ASGI. `start` prepara la
+    Application (sin updater) y registra en Telegram la URL y el menú de
+    comandos; `handle` atiende cada POST.
+    """
+
+    def __init__(self, handlers: Optional[Iterable[BaseHandler]] = None):
+        self.app: Optional[Application] = None
+        self._handlers = handlers
+
+    async def start(self, client_session: aiohttp.ClientSession, register: bool = True):
+        self.app = build_application(updater=False)
+        for handler in self._handlers or get_handlers(client_session):
+            self.app.add_handler(handler)
+        await self.app.initialize()
+        await self.app.start()
+        if register:
+            await self.app.bot.set_my_commands(
+                [BotCommand(cmd["command"], cmd["description"]) for cmd in BOT_COMMANDS]
+            )
+            await self.app.bot.set_webhook(
+                settings.telegram_webhook_url,
+                secret_token=settings.telegram_webhook_secret or None,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook de Telegram registrado en {settings.telegram_webhook_url}")
+
+    async def stop(self):
+        if self.app is not None:
+            await self.app.stop()
+            await self.app.shutdown()
+            self.app = None
+
+    async def handle(self, request: Request) -> Response:
+        if self.app is None:
+            return Response(status_code=503)
+        secret = settings.telegram_webhook_secret
+        if secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret
+        ):
+            return Response(status_code=403)
+        try:
+            update = Update.de_json(await request.json(), self.app.bot)
+        except Exception as e:
+            logger.warning(f"Update de Telegram no válido: {e}")
+            return Response(status_code=400)
+        # La Application lo procesa en segundo plano; Telegram solo espera el 200
+        await self.app.update_queue.put(update)
+        return Response(status_code=200)
@@ -0,0 +1,36 @@
+# src/chains.py
+from dataclasses import dataclass
+from typing import Dict
+
+DEFAULT_CHAIN = "polygon"
+
+
+@dataclass(frozen=True)
+class Chain:
+    name: str  # Identificador interno (columna `chain` y `settings.chains`)
+    label: str
+    moralis_id: str  # Valor del parámetro `chain` de la API de Moralis
+    explorer_name: str
+    explorer_url: str
+
+    def tx_url(self, tx_hash: str) -> str:
+        return f"{self.explorer_url}/tx/{tx_hash}"
+
+
+CHAINS: Dict[str, Chain] = {
+    chain.name: chain
+    for chain in (
+        Chain("polygon", "Polygon", "polygon", "Polygonscan", "https://polygonscan.com"),
+        Chain("ethereum", "Ethereum", "eth", "Etherscan", "https://etherscan.io"),
+        Chain("arbitrum", "Arbitrum", "arbitrum", "Arbiscan", "https://arbiscan.io"),
+        Chain("base", "Base", "base", "Basescan", "https://basescan.org"),
+    )
+}
+
+
+def get_chain(name: str) -> Chain:
+    """Devuelve la cadena registrada con ese nombre o lanza ValueError."""
+    try:
+        return CHAINS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Cadena desconocida: {name}") from None
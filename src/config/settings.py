@@ -5,15 +5,97 @@ from pydantic import ConfigDict  # Importar ConfigDict
 
 class Settings(BaseSettings):
     telegram_token: str
+    telegram_api_base_url: str = "https://api.telegram.org/bot"  # Sustituible en tests
+    # Updates de Telegram por webhook (en el dashboard) en vez de getUpdates; vacío = polling
+    telegram_webhook_url: str = ""  # URL pública completa, p. ej. https://bot.example.com/telegram/webhook
+    telegram_webhook_path: str = "/telegram/webhook"
+    telegram_webhook_secret: str = ""  # Se comprueba en X-Telegram-Bot-Api-Secret-Token
+    telegram_concurrent_updates: int = 16  # Updates procesados a la vez (en orden por usuario)
     moralis_api_key: str
     etherscan_api_key: Optional[str] = None
     myst_contracts: list[str] = [
         "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce",  # Proxy actual
         "0x1379e8886a944d2d9d440b3d88df536aea08d9f3",  # viejo por si acaso
     ]
+    chains: list[str] = ["polygon"]  # Cadenas vigiladas (ver src/chains.py)
+    moralis_base_url: str = "https://deep-index.moralis.io/api/v2.2"  # Sustituible en benchmarks
+    json_decoder: str = "auto"  # "auto", "msgspec", "orjson" o "json" (ver src/watcher/decoding.py)
+    moralis_max_concurrency: int = 5  # Peticiones simultáneas a Moralis entre todas las cadenas
+    moralis_circuit_failures: int = 5  # Fallos seguidos que abren el circuito de un endpoint; 0 lo desactiva
+    moralis_circuit_reset: float = 30.0  # Segundos con el circuito abierto antes de probar de nuevo
+    # Cliente HTTP compartido para Moralis y los nodos RPC (src/utils/http.py)
+    http_pool_limit: int = 100  # Conexiones abiertas en total
+    http_pool_limit_per_host: int = 0  # Por host; 0 = moralis_max_concurrency
+    http_keepalive_timeout: float = 30.0  # Segundos que se reutiliza una conexión ociosa
+    http_dns_cache_ttl: int = 300  # Segundos de caché DNS
+    http_connect_timeout: float = 5.0  # Establecer la conexión (incluye TLS)
+    http_read_timeout: float = 20.0  # Máximo entre dos lecturas del socket
+    http_total_timeout: float = 30.0  # Petición completa, incluida la espera de conexión libre
+    watcher_backend: str = "moralis"  # "moralis" o "rpc" (eth_getLogs directo)
+    rpc_url: Optional[str] = None  # Nodo JSON-RPC (obligatorio con watcher_backend="rpc")
+    rpc_urls: dict[str, str] = {}  # Nodo por cadena; `rpc_url` se usa para polygon
+    rpc_max_block_range: int = 2000  # Bloques máximos por eth_getLogs
+    rpc_min_block_range: int = 10  # Por debajo de esto un error de rango es definitivo
+    rpc_batch_size: int = 10  # Peticiones por batch JSON-RPC
+    rpc_lookback_blocks: int = 43200  # ~24h en Polygon para consultas por wallet
+    rpc_max_topic_addresses: int = 100  # Más wallets que esto: se filtra en local
+    # "per_user" (historial por wallet, ciclos fijos), "adaptive" (historial por
+    # wallet con intervalo propio de cada usuario) o "scanner" (bloques)
+    poll_mode: str = "per_user"
+    scanner_interval: int = 30  # Segundos entre pasadas del escáner de bloques
+    scanner_max_blocks: int = 20000  # Bloques máximos por pasada del escáner
+    wallet_index_reconcile_interval: int = 300  # Segundos entre reconciliaciones del índice de wallets con la BD
+    # Bloques necesarios para dar por confirmado un depósito (0 = confirmar al detectar)
+    confirmation_depth: int = 0
+    confirmation_interval: int = 60  # Segundos entre revisiones de depósitos pendientes
+    confirmation_batch_size: int = 100  # Hashes pendientes revisados por lote
+    notify_on: str = "confirmed"  # "confirmed" o "both" (también al detectar)
     poll_interval: int = 86400  # Segundos (1 vez cada 24h para producción)
+    check_cooldown: int = 60  # Segundos en que /check repite el último resultado sin ir a la API
+    # poll_mode="per_user": los usuarios se reparten en franjas a lo largo del intervalo
+    poll_slots: int = 24  # Franjas por intervalo (1 = todos a la vez, como antes)
+    poll_jitter: float = 0.5  # Retraso aleatorio de cada franja, en fracción de su duración
+    poller_id: str = ""  # Identificador del proceso en los leases (vacío = host:pid)
+    lease_ttl: int = 60  # Segundos que dura un lease sin renovar (se renueva cada ttl/3)
+    # "all" (todo en un proceso), "bot" (comandos y envío de avisos) o "poller"
+    # (sondeo y /check); bot y poller se comunican por la tabla work_queue
+    process_role: str = "all"
+    queue_poll_interval: float = 1.0  # Segundos entre consultas a la cola vacía
+    queue_batch_size: int = 50  # Mensajes reclamados de una vez
+    queue_visibility_timeout: int = 120  # Segundos antes de reintentar un mensaje sin confirmar
+    queue_max_attempts: int = 5  # Intentos antes de descartar un mensaje
+    # poll_mode="adaptive": intervalo por usuario entre estos límites
+    poll_min_interval: int = 900  # Tras un depósito se vuelve a mirar a los 15 min
+    poll_max_interval: int = 86400  # Wallets dormidas: como mucho una vez al día
+    poll_backoff_factor: float = 2.0  # Multiplicador tras cada comprobación vacía
+    poll_tier_min_intervals: dict[str, int] = {}  # Mínimo por nivel (poll_schedule.tier)
+    poll_refresh_interval: int = 60  # Segundos entre recargas de usuarios nuevos
     min_amount: float = 0.0  # Alertas > este valor
     sqlalchemy_echo: bool = False  # Controlar el echo de SQLAlchemy en producción
+    database_url: str = "sqlite+aiosqlite:///tx_storage.db"
+    jwt_cache_size: int = 1024  # Tokens JWT verificados que cachea el dashboard
+    user_context_ttl: float = 5.0  # Segundos que el dashboard reutiliza wallet/tokens
+    portfolio_cache_ttl: int = 60  # Segundos que un balance de Moralis se considera fresco
+    portfolio_max_stale: int = 3600  # Segundos que se sirve caducado mientras se refresca
+    dashboard_rate_limit: int = 120  # Peticiones por usuario y ventana (0 = sin límite)
+    dashboard_rate_window: int = 60  # Segundos
+    # Fichero SQLite para compartir los límites entre workers (None = por worker)
+    dashboard_shared_state_path: Optional[str] = None
+    export_chunk_size: int = 1000  # Filas por bloque en la exportación del historial
+    # Bearer exigido en /metrics del dashboard (vacío = solo desde localhost)
+    dashboard_metrics_token: str = ""
+    metrics_host: str = "127.0.0.1"  # Servidor /metrics del bot
+    metrics_port: Optional[int] = 9108  # None o 0 = sin servidor de métricas en el bot
+    trace_top_n: int = 5  # Usuarios más lentos en el resumen de cada ciclo
+    otel_enabled: bool = False  # Exportar también las trazas con OpenTelemetry
+    admin_user_ids: list[int] = []  # Usuarios de Telegram con /profile y /tasks
+    profile_dir: str = "profiles"  # Salida de /profile y /tasks
+    profile_sample_interval: float = 0.005  # Segundos entre muestras del modo "sample"
+    loop_watchdog_interval: float = 0.5  # Segundos entre latidos del vigilante del loop
+    loop_lag_threshold: float = 0.1  # Retraso del loop (s) a partir del que se avisa
+    offload_workers: int = 2  # Hilos para trabajo de CPU fuera del event loop
+    offload_json_bytes: int = 262144  # Respuestas mayores se decodifican en un hilo
+    offload_min_items: int = 500  # Listas mayores se procesan en un hilo
     debug_mode: bool = (
         False  # Nuevo atributo para controlar el modo de depuración de logging
     )
@@ -0,0 +1,127 @@
+# src/confirmations.py
+import aiohttp
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, select, update
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.chains import DEFAULT_CHAIN
+from src.deposits import Deposit, parse_timestamp
+from src.models import AsyncSessionLocal, Transaction
+from src.watcher.base import WatcherBackend, get_backend
+
+DepositsByUser = Dict[int, List[Deposit]]
+
+
+def transaction_to_deposit(tx: Transaction) -> Deposit:
+    """Reconstruye el depósito (el de los watchers) a partir de la fila guardada."""
+    return Deposit(
+        tx_hash=tx.tx_hash,
+        token_address=tx.token_address,
+        token_symbol=tx.token_symbol or "UNKNOWN",
+        amount_raw=int(tx.amount or 0),
+        amount=tx.amount_formatted or tx.amount,
+        timestamp=parse_timestamp(tx.block_timestamp),
+        from_address=tx.from_address,
+        block_number=tx.block_number or 0,
+        chain=tx.chain,
+        status=tx.status,
+    )
+
+
+def _is_deep_enough(block_number: Optional[int], head: int) -> bool:
+    return bool(block_number) and head - block_number + 1 >= settings.confirmation_depth
+
+
+async def confirm_pending(
+    client_session: aiohttp.ClientSession,
+    backend: Optional[WatcherBackend] = None,
+    chain: str = DEFAULT_CHAIN,
+) -> Tuple[DepositsByUser, DepositsByUser]:
+    """
+    Revisa los depósitos "pending" de una cadena sin volver a descargar historiales: solo
+    pregunta por los hashes que, según el bloque guardado, ya deberían tener
+    `confirmation_depth` confirmaciones, y lo hace por lotes.
+
+    - Si la transacción sigue en la cadena con profundidad suficiente, pasa a
+      "confirmed" (se actualiza el bloque si un reorg la ha movido).
+    - Si ya no existe, se borra: un reorg la ha eliminado.
+
+    Devuelve ({user_id: confirmados}, {user_id: descartados}).
+    """
+    backend = backend or get_backend(chain=chain)
+    confirmed: DepositsByUser = {}
+    dropped: DepositsByUser = {}
+    head = await backend.get_block_number(client_session)
+
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            rows = (
+                await session.scalars(
+                    select(Transaction)
+                    .where(
+                        Transaction.chain == chain,
+                        Transaction.status == "pending",
+                        Transaction.id > last_id,
+                    )
+                    .order_by(Transaction.id)
+                    .limit(settings.confirmation_batch_size)
+                )
+            ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        # Las que aún no pueden estar confirmadas no cuestan ninguna petición
+        due = [
+            tx for tx in rows if not tx.block_number or _is_deep_enough(tx.block_number, head)
+        ]
+        if not due:
+            continue
+        # La consulta a la cadena se hace sin ninguna transacción de BD abierta
+        tx_blocks = await backend.get_transaction_blocks(
+            list({tx.tx_hash for tx in due}), client_session
+        )
+
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                for tx in due:
+                    block_number = tx_blocks.get(tx.tx_hash)
+                    if block_number is None:
+                        result = await session.execute(
+                            delete(Transaction).where(
+                                Transaction.id == tx.id, Transaction.status == "pending"
+                            )
+                        )
+                        if result.rowcount:
+                            logger.warning(
+                                f"Depósito {tx.tx_hash} de {tx.user_id} ya no está en la "
+                                f"cadena (bloque {tx.block_number}): descartado."
+                            )
+                            dropped.setdefault(tx.user_id, []).append(
+                                transaction_to_deposit(tx)
+                            )
+                        continue
+                    values = {"block_number": block_number}
+                    if _is_deep_enough(block_number, head):
+                        values["status"] = "confirmed"
+                    result = await session.execute(
+                        update(Transaction)
+                        .where(Transaction.id == tx.id, Transaction.status == "pending")
+                        .values(**values)
+                    )
+                    # rowcount 0: otro proceso ya la ha confirmado o descartado
+                    if result.rowcount and "status" in values:
+                        tx.block_number = block_number
+                        tx.status = "confirmed"
+                        confirmed.setdefault(tx.user_id, []).append(
+                            transaction_to_deposit(tx)
+                        )
+
+    if confirmed or dropped:
+        logger.info(
+            f"Confirmaciones {chain} (cabeza {head}): "
+            f"{sum(len(v) for v in confirmed.values())} confirmados, "
+            f"{sum(len(v) for v in dropped.values())} descartados."
+        )
+    return confirmed, dropped
@@ -0,0 +1,45 @@
+# src/deposits.py
+"""
+Registro compacto de un depósito detectado.
+
+Los watchers lo construyen una sola vez al parsear la respuesta (Moralis o
+JSON-RPC), con los campos ya normalizados, y viaja tal cual por servicios,
+confirmaciones, mensajes y persistencia.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.chains import DEFAULT_CHAIN
+
+
+def parse_timestamp(value: Optional[str]) -> int:
+    """Epoch (s) de un timestamp ISO como los de Moralis ("...T00:00:00.000Z")."""
+    if not value:
+        return 0
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def format_timestamp(epoch: int) -> str:
+    # Mismo formato que devuelve Moralis, para que las comparaciones con LastTx sigan valiendo
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+@dataclass(slots=True)
+class Deposit:
+    tx_hash: str
+    token_address: str  # En minúsculas
+    token_symbol: str
+    amount_raw: int  # Unidades mínimas del token
+    amount: str  # Cantidad formateada para mostrar
+    timestamp: int  # Epoch (s) del bloque
+    from_address: str  # En minúsculas
+    to_address: str = ""  # En minúsculas
+    block_number: int = 0
+    log_index: int = 0
+    chain: str = DEFAULT_CHAIN
+    status: str = "confirmed"
+
+    @property
+    def block_timestamp(self) -> str:
+        return format_timestamp(self.timestamp)
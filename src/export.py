@@ -0,0 +1,119 @@
+# src/export.py
+import csv
+import io
+from typing import AsyncIterator, List, Sequence
+from sqlalchemy import select
+from src.models import AsyncSessionLocal, Transaction
+
+try:  # Parquet es opcional: solo si pyarrow está instalado
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+    pq = None
+
+EXPORT_COLUMNS = [
+    "block_timestamp",
+    "tx_hash",
+    "token_address",
+    "token_symbol",
+    "amount",  # Cantidad en bruto (string) para no perder precisión
+    "from_address",
+    "chain",
+    # "pending" hasta alcanzar confirmation_depth; los descartados por un reorg se borran
+    "status",
+]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+async def iter_transaction_chunks(
+    user_id: int, chunk_size: int
+) -> AsyncIterator[Sequence[tuple]]:
+    """
+    Recorre el historial de depósitos del usuario con un cursor de servidor,
+    devolviendo bloques de como mucho `chunk_size` filas. Nunca materializa
+    el resultado completo en memoria.
+    """
+    query = (
+        select(*(getattr(Transaction, column) for column in EXPORT_COLUMNS))
+        .where(Transaction.user_id == user_id)
+        .order_by(Transaction.block_timestamp, Transaction.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions(chunk_size):
+            yield partition
+
+
+async def stream_csv(user_id: int, chunk_size: int) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in iter_transaction_chunks(user_id, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _DrainableSink(io.RawIOBase):
+    """
+    Destino de escritura para ParquetWriter que permite vaciar lo ya escrito
+    entre row groups, manteniendo `tell()` consistente con el total emitido.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_parquet(user_id: int, chunk_size: int) -> AsyncIterator[bytes]:
+    if not parquet_available():
+        raise RuntimeError("pyarrow no está instalado: exportación Parquet no disponible")
+    schema = pa.schema([(column, pa.string()) for column in EXPORT_COLUMNS])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for rows in iter_transaction_chunks(user_id, chunk_size):
+            columns = list(zip(*rows))
+            # Cada bloque del cursor se escribe como un row group independiente
+            writer.write_table(
+                pa.Table.from_arrays(
+                    [pa.array(column, type=pa.string()) for column in columns],
+                    schema=schema,
+                )
+            )
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
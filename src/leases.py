@@ -0,0 +1,151 @@
+# src/leases.py
+"""
+Coordinación entre varios procesos del bot a través de la BD.
+
+Un lease (tabla `leases`) da a un solo proceso el derecho a hacer algo hasta
+`expires_at`; el dueño lo renueva periódicamente (`heartbeat`) y, si muere,
+otro proceso lo toma al caducar. Sirve para elegir un líder
+(`LeaderElection`, p. ej. el updater de Telegram) y para las tareas que no
+se pueden repartir (escáner de bloques, planificador adaptativo).
+"""
+import asyncio
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.sqlite import insert
+
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.models import AsyncSessionLocal, Lease
+
+
+def poller_id() -> str:
+    return settings.poller_id or f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire_lease(
+    name: str, owner: Optional[str] = None, ttl: Optional[float] = None
+) -> bool:
+    """
+    Toma o renueva el lease. Devuelve False si otro proceso lo tiene vigente.
+    El UPDATE condicional es atómico: de varios procesos compitiendo solo gana uno.
+    """
+    owner = owner or poller_id()
+    now = time.time()
+    expires_at = now + (ttl or settings.lease_ttl)
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(
+                insert(Lease)
+                .values(name=name, owner="", expires_at=0.0)
+                .on_conflict_do_nothing()
+            )
+            result = await session.execute(
+                update(Lease)
+                .where(
+                    Lease.name == name,
+                    or_(Lease.owner == owner, Lease.expires_at < now),
+                )
+                .values(owner=owner, expires_at=expires_at)
+            )
+    return result.rowcount == 1
+
+
+async def release_lease(name: str, owner: Optional[str] = None):
+    """Libera el lease para que otro proceso lo tome sin esperar a que caduque."""
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(
+                update(Lease)
+                .where(Lease.name == name, Lease.owner == (owner or poller_id()))
+                .values(expires_at=0.0)
+            )
+
+
+@asynccontextmanager
+async def heartbeat(
+    renew: Callable[[], Awaitable[bool]], name: str, ttl: Optional[float] = None
+):
+    """Renueva un lease cada ttl/3 mientras dura el bloque."""
+
+    async def beat():
+        while True:
+            await asyncio.sleep((ttl or settings.lease_ttl) / 3)
+            try:
+                if not await renew():
+                    logger.warning(f"Lease {name} perdido: lo ha tomado otro proceso.")
+                    return
+            except Exception as e:
+                logger.warning(f"No se pudo renovar el lease {name}: {e}")
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+class LeaderElection:
+    """
+    Mantiene el lease `name` mientras el proceso viva y avisa de los cambios:
+    `on_elected` al conseguirlo y `on_demoted` al perderlo (p. ej. si la BD no
+    responde a tiempo y otro proceso lo toma).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+        owner: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.name = name
+        self.owner = owner or poller_id()
+        self.ttl = ttl or settings.lease_ttl
+        self.is_leader = False
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+
+    async def step(self):
+        try:
+            held = await acquire_lease(self.name, self.owner, self.ttl)
+        except Exception as e:
+            # Sin BD no se puede saber si el lease sigue siendo nuestro
+            logger.error(f"Error renovando el lease {self.name}: {e}")
+            held = False
+        if held == self.is_leader:
+            return
+        if not held:
+            self.is_leader = False
+            logger.info(f"{self.owner} deja de ser líder de {self.name}.")
+            try:
+                await self._on_demoted()
+            except Exception as e:
+                logger.error(
+                    f"Error al dejar de ser líder de {self.name}: {e}", exc_info=True
+                )
+            return
+        try:
+            await self._on_elected()
+        except Exception as e:
+            # Un líder que no hace su trabajo bloquearía a los demás: se suelta el
+            # lease y se reintenta en el siguiente paso (aquí o en otro proceso)
+            logger.error(f"Error al asumir el liderazgo de {self.name}: {e}", exc_info=True)
+            try:
+                await self._on_demoted()
+                await release_lease(self.name, self.owner)
+            except Exception as e:
+                logger.error(f"Error al soltar el lease {self.name}: {e}")
+            return
+        self.is_leader = True
+        logger.info(f"{self.owner} es ahora líder de {self.name}.")
+
+    async def run(self):
+        while True:
+            await self.step()
+            await asyncio.sleep(self.ttl / 3)
@@ -0,0 +1,390 @@
+# src/metrics.py
+"""
+Métricas en formato de exposición de Prometheus (texto 0.0.4) sin dependencias.
+
+La API imita a `prometheus_client` (`labels(...).inc()/observe()/set()`,
+`time()`), para poder cambiar a la librería sin tocar los puntos de medida.
+Los valores viven en memoria del proceso: con varios workers del dashboard
+cada uno expone los suyos.
+"""
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger("token_tracker_bot")
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Timer:
+    """
+    Context manager (síncrono o asíncrono) que observa la duración en
+    segundos al salir.
+    """
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        registry: Optional["Registry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default_child(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requiere etiquetas: usa .labels()")
+        return self.labels()
+
+    @abstractmethod
+    def _new_child(self): ...
+
+    @abstractmethod
+    def _samples(self) -> List[str]: ...
+
+    @property
+    def exposed_name(self) -> str:
+        return self.name
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.exposed_name} {_escape(self.documentation)}",
+            f"# TYPE {self.exposed_name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("Un contador solo puede crecer")
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @property
+    def exposed_name(self) -> str:
+        return f"{self.name}_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default_child().inc(amount)
+
+    def _samples(self):
+        return [
+            f"{self.exposed_name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in sorted(self._children.items())
+        ]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default_child().set(value)
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in sorted(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        registry: Optional["Registry"] = None,
+    ):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default_child().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default_child().time()
+
+    def _samples(self):
+        lines = []
+        for key, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames + ("le",), key + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Función que actualiza gauges justo antes de cada render (p. ej. estado del pool HTTP)."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Fallo en un colector de métricas: {e}")
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def generate_latest(registry: Registry = REGISTRY) -> bytes:
+    return registry.render().encode("utf-8")
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=generate_latest(),
+        headers={"Content-Type": CONTENT_TYPE_LATEST},
+    )
+
+
+def make_metrics_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    return app
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Sirve `/metrics` en el proceso del bot (que no tiene otro servidor HTTP)."""
+    runner = web.AppRunner(make_metrics_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# --- Métricas de la aplicación ---
+
+MORALIS_REQUEST_SECONDS = Histogram(
+    "moralis_request_seconds",
+    "Latencia de las peticiones HTTP a Moralis por endpoint.",
+    ("endpoint",),
+)
+MORALIS_RESPONSES = Counter(
+    "moralis_responses",
+    "Respuestas de Moralis por endpoint y código HTTP.",
+    ("endpoint", "status"),
+)
+MORALIS_RETRIES = Counter(
+    "moralis_retries",
+    "Reintentos de llamadas a Moralis (tenacity).",
+    ("endpoint",),
+)
+MORALIS_RATE_LIMITED = Counter(
+    "moralis_rate_limited",
+    "Respuestas 429 de Moralis.",
+    ("endpoint",),
+)
+MORALIS_CIRCUIT_STATE = Gauge(
+    "moralis_circuit_state",
+    "Estado del circuit breaker por endpoint de Moralis (0 cerrado, 1 semiabierto, 2 abierto).",
+    ("endpoint",),
+)
+MORALIS_CIRCUIT_REJECTED = Counter(
+    "moralis_circuit_rejected",
+    "Llamadas a Moralis rechazadas sin intentarse por tener el circuito abierto.",
+    ("endpoint",),
+)
+MORALIS_PAGES_PER_WALLET = Histogram(
+    "moralis_pages_per_wallet",
+    "Páginas del historial de Moralis leídas por consulta de wallet.",
+    ("chain",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+DEPOSIT_CHECK_SECONDS = Histogram(
+    "deposit_check_seconds",
+    "Duración de check_and_process_deposits por usuario.",
+    ("chain",),
+)
+DB_TRANSACTION_SECONDS = Histogram(
+    "db_transaction_seconds",
+    "Duración de las transacciones de escritura en la BD.",
+    ("operation",),
+)
+NOTIFICATIONS = Counter(
+    "telegram_notifications",
+    "Notificaciones de Telegram enviadas por resultado.",
+    ("result",),
+)
+POLL_CYCLE_SECONDS = Histogram(
+    "poll_cycle_seconds",
+    "Duración de un ciclo completo de sondeo.",
+    ("chain", "mode"),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400),
+)
+POLL_INTERVAL_SECONDS = Gauge(
+    "poll_interval_seconds",
+    "Intervalo configurado entre ciclos de sondeo.",
+    ("chain", "mode"),
+)
+POLL_CYCLE_UTILIZATION = Gauge(
+    "poll_cycle_utilization_ratio",
+    "Duración del último ciclo dividida por el intervalo (>1: el sondeo no da abasto).",
+    ("chain", "mode"),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Retraso con el que el event loop atiende un temporizador.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls",
+    "Bloqueos del event loop por encima del umbral detectados por el vigilante.",
+)
+WALLET_INDEX_ENTRIES = Gauge(
+    "wallet_index_entries",
+    "Tamaño del índice wallet -> token -> usuarios (users, wallets, pairs).",
+    ("kind",),
+)
+WALLET_INDEX_DRIFT = Counter(
+    "wallet_index_drift",
+    "Wallets del índice en memoria corregidas al reconciliar con la BD.",
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "http_pool_connections",
+    "Conexiones del pool HTTP compartido por estado (in_use, idle) y su límite (limit).",
+    ("pool", "state"),
+)
+HTTP_POOL_WAITERS = Gauge(
+    "http_pool_waiters",
+    "Peticiones esperando una conexión libre del pool HTTP.",
+    ("pool",),
+)
+
+
+def observe_poll_cycle(chain: str, mode: str, duration: float, interval: float):
+    POLL_CYCLE_SECONDS.labels(chain=chain, mode=mode).observe(duration)
+    POLL_INTERVAL_SECONDS.labels(chain=chain, mode=mode).set(interval)
+    if interval > 0:
+        POLL_CYCLE_UTILIZATION.labels(chain=chain, mode=mode).set(duration / interval)
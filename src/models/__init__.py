@@ -1,10 +1,21 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+import os
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    String,
+    ForeignKey,
+    UniqueConstraint,
+    inspect,
+    text,
+)
 from sqlalchemy.orm import (
     relationship,
     declarative_base,
 )
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from src.config.settings import settings  # Importar settings
+from src.chains import DEFAULT_CHAIN
 
 
 Base = declarative_base()
@@ -13,9 +24,9 @@ Base = declarative_base()
 class User(Base):
     __tablename__ = "users"
     user_id = Column(Integer, primary_key=True)
-    wallet_address = Column(String, nullable=False)
-    # Relación con last_tx (multi-user)
-    last_tx = relationship("LastTx", back_populates="user", uselist=False)
+    wallet_address = Column(String, nullable=False, index=True)
+    # Relación con last_tx (multi-user, una fila por cadena)
+    last_txs = relationship("LastTx", back_populates="user")
     # Relación con UserToken para los tokens que el usuario quiere trackear
     tracked_tokens = relationship(
         "UserToken", back_populates="user", cascade="all, delete-orphan"
@@ -29,6 +40,10 @@ class User(Base):
 class UserToken(Base):
     __tablename__ = "user_tokens"
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    # La misma wallet EVM sirve en todas las cadenas; el token es de una cadena concreta
+    chain = Column(
+        String, primary_key=True, default=DEFAULT_CHAIN, server_default=DEFAULT_CHAIN
+    )
     token_address = Column(String, primary_key=True, nullable=False)
     token_symbol = Column(
         String, nullable=True
@@ -37,7 +52,7 @@ class UserToken(Base):
     user = relationship("User", back_populates="tracked_tokens")
 
     __table_args__ = (
-        UniqueConstraint("user_id", "token_address", name="_user_token_uc"),
+        UniqueConstraint("user_id", "chain", "token_address", name="_user_token_uc"),
     )
 
 
@@ -45,6 +60,9 @@ class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    chain = Column(
+        String, nullable=False, default=DEFAULT_CHAIN, server_default=DEFAULT_CHAIN
+    )
     token_address = Column(String, nullable=False)
     token_symbol = Column(String, nullable=True)
     amount = Column(
@@ -53,12 +71,16 @@ class Transaction(Base):
     tx_hash = Column(String, nullable=False)
     block_timestamp = Column(String, nullable=False)
     from_address = Column(String, nullable=False)
+    amount_formatted = Column(String, nullable=True)  # Para notificar sin re-consultar
+    block_number = Column(Integer, nullable=True)
+    # "pending" hasta alcanzar settings.confirmation_depth; las filas previas son confirmadas
+    status = Column(String, nullable=False, server_default="confirmed", index=True)
 
     user = relationship("User", back_populates="transactions")
 
     __table_args__ = (
         UniqueConstraint(
-            "user_id", "tx_hash", "token_address", name="_user_tx_token_uc"
+            "user_id", "chain", "tx_hash", "token_address", name="_user_tx_token_uc"
         ),
     )  # Prevenir duplicados
 
@@ -66,14 +88,163 @@ class Transaction(Base):
 class LastTx(Base):
     __tablename__ = "last_tx"
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    chain = Column(
+        String, primary_key=True, default=DEFAULT_CHAIN, server_default=DEFAULT_CHAIN
+    )
     last_timestamp = Column(String)
-    user = relationship("User", back_populates="last_tx")
+    user = relationship("User", back_populates="last_txs")
+
+
+class ScanState(Base):
+    """Marca de agua del escáner de cada cadena: último bloque procesado."""
+
+    __tablename__ = "scan_state"
+    scanner = Column(String, primary_key=True)
+    last_block = Column(Integer, nullable=False)
+
+
+class PollSchedule(Base):
+    """Próxima comprobación de cada usuario en cada cadena (poll_mode="adaptive")."""
+
+    __tablename__ = "poll_schedule"
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    chain = Column(
+        String, primary_key=True, default=DEFAULT_CHAIN, server_default=DEFAULT_CHAIN
+    )
+    next_check_at = Column(Float, nullable=False)  # Epoch (s)
+    interval = Column(Float, nullable=False)  # Último intervalo aplicado (s)
+    # Mínimo propio del usuario o de su nivel (settings.poll_tier_min_intervals)
+    tier = Column(String, nullable=True)
+    min_interval = Column(Float, nullable=True)
+
+
+class PollLease(Base):
+    """
+    Reparto de las franjas del sondeo entre procesos: una fila por franja con
+    el último ciclo reclamado. Solo el proceso que la reclama comprueba a sus
+    usuarios en ese ciclo.
+    """
+
+    __tablename__ = "poll_lease"
+    chain = Column(String, primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    cycle = Column(Integer, nullable=False)  # floor(epoch / poll_interval)
+    owner = Column(String, nullable=False)
+    claimed_at = Column(Float, nullable=False)
+    # El dueño lo renueva mientras trabaja; caducado y sin terminar, otro lo retoma
+    expires_at = Column(Float, nullable=False, server_default="0")
+    done = Column(Integer, nullable=False, server_default="0")
+
+
+class Lease(Base):
+    """
+    Lease con nombre para tareas que solo debe ejecutar un proceso (p. ej. el
+    updater de Telegram). El dueño lo renueva antes de `expires_at`; si muere,
+    otro proceso lo toma al caducar.
+    """
+
+    __tablename__ = "leases"
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
+
+
+class QueueMessage(Base):
+    """
+    Cola local entre procesos (process_role="bot"/"poller"): peticiones de
+    /check hacia el sondeador y avisos hacia el bot. Ver src/workqueue.py.
+    """
+
+    __tablename__ = "work_queue"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False, index=True)
+    payload = Column(String, nullable=False)  # JSON
+    created_at = Column(Float, nullable=False)
+    # Un consumidor lo reclama hasta visible_at; si no lo confirma, vuelve a la cola
+    visible_at = Column(Float, nullable=False)
+    claimed_by = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, server_default="0")
+
+
+def _rebuild_table(sync_conn, table, existing_columns):
+    """
+    SQLite no permite cambiar la clave primaria con ALTER TABLE: se crea la
+    tabla nueva, se copian las columnas comunes (las nuevas toman su
+    server_default) y se sustituye la antigua.
+    """
+    old_name = f"_old_{table.name}"
+    inspector = inspect(sync_conn)
+    sync_conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+    # Los índices se renombran con la tabla: se liberan sus nombres
+    for index in inspector.get_indexes(old_name):
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    table.create(sync_conn)
+    columns = ", ".join(c.name for c in table.columns if c.name in existing_columns)
+    sync_conn.execute(
+        text(
+            f"INSERT OR IGNORE INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}"
+        )
+    )
+    sync_conn.execute(text(f"DROP TABLE {old_name}"))
+
+
+def _unique_constraints(table):
+    return {
+        frozenset(c.name for c in constraint.columns)
+        for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    }
+
+
+def upgrade_schema(sync_conn):
+    """
+    Migración ligera para BDs existentes: añade las columnas e índices nuevos
+    que `create_all` no crea sobre tablas ya existentes. Solo admite columnas
+    nullable o con server_default; si cambia la clave primaria o alguna
+    restricción UNIQUE (p. ej. al añadir `chain`) la tabla se reconstruye.
+    """
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        primary_key = set(inspector.get_pk_constraint(table.name)["constrained_columns"])
+        unique = {
+            frozenset(uc["column_names"])
+            for uc in inspector.get_unique_constraints(table.name)
+        }
+        if primary_key != {c.name for c in table.primary_key.columns} or (
+            unique != _unique_constraints(table)
+        ):
+            _rebuild_table(sync_conn, table, existing_columns)
+            continue
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=sync_conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            sync_conn.execute(text(ddl))
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 
 # Engine async
 engine = create_async_engine(
-    "sqlite+aiosqlite:///tx_storage.db", echo=settings.sqlalchemy_echo
+    settings.database_url, echo=settings.sqlalchemy_echo
 )  # echo for debug
 AsyncSessionLocal = async_sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
+
+
+def _dispose_engine_in_child():
+    # Un proceso hijo (p. ej. workers de gunicorn con --preload) no debe reutilizar
+    # las conexiones heredadas del padre: se descartan sin cerrarlas.
+    engine.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_engine_in_child)
@@ -0,0 +1,152 @@
+# src/portfolio.py
+import asyncio
+import time
+import aiohttp
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+from src.config.settings import settings
+from src.utils.cache import SWRCache
+from src.utils.circuitbreaker import CircuitOpenError
+from src.utils.offload import maybe_offload
+from src.watcher import moralis
+from src.watcher.moralis import get_wallet_token_balances, get_wallet_net_worth
+from src.config.logger_config import logger
+
+
+@dataclass
+class TokenBalance:
+    token_address: str
+    symbol: str
+    balance: Decimal
+    formatted_balance: str
+    usd_value: Decimal
+
+
+@dataclass
+class Portfolio:
+    wallet_address: str
+    balances: List[TokenBalance] = field(default_factory=list)
+    total_usd: Decimal = Decimal(0)  # Solo tokens monitorizados
+    net_worth_usd: Optional[str] = None  # Toda la wallet, según Moralis
+    fetched_at: float = 0.0
+    stale: bool = False  # True si viene de caché caducada (refresco en curso)
+    degraded: bool = False  # True si viene de caché porque Moralis no responde
+
+
+# Respuestas crudas de Moralis por wallet: {"balances": [...], "net_worth_usd": "..."}
+_wallet_snapshots = SWRCache(
+    ttl=settings.portfolio_cache_ttl, max_stale=settings.portfolio_max_stale
+)
+
+
+def format_balance(balance: Decimal) -> str:
+    return f"{balance:.8f}".rstrip("0").rstrip(".")
+
+
+async def _fetch_wallet_snapshot(
+    wallet_address: str, client_session: aiohttp.ClientSession
+) -> Dict[str, Any]:
+    balances, net_worth = await asyncio.gather(
+        get_wallet_token_balances(wallet_address, client_session),
+        get_wallet_net_worth(wallet_address, client_session),
+        return_exceptions=True,
+    )
+    if isinstance(balances, BaseException):
+        raise balances
+    if isinstance(net_worth, BaseException):
+        # El net worth es informativo: sin él seguimos mostrando los balances
+        logger.warning(f"No se pudo obtener el net worth de {wallet_address}: {net_worth}")
+        net_worth = None
+    return {"balances": balances, "net_worth_usd": net_worth}
+
+
+def build_portfolio(
+    wallet_address: str,
+    snapshot: Dict[str, Any],
+    token_addresses_to_monitor: Iterable[str],
+) -> Portfolio:
+    """
+    Calcula balances y total en USD de los tokens monitorizados a partir de la
+    respuesta de Moralis. Es puro cálculo: no hace ninguna llamada externa.
+    """
+    monitored = {addr.lower() for addr in token_addresses_to_monitor}
+    portfolio = Portfolio(
+        wallet_address=wallet_address, net_worth_usd=snapshot.get("net_worth_usd")
+    )
+
+    for token in snapshot.get("balances") or []:
+        token_address = (token.token_address or "").lower()
+        if token_address not in monitored:
+            continue
+
+        balance_raw = token.balance or "0"
+        decimals = token.decimals if token.decimals is not None else 18
+        symbol = token.symbol or "N/A"
+        try:
+            balance = Decimal(balance_raw) / (10 ** int(decimals))
+            formatted_balance = format_balance(balance)
+        except Exception:
+            balance = Decimal(0)
+            formatted_balance = "Error"
+            logger.error(
+                f"Error formateando balance {balance_raw} para token {symbol} ({decimals} decs)",
+                exc_info=True,
+            )
+
+        try:
+            usd_value = Decimal(str(token.usd_value or 0))
+        except Exception as e:
+            usd_value = Decimal(0)
+            logger.error(f"Error leyendo usd_value para token {symbol}: {e}")
+
+        portfolio.balances.append(
+            TokenBalance(
+                token_address=token_address,
+                symbol=symbol,
+                balance=balance,
+                formatted_balance=formatted_balance,
+                usd_value=usd_value,
+            )
+        )
+        portfolio.total_usd += usd_value
+
+    return portfolio
+
+
+async def get_portfolio(
+    wallet_address: str,
+    token_addresses_to_monitor: Iterable[str],
+    client_session: aiohttp.ClientSession,
+) -> Portfolio:
+    """
+    Devuelve el portfolio de la wallet usando la caché stale-while-revalidate.
+    Solo espera a Moralis si la wallet no tiene ningún dato cacheado. Con el
+    circuito de Moralis abierto sirve lo cacheado sin intentar refrescarlo
+    (`degraded`), o lanza CircuitOpenError si no hay nada.
+    """
+    wallet_key = wallet_address.lower()
+    degraded = not moralis.available("wallet_tokens")
+    if degraded:
+        entry = _wallet_snapshots.peek(wallet_key)
+        if entry is None:
+            breaker = moralis.circuit_breaker("wallet_tokens")
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+        snapshot, fetched_at = entry
+    else:
+        snapshot, fetched_at = await _wallet_snapshots.get(
+            wallet_key, lambda: _fetch_wallet_snapshot(wallet_key, client_session)
+        )
+    # Wallets con cientos de tokens: la aritmética Decimal se hace fuera del loop
+    portfolio = await maybe_offload(
+        len(snapshot.get("balances") or []),
+        settings.offload_min_items,
+        build_portfolio,
+        wallet_key,
+        snapshot,
+        token_addresses_to_monitor,
+    )
+    portfolio.fetched_at = fetched_at
+    portfolio.stale = time.time() - fetched_at > _wallet_snapshots.ttl
+    portfolio.degraded = degraded
+    return portfolio
@@ -0,0 +1,297 @@
+# src/profiling.py
+"""
+Perfilado bajo demanda del bot en ejecución.
+
+`profiler.request(n, modo)` arma el perfilado de los próximos N ciclos de
+sondeo: los jobs envuelven cada ciclo en `profiler.cycle()`, que sin petición
+pendiente solo comprueba un contador, así que puede quedarse siempre activo.
+Modos:
+
+- "cprofile": cProfile del hilo del event loop mientras hay ciclos en curso.
+  Incluye también las corrutinas que se intercalan (handlers de Telegram).
+  Deja un `.prof` (pstats, p. ej. para snakeviz) y un resumen `.txt`.
+- "sample": un hilo toma la pila del event loop cada `sample_interval`
+  segundos. Coste casi nulo; deja un `.folded` (flamegraph.pl, speedscope) y
+  un resumen `.txt` con las funciones más frecuentes.
+
+`dump_tasks()` escribe las tareas asyncio vivas con su pila y
+`measure_loop_lag()` mide el retraso actual del event loop. Todos los
+ficheros van a `settings.profile_dir`.
+
+`LoopWatchdog` vigila el loop de forma permanente: una tarea mide el retraso
+de cada latido y un hilo aparte, si el loop deja de latir más allá del
+umbral, escribe en el log la pila de lo que lo está bloqueando.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from src import metrics
+from src.config.settings import settings
+from src.config.logger_config import logger
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+def _output_path(prefix: str, suffix: str) -> str:
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(settings.profile_dir, f"{prefix}-{stamp}{suffix}")
+
+
+class _StackSampler(threading.Thread):
+    """Muestrea la pila de otro hilo y acumula las pilas plegadas."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.sampling = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            if not self.sampling.is_set():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class CycleProfiler:
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.cycles_left = 0
+        self.cycles_done = 0
+        self.last_results: List[str] = []
+        # Solo los procesos que arrancan los jobs de sondeo llegan a usar
+        # cycle(): en el del bot (process_role="bot") o en el del dashboard
+        # con webhook, un perfilado armado no terminaría nunca
+        self.runs_cycles = False
+        self._active = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+        self._started = 0.0
+
+    @property
+    def armed(self) -> bool:
+        return self.mode is not None
+
+    def request(self, cycles: int, mode: str = "cprofile"):
+        """Arma el perfilado de los próximos `cycles` ciclos."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfilado desconocido: {mode}")
+        if cycles < 1:
+            raise ValueError("El número de ciclos debe ser positivo")
+        if self.armed:
+            raise RuntimeError("Ya hay un perfilado en curso")
+        self.mode = mode
+        self.cycles_left = cycles
+        self.cycles_done = 0
+        logger.info(f"Perfilado ({mode}) armado para los próximos {cycles} ciclos.")
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        if not self.cycles_left:
+            yield
+            return
+        self.cycles_left -= 1
+        self._start()
+        try:
+            yield
+        finally:
+            self._stop()
+
+    def _start(self):
+        self._active += 1
+        if self._active > 1:
+            return  # Ciclos de varias cadenas solapados: el perfilador ya corre
+        if self.mode == "cprofile":
+            if self._profile is None:
+                self._profile = cProfile.Profile()
+                self._started = time.perf_counter()
+            self._profile.enable()
+        else:
+            if self._sampler is None:
+                self._sampler = _StackSampler(
+                    threading.get_ident(), settings.profile_sample_interval
+                )
+                self._sampler.start()
+                self._started = time.perf_counter()
+            self._sampler.sampling.set()
+
+    def _stop(self):
+        self._active -= 1
+        self.cycles_done += 1
+        if self._active:
+            return
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.sampling.clear()
+        if not self.cycles_left:
+            self._finish()
+
+    def _finish(self):
+        elapsed = time.perf_counter() - self._started
+        header = f"{self.cycles_done} ciclos, {elapsed:.2f}s de reloj\n\n"
+        if self._profile is not None:
+            prof_path = _output_path("cycles", ".prof")
+            self._profile.dump_stats(prof_path)
+            summary = io.StringIO()
+            pstats.Stats(self._profile, stream=summary).sort_stats(
+                "cumulative"
+            ).print_stats(50)
+            self.last_results = [prof_path, self._write_text(header + summary.getvalue())]
+        else:
+            self._sampler.stop()
+            folded_path = _output_path("cycles", ".folded")
+            with open(folded_path, "w", encoding="utf-8") as f:
+                for stack, count in self._sampler.counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.last_results = [folded_path, self._write_text(header + self._top_frames())]
+        logger.info(f"Perfilado terminado: {', '.join(self.last_results)}")
+        self.mode = None
+        self._profile = None
+        self._sampler = None
+
+    def _top_frames(self, limit: int = 50) -> str:
+        """Funciones por número de muestras en las que aparecen (inclusivo)."""
+        total = sum(self._sampler.counts.values()) or 1
+        inclusive: Counter = Counter()
+        for stack, count in self._sampler.counts.items():
+            for frame in set(stack.split(";")):
+                inclusive[frame] += count
+        lines = [f"{total} muestras\n"]
+        for frame, count in inclusive.most_common(limit):
+            lines.append(f"{100 * count / total:6.1f}%  {count:6d}  {frame}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_text(content: str) -> str:
+        path = _output_path("cycles", ".txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+
+profiler = CycleProfiler()
+
+
+def dump_tasks() -> Tuple[str, int]:
+    """Escribe las tareas asyncio vivas con su pila. Devuelve (ruta, nº de tareas)."""
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    path = _output_path("tasks", ".txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{len(tasks)} tareas\n")
+        for task in tasks:
+            f.write(f"\n=== {task.get_name()} ({task.get_coro()!r})\n")
+            task.print_stack(file=f)
+    return path, len(tasks)
+
+
+async def measure_loop_lag(samples: int = 5, interval: float = 0.05) -> float:
+    """Retraso máximo (segundos) con el que el loop despierta un `sleep(interval)`."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    for _ in range(samples):
+        started = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - started - interval)
+    return worst
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        threshold: Optional[float] = None,
+    ):
+        self.interval = interval or settings.loop_watchdog_interval
+        self.threshold = threshold or settings.loop_lag_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._reported_beat = 0.0
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> asyncio.Task:
+        self._thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        return self._task
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.monotonic()
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            metrics.EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logger.warning(f"Event loop retrasado {lag * 1000:.0f} ms")
+
+    def _watch(self):
+        # Se revisa varias veces por latido para atrapar la pila durante el bloqueo
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked <= self.threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+            metrics.EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(sin pila)"
+            logger.warning(
+                f"Event loop bloqueado más de {blocked * 1000:.0f} ms en:\n{stack}"
+            )
+
+
+watchdog: Optional[LoopWatchdog] = None
+
+
+def start_watchdog() -> LoopWatchdog:
+    """Arranca el vigilante global del loop actual (lo usa /tasks)."""
+    global watchdog
+    watchdog = LoopWatchdog()
+    watchdog.start()
+    return watchdog
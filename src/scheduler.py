@@ -0,0 +1,315 @@
+# src/scheduler.py
+"""
+Planificador adaptativo del sondeo por usuario (poll_mode="adaptive").
+
+Cada usuario de una cadena tiene su próxima comprobación en `poll_schedule`.
+Tras una comprobación vacía el intervalo se multiplica por
+`poll_backoff_factor` (hasta `poll_max_interval`); tras encontrar depósitos
+vuelve al mínimo del usuario: su `min_interval`, el de su nivel en
+`poll_tier_min_intervals` o `poll_min_interval`. Los usuarios se guardan en
+un heap por fecha de vencimiento, así el job solo trabaja cuando alguien
+vence y duerme hasta el siguiente.
+
+En poll_mode="per_user" los usuarios se reparten en `poll_slots` franjas
+(hash del user_id) espaciadas a lo largo de `poll_interval`, con un retraso
+aleatorio, para no concentrar la carga en un pico por ciclo. Los ciclos se
+alinean con el reloj, así que todos los procesos coinciden en qué franja toca;
+cada franja se reclama en `poll_lease` y solo la comprueba un proceso, que
+renueva el lease mientras trabaja. Si muere a mitad, otro la retoma al caducar.
+"""
+import heapq
+import random
+import time
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from src.chains import DEFAULT_CHAIN
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.leases import poller_id
+from src.models import AsyncSessionLocal, PollLease, PollSchedule, UserToken
+
+
+def slot_for(user_id: int, slots: int) -> int:
+    # crc32 y no hash(): tiene que dar lo mismo en todos los procesos
+    return zlib.crc32(str(user_id).encode()) % max(1, slots)
+
+
+def slot_start(cycle: int, slot: int, interval: float, slots: int) -> float:
+    """Epoch en que empieza la franja `slot` del ciclo `cycle`."""
+    return cycle * interval + slot * interval / max(1, slots)
+
+
+async def claim_slot(
+    chain: str,
+    slot: int,
+    cycle: int,
+    owner: Optional[str] = None,
+    ttl: Optional[float] = None,
+) -> bool:
+    """
+    Reclama la franja para el ciclo. El UPDATE condicional es atómico en la
+    BD: si varios procesos compiten, solo a uno le afecta la fila. También se
+    puede retomar una franja del mismo ciclo que su dueño no terminó y cuyo
+    lease ha caducado (el proceso murió a mitad).
+    """
+    now = time.time()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(
+                insert(PollLease)
+                .values(chain=chain, slot=slot, cycle=-1, owner="", claimed_at=0.0)
+                .on_conflict_do_nothing()
+            )
+            result = await session.execute(
+                update(PollLease)
+                .where(
+                    PollLease.chain == chain,
+                    PollLease.slot == slot,
+                    or_(
+                        PollLease.cycle < cycle,
+                        and_(
+                            PollLease.cycle == cycle,
+                            PollLease.done == 0,
+                            PollLease.expires_at < now,
+                        ),
+                    ),
+                )
+                .values(
+                    cycle=cycle,
+                    owner=owner or poller_id(),
+                    claimed_at=now,
+                    expires_at=now + (ttl or settings.lease_ttl),
+                    done=0,
+                )
+            )
+    return result.rowcount == 1
+
+
+async def _update_own_slot(chain: str, slot: int, cycle: int, owner: Optional[str], **values) -> bool:
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(PollLease)
+                .where(
+                    PollLease.chain == chain,
+                    PollLease.slot == slot,
+                    PollLease.cycle == cycle,
+                    PollLease.owner == (owner or poller_id()),
+                )
+                .values(**values)
+            )
+    return result.rowcount == 1
+
+
+async def renew_slot(
+    chain: str, slot: int, cycle: int, owner: Optional[str] = None, ttl: Optional[float] = None
+) -> bool:
+    """Latido del dueño de la franja: False si ya no es suya."""
+    expires_at = time.time() + (ttl or settings.lease_ttl)
+    return await _update_own_slot(chain, slot, cycle, owner, expires_at=expires_at)
+
+
+async def finish_slot(chain: str, slot: int, cycle: int, owner: Optional[str] = None) -> bool:
+    return await _update_own_slot(chain, slot, cycle, owner, done=1)
+
+
+async def abandoned_slots(chain: str, cycle: int) -> List[int]:
+    """Franjas del ciclo sin terminar cuyo lease ha caducado."""
+    async with AsyncSessionLocal() as session:
+        result = await session.scalars(
+            select(PollLease.slot).where(
+                PollLease.chain == chain,
+                PollLease.cycle == cycle,
+                PollLease.done == 0,
+                PollLease.expires_at < time.time(),
+            )
+        )
+        return list(result.all())
+
+
+class SlotClock:
+    """
+    Recorre las franjas de los ciclos de `interval` segundos alineados con el
+    reloj. Al arrancar a mitad de ciclo las franjas ya pasadas vencen enseguida:
+    si otro proceso no las ha reclamado en este ciclo, se recuperan.
+    """
+
+    def __init__(self, interval: float, slots: int, jitter: float = 0.0):
+        self.interval = interval
+        self.slots = max(1, slots)
+        self.jitter = jitter
+        self._cycle: Optional[int] = None
+        self._slot = 0
+
+    def next(self, now: Optional[float] = None) -> Tuple[int, int, float]:
+        """(ciclo, franja, epoch en que toca) de la siguiente franja."""
+        now = time.time() if now is None else now
+        current = int(now // self.interval)
+        if self._cycle is None or self._cycle < current:
+            # Arranque o retraso de ciclos enteros: no se recorren ciclos viejos
+            self._cycle, self._slot = current, 0
+        cycle, slot = self._cycle, self._slot
+        self._slot += 1
+        if self._slot == self.slots:
+            self._cycle, self._slot = cycle + 1, 0
+        at = slot_start(cycle, slot, self.interval, self.slots)
+        at += random.uniform(0, self.jitter * self.interval / self.slots)
+        return cycle, slot, at
+
+
+def min_interval_for(schedule: PollSchedule) -> float:
+    if schedule.min_interval:
+        return schedule.min_interval
+    if schedule.tier and schedule.tier in settings.poll_tier_min_intervals:
+        return settings.poll_tier_min_intervals[schedule.tier]
+    return settings.poll_min_interval
+
+
+def next_interval(schedule: PollSchedule, found_deposits: bool) -> float:
+    minimum = min_interval_for(schedule)
+    if found_deposits:
+        return minimum
+    backed_off = (schedule.interval or minimum) * settings.poll_backoff_factor
+    # Un mínimo por nivel puede superar al máximo global: manda el mínimo
+    return max(minimum, min(backed_off, settings.poll_max_interval))
+
+
+class PollScheduler:
+    def __init__(self, chain: str = DEFAULT_CHAIN):
+        self.chain = chain
+        self._schedules: Dict[int, PollSchedule] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._dirty: Set[int] = set()
+        self._refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def _push(self, schedule: PollSchedule):
+        heapq.heappush(self._heap, (schedule.next_check_at, schedule.user_id))
+
+    async def refresh(self, now: Optional[float] = None):
+        """
+        Sincroniza con la BD: añade a los usuarios que han empezado a vigilar
+        tokens en la cadena (vencen ya), olvida a los que han dejado de hacerlo
+        y recoge los cambios de `tier`/`min_interval` de los que ya tenía.
+        """
+        now = time.time() if now is None else now
+        async with AsyncSessionLocal() as session:
+            user_ids = set(
+                (
+                    await session.scalars(
+                        select(UserToken.user_id)
+                        .where(UserToken.chain == self.chain)
+                        .distinct()
+                    )
+                ).all()
+            )
+            new_ids = user_ids - self._schedules.keys()
+            stored = {
+                s.user_id: s
+                for s in (
+                    await session.scalars(
+                        select(PollSchedule).where(PollSchedule.chain == self.chain)
+                    )
+                ).all()
+            }
+        for user_id, schedule in self._schedules.items():
+            # El nivel y el mínimo se editan en la BD: se recogen sin tocar la fecha
+            if user_id in user_ids and user_id in stored:
+                schedule.tier = stored[user_id].tier
+                schedule.min_interval = stored[user_id].min_interval
+        for user_id in self._schedules.keys() - user_ids:
+            # Sus entradas del heap se descartan al salir
+            del self._schedules[user_id]
+            self._dirty.discard(user_id)
+        for user_id in new_ids:
+            schedule = stored.get(user_id)
+            if schedule is None:
+                schedule = PollSchedule(
+                    user_id=user_id,
+                    chain=self.chain,
+                    next_check_at=now,
+                    interval=settings.poll_min_interval,
+                )
+            self._schedules[user_id] = schedule
+            self._push(schedule)
+        self._refreshed_at = now
+        if new_ids:
+            logger.debug(f"Planificador {self.chain}: {len(new_ids)} usuarios nuevos.")
+
+    def needs_refresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self._refreshed_at >= settings.poll_refresh_interval
+
+    def seconds_until_next(self, now: Optional[float] = None) -> Optional[float]:
+        """Segundos hasta el siguiente vencimiento (None si no hay usuarios)."""
+        now = time.time() if now is None else now
+        while self._heap:
+            due_at, user_id = self._heap[0]
+            schedule = self._schedules.get(user_id)
+            if schedule is None or schedule.next_check_at != due_at:
+                heapq.heappop(self._heap)  # Entrada obsoleta
+                continue
+            return max(0.0, due_at - now)
+        return None
+
+    def pop_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[int]:
+        """Usuarios vencidos, del más atrasado al menos."""
+        now = time.time() if now is None else now
+        due = []
+        while self.seconds_until_next(now) == 0.0 and (limit is None or len(due) < limit):
+            _, user_id = heapq.heappop(self._heap)
+            due.append(user_id)
+        return due
+
+    def requeue(self, user_ids: List[int]):
+        """Devuelve al heap usuarios sacados con pop_due sin comprobar, sin reprogramarlos."""
+        for user_id in user_ids:
+            schedule = self._schedules.get(user_id)
+            if schedule is not None:
+                self._push(schedule)
+
+    def record(self, user_id: int, found_deposits: bool, now: Optional[float] = None):
+        """Reprograma al usuario según el resultado de su comprobación."""
+        schedule = self._schedules.get(user_id)
+        if schedule is None:
+            return
+        now = time.time() if now is None else now
+        schedule.interval = next_interval(schedule, found_deposits)
+        schedule.next_check_at = now + schedule.interval
+        self._push(schedule)
+        self._dirty.add(user_id)
+
+    async def flush(self):
+        """
+        Guarda en una sola transacción las fechas reprogramadas. Solo escribe
+        `next_check_at` e `interval`: `tier` y `min_interval` se editan en la
+        BD y el planificador únicamente los lee (ver refresh).
+        """
+        if not self._dirty:
+            return
+        dirty = [self._schedules[uid] for uid in self._dirty]
+        self._dirty.clear()
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                for schedule in dirty:
+                    stmt = insert(PollSchedule).values(
+                        user_id=schedule.user_id,
+                        chain=schedule.chain,
+                        next_check_at=schedule.next_check_at,
+                        interval=schedule.interval,
+                    )
+                    await session.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[PollSchedule.user_id, PollSchedule.chain],
+                            set_={
+                                "next_check_at": stmt.excluded.next_check_at,
+                                "interval": stmt.excluded.interval,
+                            },
+                        )
+                    )
@@ -1,7 +1,12 @@
 # src/services.py
 import aiohttp
-from typing import List, Dict, Any
+import asyncio
+import time
+from dataclasses import dataclass, replace
+from typing import List, Dict, Optional, Tuple
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.models import (
     AsyncSessionLocal,
     User,
@@ -9,27 +14,148 @@ from src.models import (
     Transaction,
     LastTx,
 )
-from src.watcher.moralis import get_wallet_deposits
+from src.watcher.base import get_backend
+from src import metrics, tracing
+from src.chains import DEFAULT_CHAIN
+from src.deposits import Deposit, format_timestamp, parse_timestamp
+from src.config.settings import settings
+from src.utils.cache import SingleFlight, TTLCache
+from src.utils.circuitbreaker import CircuitOpenError
 from src.config.logger_config import logger
 
+# Comprobaciones en curso por (usuario, cadena) y últimos /check por usuario
+_checks = SingleFlight()
+_manual_checks = SingleFlight()
+_recent_checks = TTLCache(maxsize=10_000)
+# Última consulta a la API que funcionó por (usuario, cadena)
+_last_success = TTLCache(maxsize=100_000)
+
+
+def notifies_on_detection() -> bool:
+    """
+    Con confirmaciones activas solo se avisa al detectar si `notify_on="both"`;
+    si no, el aviso lo envía la revisión de pendientes al confirmar.
+    """
+    return settings.confirmation_depth <= 0 or settings.notify_on == "both"
+
+
+async def persist_deposits(
+    session: AsyncSession,
+    deposits_by_user: Dict[int, List[Deposit]],
+    last_tx_by_user: Optional[Dict[int, Optional[LastTx]]] = None,
+    chain: str = DEFAULT_CHAIN,
+) -> Dict[int, List[Deposit]]:
+    """
+    Guarda los depósitos de una cadena que aún no existen en `transactions` y
+    avanza el LastTx (usuario, cadena) de cada usuario. Debe llamarse dentro de
+    una transacción abierta.
+    Con `confirmation_depth > 0` se guardan como "pending" hasta que
+    `confirmations.confirm_pending` los confirme.
+    Usa una sola consulta para detectar duplicados de todos los usuarios y
+    descarta también duplicados dentro del propio lote.
+    Devuelve {user_id: depósitos realmente nuevos}.
+    """
+    candidates = [
+        (user_id, d) for user_id, deposits in deposits_by_user.items() for d in deposits
+    ]
+    if not candidates:
+        return {}
+
+    existing_keys_results = await session.execute(
+        select(
+            Transaction.user_id, Transaction.tx_hash, Transaction.token_address
+        ).where(
+            Transaction.chain == chain,
+            Transaction.user_id.in_(deposits_by_user.keys()),
+            Transaction.tx_hash.in_({d.tx_hash for _, d in candidates}),
+        )
+    )
+    seen_keys = {tuple(row) for row in existing_keys_results.all()}
+
+    new_by_user: Dict[int, List[Deposit]] = {}
+    for user_id, d in candidates:
+        key = (user_id, d.tx_hash, d.token_address)
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        new_by_user.setdefault(user_id, []).append(d)
+    if not new_by_user:
+        return {}
+
+    last_tx_by_user = dict(last_tx_by_user or {})
+    missing_last_tx = [uid for uid in new_by_user if uid not in last_tx_by_user]
+    if missing_last_tx:
+        last_tx_results = await session.execute(
+            select(LastTx).where(
+                LastTx.chain == chain, LastTx.user_id.in_(missing_last_tx)
+            )
+        )
+        for last_tx_obj in last_tx_results.scalars():
+            last_tx_by_user[last_tx_obj.user_id] = last_tx_obj
+
+    status = "pending" if settings.confirmation_depth > 0 else "confirmed"
+    for user_id, new_deposits in new_by_user.items():
+        latest_timestamp = format_timestamp(max(d.timestamp for d in new_deposits))
+
+        # Update or create LastTx
+        last_tx_obj = last_tx_by_user.get(user_id)
+        if last_tx_obj:
+            if (
+                not last_tx_obj.last_timestamp
+                or latest_timestamp > last_tx_obj.last_timestamp
+            ):
+                last_tx_obj.last_timestamp = latest_timestamp
+        else:
+            session.add(
+                LastTx(user_id=user_id, chain=chain, last_timestamp=latest_timestamp)
+            )
+
+        # Add new transactions to DB
+        for d in new_deposits:
+            d.status = status
+            session.add(
+                Transaction(
+                    user_id=user_id,
+                    chain=chain,
+                    token_address=d.token_address,
+                    token_symbol=d.token_symbol,
+                    amount=str(d.amount_raw),
+                    tx_hash=d.tx_hash,
+                    block_timestamp=d.block_timestamp,
+                    from_address=d.from_address,
+                    amount_formatted=d.amount,
+                    block_number=d.block_number or None,
+                    status=status,
+                )
+            )
+        logger.info(
+            f"Nuevos depósitos guardados para {user_id} en {chain}. Último timestamp: {latest_timestamp}"
+        )
+
+    return new_by_user
+
 
 async def check_and_process_deposits(
-    user_id: int, client_session: aiohttp.ClientSession
-) -> List[Dict[Any, Any]]:
+    user_id: int, client_session: aiohttp.ClientSession, chain: str = DEFAULT_CHAIN
+) -> List[Deposit]:
     """
-    Unifica la lógica para comprobar y procesar nuevos depósitos para un usuario.
-    1. Obtiene los datos del usuario y los tokens a monitorizar.
+    Unifica la lógica para comprobar y procesar nuevos depósitos para un usuario
+    en una cadena.
+    1. Obtiene los datos del usuario y los tokens a monitorizar en esa cadena.
     2. Llama a la API de Moralis para obtener el historial de transacciones.
     3. Compara con la BD para encontrar depósitos nuevos.
     4. Guarda los nuevos depósitos y actualiza el último timestamp.
     5. Devuelve los nuevos depósitos encontrados.
+    Los errores se registran y devuelven []; salvo CircuitOpenError (la API no
+    responde), que se propaga para que quien llama pueda degradar la respuesta.
     """
     truly_new_deposits = []
+    started = time.perf_counter()
     try:
         # === BLOCK 1: Read data for API call in a separate session ===
         wallet_address = ""
         token_addresses_to_monitor = []
-        async with AsyncSessionLocal() as session:
+        async with tracing.span("db_read"), AsyncSessionLocal() as session:
             user = await session.get(User, user_id)
             if not user or not user.wallet_address:
                 logger.warning(
@@ -37,92 +163,171 @@ async def check_and_process_deposits(
                 )
                 return []
             wallet_address = user.wallet_address
+            tracing.annotate(wallet_address)
 
             tokens_result = await session.execute(
-                select(UserToken.token_address).where(UserToken.user_id == user_id)
+                select(UserToken.token_address).where(
+                    UserToken.user_id == user_id, UserToken.chain == chain
+                )
             )
             token_addresses_to_monitor = list(tokens_result.scalars())
 
         if not token_addresses_to_monitor:
-            logger.info(f"Usuario {user_id} no monitoriza ningún token. Saltando.")
+            logger.info(
+                f"Usuario {user_id} no monitoriza ningún token en {chain}. Saltando."
+            )
             return []
 
         # === EXTERNAL API CALL ===
-        deposits = await get_wallet_deposits(
-            wallet_address, token_addresses_to_monitor, client_session
-        )
+        with tracing.span("api"):
+            deposits = await get_backend(chain=chain).get_wallet_deposits(
+                wallet_address, token_addresses_to_monitor, client_session
+            )
+        _last_success.set((user_id, chain), time.time())
         if not deposits:
             return []
 
         # === BLOCK 2: Read/Write operations in a single, clean transaction ===
+        db_timer = metrics.DB_TRANSACTION_SECONDS.labels(
+            operation="check_and_process_deposits"
+        ).time()
         async with AsyncSessionLocal() as session:
-            async with session.begin():  # Start a single transaction
+            # Start a single transaction
+            async with db_timer, tracing.span("db_write"), session.begin():
                 # 1. Load last known timestamp
-                last_tx_obj = await session.get(LastTx, user_id)
-                last_known_timestamp = (
+                last_tx_obj = await session.get(LastTx, (user_id, chain))
+                last_known = parse_timestamp(
                     last_tx_obj.last_timestamp if last_tx_obj else None
                 )
 
                 # 2. Filter candidates by timestamp
-                candidate_deposits = [
-                    d
-                    for d in deposits
-                    if not last_known_timestamp
-                    or d["block_timestamp"] > last_known_timestamp
-                ]
+                with tracing.span("filter"):
+                    candidate_deposits = [d for d in deposits if d.timestamp > last_known]
 
                 if not candidate_deposits:
                     return []
 
-                # 3. Filter out already processed transactions by hash
-                existing_hashes_results = await session.execute(
-                    select(Transaction.tx_hash).where(
-                        Transaction.user_id == user_id,
-                        Transaction.tx_hash.in_(
-                            [d["hash"] for d in candidate_deposits]
-                        ),
-                    )
+                # 3. Filter out already processed transactions and persist the rest
+                new_by_user = await persist_deposits(
+                    session,
+                    {user_id: candidate_deposits},
+                    {user_id: last_tx_obj},
+                    chain=chain,
                 )
-                existing_hashes = {h for h in existing_hashes_results.scalars()}
-                truly_new_deposits = [
-                    d for d in candidate_deposits if d["hash"] not in existing_hashes
-                ]
-
-                # 4. If new deposits found, process them
-                if truly_new_deposits:
-                    latest_timestamp = max(
-                        d["block_timestamp"] for d in truly_new_deposits
-                    )
-
-                    # Update or create LastTx
-                    if last_tx_obj:
-                        last_tx_obj.last_timestamp = latest_timestamp
-                    else:
-                        session.add(
-                            LastTx(user_id=user_id, last_timestamp=latest_timestamp)
-                        )
-
-                    # Add new transactions to DB
-                    for d in truly_new_deposits:
-                        session.add(
-                            Transaction(
-                                user_id=user_id,
-                                token_address=d.get("token_address", ""),
-                                token_symbol=d.get("token_symbol", "UNKNOWN"),
-                                amount=d.get("amount_raw", "0"),
-                                tx_hash=d.get("hash", ""),
-                                block_timestamp=d.get("block_timestamp", ""),
-                                from_address=d.get("from_address", ""),
-                            )
-                        )
-                    logger.info(
-                        f"Nuevos depósitos guardados para {user_id}. Último timestamp: {latest_timestamp}"
-                    )
+                truly_new_deposits = new_by_user.get(user_id, [])
 
+    except CircuitOpenError as e:
+        logger.info(f"Sin comprobar a {user_id} ({chain}): {e}")
+        raise
+    except IntegrityError:
+        # _user_tx_token_uc: otro proceso ya los ha guardado (y notificado)
+        logger.info(
+            f"Depósitos de {user_id} ({chain}) ya guardados por otro proceso: no se notifican."
+        )
+        return []
     except Exception as e:
         logger.error(
             f"Error procesando depósitos para el usuario {user_id}: {e}", exc_info=True
         )
         return []  # Return empty list on error
+    finally:
+        metrics.DEPOSIT_CHECK_SECONDS.labels(chain=chain).observe(
+            time.perf_counter() - started
+        )
 
     return truly_new_deposits
+
+
+async def check_deposits_once(
+    user_id: int, client_session: aiohttp.ClientSession, chain: str = DEFAULT_CHAIN
+) -> Tuple[List[Deposit], bool]:
+    """
+    `check_and_process_deposits` con una sola comprobación en curso por
+    (usuario, cadena): si ya hay una (p. ej. el sondeo y un /check a la vez)
+    se espera a su resultado. Devuelve (depósitos nuevos, compartido); con
+    compartido=True los depósitos ya los notifica quien lanzó la comprobación.
+    """
+    return await _checks.run(
+        (user_id, chain),
+        lambda: check_and_process_deposits(user_id, client_session, chain),
+    )
+
+
+@dataclass
+class CheckResult:
+    deposits: List[Deposit]  # Depósitos nuevos que debe notificar quien recibe el resultado
+    checked_at: float  # Epoch de la comprobación (degraded: de la última que funcionó, 0 si no hay)
+    joined: bool = False  # Alguna cadena se ha unido a una comprobación en curso
+    cached: bool = False  # Resultado de una comprobación reciente (check_cooldown)
+    degraded: bool = False  # Alguna cadena sin comprobar por tener el circuito abierto
+
+
+def last_successful_check(user_id: int, chain: str = DEFAULT_CHAIN) -> Optional[float]:
+    """Epoch de la última consulta a la API que funcionó para el usuario en la cadena."""
+    return _last_success.get((user_id, chain))
+
+
+def recently_checked(user_id: int) -> bool:
+    """True si el usuario ha hecho /check hace menos de `check_cooldown` segundos."""
+    return user_id in _recent_checks
+
+
+def reset_check_cooldown(user_id: int):
+    """Olvida el último /check del usuario: el siguiente vuelve a consultar la API."""
+    _recent_checks.pop(user_id)
+
+
+async def check_and_process_all_chains(
+    user_id: int, client_session: aiohttp.ClientSession
+) -> CheckResult:
+    """
+    Comprobación bajo demanda (/check) de todas las cadenas en paralelo. Dentro
+    del `check_cooldown` devuelve el último resultado sin llamar a la API. Si
+    alguna cadena tiene el circuito abierto el resultado sale `degraded`, con
+    la fecha de la última comprobación que funcionó, y no se guarda.
+    """
+    cached = _recent_checks.get(user_id)
+    if cached is not None:
+        return replace(cached, cached=True)
+    result, shared = await _manual_checks.run(
+        user_id, lambda: _check_all_chains(user_id, client_session)
+    )
+    # Varios /check seguidos: solo el primero envía los depósitos
+    return replace(result, deposits=[], joined=True) if shared else result
+
+
+async def _check_chain(
+    user_id: int, client_session: aiohttp.ClientSession, chain: str
+) -> Tuple[List[Deposit], bool, bool]:
+    """(depósitos, compartido, sin comprobar por circuito abierto)"""
+    try:
+        deposits, shared = await check_deposits_once(user_id, client_session, chain)
+    except CircuitOpenError:
+        return [], False, True
+    return deposits, shared, False
+
+
+async def _check_all_chains(
+    user_id: int, client_session: aiohttp.ClientSession
+) -> CheckResult:
+    results = await asyncio.gather(
+        *(_check_chain(user_id, client_session, chain) for chain in settings.chains)
+    )
+    unchecked = [
+        chain for chain, (_, _, skipped) in zip(settings.chains, results) if skipped
+    ]
+    result = CheckResult(
+        deposits=[d for deposits, shared, _ in results if not shared for d in deposits],
+        checked_at=time.time(),
+        joined=any(shared for _, shared, _ in results),
+        degraded=bool(unchecked),
+    )
+    if unchecked:
+        # Los datos que tenemos son los de la comprobación más antigua de esas cadenas
+        result.checked_at = min(
+            (last_successful_check(user_id, chain) or 0.0) for chain in unchecked
+        )
+    elif settings.check_cooldown > 0:
+        _recent_checks.set(user_id, result, ttl=settings.check_cooldown)
+    return result
+
@@ -0,0 +1,215 @@
+# src/tracing.py
+"""
+Trazas ligeras por usuario para los ciclos de sondeo.
+
+`cycle_report()` abre un ciclo, `trace_user()` una traza por usuario dentro de
+él y `span()` mide cada etapa (lectura de BD, páginas de la API, filtrado,
+escritura, notificación). El estado viaja en contextvars, así que las
+funciones instrumentadas no reciben nada nuevo y `span()` sin traza activa no
+hace nada. Al cerrar el ciclo se escribe en el log una línea JSON con los N
+usuarios más lentos. Con `otel_enabled` y OpenTelemetry instalado, cada
+traza y etapa también se exporta como span.
+"""
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from src.config.settings import settings
+from src.config.logger_config import logger
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover - depende del entorno
+    otel_trace = None
+
+
+@dataclass
+class UserTrace:
+    user_id: int
+    chain: str
+    wallet_address: str = ""
+    started: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    stages: Dict[str, float] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "wallet": self.wallet_address,
+            "chain": self.chain,
+            "seconds": round(self.duration, 4),
+            "stages": {name: round(secs, 4) for name, secs in self.stages.items()},
+            **self.counters,
+        }
+
+
+@dataclass
+class CycleReport:
+    chain: str
+    started: float = field(default_factory=time.perf_counter)
+    traces: List[UserTrace] = field(default_factory=list)
+
+    def slowest(self, top_n: int) -> List[UserTrace]:
+        return sorted(self.traces, key=lambda t: t.duration, reverse=True)[:top_n]
+
+    def summary(self, top_n: int) -> dict:
+        return {
+            "event": "poll_cycle_summary",
+            "chain": self.chain,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "users": len(self.traces),
+            "pages": sum(t.counters.get("pages", 0) for t in self.traces),
+            "bytes": sum(t.counters.get("bytes", 0) for t in self.traces),
+            "slowest": [t.summary() for t in self.slowest(top_n)],
+        }
+
+
+_current_cycle: ContextVar[Optional[CycleReport]] = ContextVar(
+    "tracing_cycle", default=None
+)
+_current_trace: ContextVar[Optional[UserTrace]] = ContextVar(
+    "tracing_user", default=None
+)
+
+
+def _otel_tracer():
+    if otel_trace is None or not settings.otel_enabled:
+        return None
+    return otel_trace.get_tracer("token_tracker_bot")
+
+
+def configure_tracing():
+    """
+    Con `otel_enabled`, registra un TracerProvider del SDK con exportador OTLP
+    (o de consola si no está instalado). La configuración del destino usa las
+    variables estándar OTEL_EXPORTER_OTLP_*.
+    """
+    if not settings.otel_enabled:
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            ConsoleSpanExporter,
+        )
+    except ImportError:
+        logger.warning(
+            "otel_enabled=True pero OpenTelemetry no está instalado "
+            "(pip install .[tracing]); solo se usará el log."
+        )
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter as exporter_cls,
+        )
+    except ImportError:
+        exporter_cls = ConsoleSpanExporter
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "token-tracker-bot"})
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter_cls()))
+    otel_trace.set_tracer_provider(provider)
+    logger.info(f"Trazas OpenTelemetry activas ({exporter_cls.__name__}).")
+
+
+@contextmanager
+def cycle_report(chain: str) -> Iterator[CycleReport]:
+    """Agrupa las trazas de un ciclo y escribe el resumen de los más lentos al salir."""
+    report = CycleReport(chain=chain)
+    token = _current_cycle.set(report)
+    try:
+        yield report
+    finally:
+        _current_cycle.reset(token)
+        if report.traces:
+            logger.info(json.dumps(report.summary(settings.trace_top_n)))
+
+
+@contextmanager
+def trace_user(user_id: int, chain: str) -> Iterator[UserTrace]:
+    trace = UserTrace(user_id=user_id, chain=chain)
+    token = _current_trace.set(trace)
+    tracer = _otel_tracer()
+    otel_span = (
+        tracer.start_as_current_span(
+            "check_user", attributes={"user_id": user_id, "chain": chain}
+        )
+        if tracer
+        else nullcontext()
+    )
+    try:
+        with otel_span as current:
+            yield trace
+            if current is not None:
+                current.set_attribute("wallet", trace.wallet_address)
+                for name, value in trace.counters.items():
+                    current.set_attribute(name, value)
+    finally:
+        trace.duration = time.perf_counter() - trace.started
+        _current_trace.reset(token)
+        cycle = _current_cycle.get()
+        if cycle is not None:
+            cycle.traces.append(trace)
+
+
+class Span:
+    """
+    Mide una etapa de la traza actual; sin traza activa no hace nada. Sirve
+    como context manager síncrono o asíncrono, para poder combinarlo con
+    `async with session.begin()`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._trace: Optional[UserTrace] = None
+        self._otel_span = None
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        if self._trace is None:
+            return self
+        tracer = _otel_tracer()
+        if tracer:
+            self._otel_span = tracer.start_as_current_span(self.name)
+            self._otel_span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._trace is None:
+            return False
+        elapsed = time.perf_counter() - self._started
+        self._trace.stages[self.name] = self._trace.stages.get(self.name, 0.0) + elapsed
+        if self._otel_span is not None:
+            self._otel_span.__exit__(*exc)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+def span(name: str) -> Span:
+    return Span(name)
+
+
+def annotate(wallet_address: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.wallet_address = wallet_address
+
+
+def record(**counters: int):
+    """Suma contadores (p. ej. pages=1, bytes=n) a la traza actual."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    for name, value in counters.items():
+        trace.counters[name] = trace.counters.get(name, 0) + value
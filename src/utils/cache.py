@@ -0,0 +1,156 @@
+# src/utils/cache.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger("token_tracker_bot")
+
+
+class TTLCache:
+    """
+    Caché LRU en memoria con caducidad por entrada.
+    Cada valor se guarda con su propio instante de expiración (epoch), de modo
+    que el tamaño queda acotado por `maxsize` y ninguna entrada sobrevive a su TTL.
+    No es thread-safe: está pensada para usarse dentro de un único event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, default_ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.time():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        expires_at: Optional[float] = None,
+    ) -> None:
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.default_ttl
+            expires_at = time.time() + ttl if ttl is not None else float("inf")
+        if expires_at <= time.time():
+            self._data.pop(key, None)
+            return
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return item[1] if item is not None else default
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class SWRCache:
+    """
+    Caché asíncrona stale-while-revalidate.
+    - Entrada fresca (edad < ttl): se devuelve tal cual.
+    - Entrada caducada pero dentro de `max_stale`: se devuelve inmediatamente y
+      se lanza un refresco en segundo plano (uno solo por clave).
+    - Sin entrada: se espera al loader; llamadas concurrentes comparten la carga.
+    `get` devuelve la tupla (valor, fetched_at).
+    """
+
+    def __init__(self, ttl: float, max_stale: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = TTLCache(maxsize=maxsize, default_ttl=ttl + max_stale)
+        self._inflight: dict = {}
+
+    async def get(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, float]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            if time.time() - fetched_at > self.ttl:
+                self._start_load(key, loader)
+            return value, fetched_at
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def peek(self, key: Hashable) -> Optional[tuple[Any, float]]:
+        """Devuelve la entrada cacheada (aunque esté caducada) sin disparar cargas."""
+        return self._entries.get(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key)
+
+    def _start_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> "asyncio.Task":
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(self._on_done)
+        return task
+
+    async def _load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, float]:
+        try:
+            value = await loader()
+            entry = (value, time.time())
+            self._entries.set(key, entry)
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _on_done(task: "asyncio.Task") -> None:
+        # Los refrescos en segundo plano no tienen a nadie esperando: se registra el fallo
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Fallo al refrescar una entrada de caché: {task.exception()}")
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera lanza la
+    carga y las demás esperan su resultado en lugar de repetirla.
+    `run` devuelve (valor, compartido); compartido=True si se ha unido a una
+    carga ya en curso.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def run(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            # Se libera al terminar aunque quien la lanzó haya sido cancelado
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), shared
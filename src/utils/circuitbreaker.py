@@ -0,0 +1,84 @@
+# src/utils/circuitbreaker.py
+import time
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin intentarla."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            f"Circuito '{name}' abierto: reintento en {retry_after:.0f} s"
+        )
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados para un servicio externo.
+    - closed: las llamadas pasan; `failure_threshold` fallos seguidos lo abren.
+    - open: las llamadas fallan al instante durante `reset_timeout` segundos.
+    - half_open: pasado ese tiempo se deja pasar una sola llamada de prueba; si
+      va bien se cierra y si falla vuelve a abrirse. Si la prueba no informa
+      (p. ej. se cancela) se permite otra al cabo de `reset_timeout`.
+    `failure_threshold <= 0` lo desactiva.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_until = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Segundos hasta que se permita la siguiente llamada de prueba."""
+        if self._opened_at is None:
+            return 0.0
+        now = time.monotonic()
+        return max(0.0, self._opened_at + self.reset_timeout - now, self._probe_until - now)
+
+    def allow(self) -> bool:
+        """True si la llamada puede hacerse; en half_open reserva la prueba."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        now = time.monotonic()
+        if now < self._probe_until:
+            return False
+        self._probe_until = now + self.reset_timeout
+        return True
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probe_until = 0.0
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            # Falla la prueba (o se alcanza el umbral): se abre otro periodo completo
+            self._opened_at = time.monotonic()
+            self._probe_until = 0.0
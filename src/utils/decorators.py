@@ -3,6 +3,7 @@ from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from src.models import AsyncSessionLocal, User
+from src.config.settings import settings
 from src.config.logger_config import logger
 
 
@@ -31,3 +32,20 @@ def require_wallet(handler):
             return await handler(update, context, *args, **kwargs)
 
     return wrapper
+
+
+def require_admin(handler):
+    """Solo deja pasar a los usuarios de `settings.admin_user_ids`."""
+
+    @wraps(handler)
+    async def wrapper(
+        update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
+    ):
+        user_id = update.effective_user.id
+        if user_id not in settings.admin_user_ids:
+            logger.warning(f"Usuario {user_id} intentó usar un comando de admin.")
+            await update.message.reply_text("Comando no disponible.")
+            return
+        return await handler(update, context, *args, **kwargs)
+
+    return wrapper
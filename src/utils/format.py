@@ -1,5 +1,8 @@
 # src/utils/format.py
-from typing import Dict, Any
+import time
+
+from src.chains import DEFAULT_CHAIN, get_chain
+from src.deposits import Deposit
 
 
 def escape_md2(text: str) -> str:
@@ -8,17 +11,83 @@ def escape_md2(text: str) -> str:
     return "".join("\\" + c if c in escape_chars else c for c in str(text))
 
 
-def format_deposit_msg(deposit: Dict[Any, Any]) -> str:
-    amount = escape_md2(deposit["amount"])
-    symbol = escape_md2(deposit["token_symbol"])
-    from_addr = escape_md2(deposit["from_address"])
-    tx_hash = deposit["hash"]
-    timestamp = escape_md2(deposit["block_timestamp"])
+def format_deposit_msg(deposit: Deposit) -> str:
+    amount = escape_md2(deposit.amount)
+    symbol = escape_md2(deposit.token_symbol)
+    from_addr = escape_md2(deposit.from_address)
+    tx_hash = deposit.tx_hash
+    timestamp = escape_md2(deposit.block_timestamp)
+    chain = get_chain(deposit.chain)
 
-    return (
+    msg = (
         f"*{symbol} Deposit\\!*\n"
         f"Cantidad: {amount} {symbol}\n"
         f"De: `{from_addr[:10]}...{from_addr[-6:]}`\n"
-        f"Tx: [Ver en Polygonscan](https://polygonscan.com/tx/{tx_hash})\n"
+        f"Tx: [Ver en {chain.explorer_name}]({chain.tx_url(tx_hash)})\n"
         f"Fecha: {timestamp}"
     )
+    if chain.name != DEFAULT_CHAIN:
+        msg += f"\nRed: {escape_md2(chain.label)}"
+    if deposit.status == "pending":
+        msg += "\n_Pendiente de confirmación_"
+    return msg
+
+
+def format_dropped_msg(deposit: Deposit) -> str:
+    """Aviso de un depósito pendiente que ha desaparecido de la cadena (reorg)."""
+    amount = escape_md2(deposit.amount)
+    symbol = escape_md2(deposit.token_symbol)
+    tx_hash = deposit.tx_hash
+    chain = get_chain(deposit.chain)
+
+    return (
+        f"*{symbol} Deposit revertido*\n"
+        f"El depósito de {amount} {symbol} ya no está en la cadena y se ha descartado\\.\n"
+        f"Tx: [Ver en {chain.explorer_name}]({chain.tx_url(tx_hash)})"
+    )
+
+
+def format_age(seconds: float) -> str:
+    """Antigüedad legible: "40 s", "12 min", "3 h"."""
+    seconds = max(0, int(seconds))
+    if seconds < 120:
+        return f"{seconds} s"
+    if seconds < 7200:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h"
+
+
+def format_stale_note(fetched_at: float) -> str:
+    """Nota (texto plano) para respuestas servidas de caché con la API caída."""
+    note = "⚠️ Moralis no responde ahora mismo"
+    if fetched_at:
+        note += f": datos de hace {format_age(time.time() - fetched_at)}"
+    return note + "."
+
+
+def format_check_summary(result, cooldown: int) -> str:
+    """
+    Respuesta de /check cuando no hay depósitos que enviar, o aún no se
+    avisa de ellos por estar pendientes de confirmar (texto plano).
+    `result` es un services.CheckResult.
+    """
+    if result.degraded:
+        return (
+            f"{format_stale_note(result.checked_at)} No se han podido buscar depósitos "
+            "nuevos; el sondeo automático los avisará cuando vuelva."
+        )
+    if result.cached:
+        ago = max(0, int(time.time() - result.checked_at))
+        return (
+            f"Ya se comprobó hace {ago} s ({len(result.deposits)} depósitos nuevos). "
+            f"Podrás repetir /check en {max(1, cooldown - ago)} s."
+        )
+    if result.joined:
+        return "Ya había una comprobación en curso: si hay depósitos nuevos, te llegará su aviso."
+    if result.deposits:
+        # notify_on="confirmed": el aviso lo envía la revisión de pendientes
+        return (
+            f"{len(result.deposits)} depósitos nuevos pendientes de confirmar: "
+            "te avisaré de cada uno cuando se confirme."
+        )
+    return "No hay depósitos nuevos de los tokens monitorizados."
@@ -0,0 +1,94 @@
+# src/utils/http.py
+"""
+Fábrica de la sesión aiohttp compartida (Moralis y nodos RPC).
+
+Ajusta el pool del TCPConnector a nuestra concurrencia: tope por host igual a
+`moralis_max_concurrency` (más conexiones solo quedarían ociosas), caché DNS
+y keep-alive largo para que el sondeo reutilice las conexiones entre usuarios
+en vez de repetir el handshake TLS. Separa los timeouts de conexión, lectura
+y total, que antes eran un único total=30 por llamada.
+
+aiohttp no habla HTTP/2. Sí descomprime brotli si hay `Brotli` instalado
+(`pip install .[http-brotli]`), y entonces lo anuncia en Accept-Encoding.
+
+El estado de cada pool (conexiones en uso, ociosas y peticiones esperando) se
+expone en /metrics (`http_pool_connections`, `http_pool_waiters`) y con
+`pool_stats`.
+"""
+import weakref
+from typing import Dict
+
+import aiohttp
+
+from src import metrics
+from src.config.settings import settings
+from src.config.logger_config import logger
+
+try:
+    from aiohttp.compression_utils import HAS_BROTLI
+except ImportError:  # pragma: no cover - depende de la versión de aiohttp
+    HAS_BROTLI = False
+
+# Sesiones creadas por la fábrica, por nombre de pool, para las métricas
+_sessions: "weakref.WeakValueDictionary[str, aiohttp.ClientSession]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def limit_per_host() -> int:
+    return settings.http_pool_limit_per_host or settings.moralis_max_concurrency
+
+
+def client_timeout() -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(
+        total=settings.http_total_timeout,
+        sock_connect=settings.http_connect_timeout,
+        sock_read=settings.http_read_timeout,
+    )
+
+
+def create_client_session(name: str = "default") -> aiohttp.ClientSession:
+    """Crea la sesión compartida; debe llamarse dentro del event loop."""
+    connector = aiohttp.TCPConnector(
+        limit=settings.http_pool_limit,
+        limit_per_host=limit_per_host(),
+        ttl_dns_cache=settings.http_dns_cache_ttl,
+        keepalive_timeout=settings.http_keepalive_timeout,
+    )
+    session = aiohttp.ClientSession(connector=connector, timeout=client_timeout())
+    _sessions[name] = session
+    logger.info(
+        f"Pool HTTP '{name}': {settings.http_pool_limit} conexiones, "
+        f"{limit_per_host()} por host, keep-alive {settings.http_keepalive_timeout:g}s, "
+        f"brotli {'sí' if HAS_BROTLI else 'no'}."
+    )
+    return session
+
+
+def pool_stats(session: aiohttp.ClientSession) -> Dict[str, int]:
+    """Conexiones en uso, ociosas y peticiones esperando un hueco en el pool."""
+    connector = session.connector
+    if connector is None or connector.closed:
+        return {"in_use": 0, "idle": 0, "waiters": 0, "limit": 0, "limit_per_host": 0}
+    # Atributos internos de aiohttp: el conector no publica estas cifras
+    idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+    in_use = len(getattr(connector, "_acquired", ()))
+    waiters = sum(len(w) for w in getattr(connector, "_waiters", {}).values())
+    return {
+        "in_use": in_use,
+        "idle": idle,
+        "waiters": waiters,
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+    }
+
+
+def _collect_pool_metrics():
+    for name, session in list(_sessions.items()):
+        stats = pool_stats(session)
+        for state in ("in_use", "idle", "limit"):
+            metrics.HTTP_POOL_CONNECTIONS.labels(pool=name, state=state).set(stats[state])
+        metrics.HTTP_POOL_WAITERS.labels(pool=name).set(stats["waiters"])
+
+
+metrics.REGISTRY.add_collector(_collect_pool_metrics)
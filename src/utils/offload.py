@@ -0,0 +1,50 @@
+# src/utils/offload.py
+"""
+Saca trabajo de CPU del event loop.
+
+`offload()` ejecuta una función en un pool de hilos compartido y
+`maybe_offload()` solo lo hace a partir de cierto tamaño, para no pagar el
+salto de hilo con cargas pequeñas. Decodificar JSON o sumar `Decimal` no
+libera el GIL, pero en un hilo el intérprete alterna con el loop cada
+`sys.getswitchinterval()` (5 ms), así que los comandos de Telegram siguen
+respondiendo mientras se procesa una página enorme. Un pool de procesos
+costaría lo mismo en serializar el resultado de vuelta que en decodificarlo.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from src.config.settings import settings
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.offload_workers, thread_name_prefix="offload"
+        )
+    return _executor
+
+
+async def offload(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(func, *args, **kwargs))
+
+
+async def maybe_offload(
+    size: int, threshold: int, func: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    """Ejecuta `func` en el pool si `size >= threshold`; si no, en línea."""
+    if threshold > 0 and size >= threshold:
+        return await offload(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+async def decode_json(body: bytes) -> Any:
+    return await maybe_offload(len(body), settings.offload_json_bytes, json.loads, body)
@@ -0,0 +1,83 @@
+# src/utils/ratelimit.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Hashable, Optional
+from src.utils.cache import TTLCache
+
+
+class RateLimiter:
+    """
+    Limitador de ventana fija: como mucho `limit` peticiones por clave cada
+    `window` segundos. `limit <= 0` desactiva el límite.
+    Por defecto los contadores viven en memoria del proceso (acotados por
+    `maxsize`); con `shared_path` se guardan en un fichero SQLite local que
+    comparten todos los workers de la misma máquina.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window: int,
+        maxsize: int = 10_000,
+        shared_path: Optional[str] = None,
+    ):
+        self.limit = limit
+        self.window = window
+        self._counters = TTLCache(maxsize=maxsize)
+        self._shared_path = shared_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    async def hit(self, key: Hashable) -> bool:
+        """Registra una petición y devuelve False si supera el límite."""
+        if self.limit <= 0:
+            return True
+        window_start = int(time.time()) // self.window * self.window
+        if self._shared_path:
+            count = await asyncio.to_thread(self._shared_hit, str(key), window_start)
+        else:
+            counter_key = (key, window_start)
+            count = self._counters.get(counter_key, 0) + 1
+            self._counters.set(
+                counter_key, count, expires_at=window_start + self.window
+            )
+        return count <= self.limit
+
+    def _connect(self) -> sqlite3.Connection:
+        # La conexión se abre de forma perezosa y por pid: cada worker (tras el fork) tiene la suya
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self._shared_path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "key TEXT NOT NULL, window_start INTEGER NOT NULL, "
+                "count INTEGER NOT NULL, PRIMARY KEY (key, window_start))"
+            )
+        return self._conn
+
+    def _shared_hit(self, key: str, window_start: int) -> int:
+        with self._lock:
+            return self._shared_hit_locked(key, window_start)
+
+    def _shared_hit_locked(self, key: str, window_start: int) -> int:
+        conn = self._connect()
+        row = conn.execute(
+            "INSERT INTO rate_limits (key, window_start, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (key, window_start) DO UPDATE SET count = count + 1 "
+            "RETURNING count",
+            (key, window_start),
+        ).fetchone()
+        if row[0] == 1:
+            # Primera petición de la ventana: limpiamos ventanas antiguas de esta clave
+            conn.execute(
+                "DELETE FROM rate_limits WHERE key = ? AND window_start < ?",
+                (key, window_start),
+            )
+        return row[0]
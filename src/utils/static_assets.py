@@ -0,0 +1,164 @@
+# src/utils/static_assets.py
+"""
+Pipeline de assets del dashboard.
+
+Build (una vez por despliegue):
+    python -m src.utils.static_assets [static/dashboard] [static/dashboard/dist]
+
+Copia los assets con el hash de su contenido en el nombre (script.<hash>.js),
+reescribe las referencias de index.html y genera variantes precomprimidas
+.gz y .br (esta última solo si hay librería brotli instalada).
+`CachedStaticFiles` sirve esas variantes según Accept-Encoding y añade
+cabeceras de caché: inmutables para los assets con hash, revalidación
+para todo lo demás (index.html incluido).
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+from typing import Dict
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+DIST_DIRNAME = "dist"
+HASHED_ASSET_PATTERN = re.compile(r"\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".svg", ".json", ".txt"}
+# Orden de preferencia de las variantes precomprimidas
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def _write_compressed_variants(path: str) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data))
+
+
+def build_assets(source_dir: str, output_dir: str) -> Dict[str, str]:
+    """
+    Genera en `output_dir` los assets con hash y sus variantes comprimidas.
+    Devuelve el manifiesto {nombre original: nombre con hash}.
+    """
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    manifest = {}
+    for name in sorted(os.listdir(source_dir)):
+        source_path = os.path.join(source_dir, name)
+        if not os.path.isfile(source_path) or name.endswith(".html"):
+            continue
+        with open(source_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        hashed_name = f"{stem}.{digest}{ext}"
+        shutil.copyfile(source_path, os.path.join(output_dir, hashed_name))
+        manifest[name] = hashed_name
+
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(source_dir, name), encoding="utf-8") as f:
+            html = f.read()
+        for original, hashed in manifest.items():
+            html = re.sub(
+                rf'(\b(?:src|href)=")(\./)?{re.escape(original)}"',
+                rf'\g<1>{hashed}"',
+                html,
+            )
+        with open(os.path.join(output_dir, name), "w", encoding="utf-8") as f:
+            f.write(html)
+
+    for name in os.listdir(output_dir):
+        if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS:
+            _write_compressed_variants(os.path.join(output_dir, name))
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def resolve_dashboard_dir(source_dir: str) -> str:
+    """Usa el build con hash si existe; si no, sirve los ficheros fuente."""
+    dist_dir = os.path.join(source_dir, DIST_DIRNAME)
+    if os.path.isfile(os.path.join(dist_dir, "index.html")):
+        return dist_dir
+    return source_dir
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles con variantes precomprimidas y cabeceras Cache-Control."""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        accepted = {
+            part.split(";")[0].strip()
+            for part in request_headers.get("accept-encoding", "").split(",")
+        }
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL
+            if HASHED_ASSET_PATTERN.search(os.path.basename(full_path))
+            else REVALIDATE_CACHE_CONTROL,
+        }
+
+        response_path, response_stat = full_path, stat_result
+        if os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS:
+            headers["Vary"] = "Accept-Encoding"
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                try:
+                    response_stat = os.stat(full_path + suffix)
+                except FileNotFoundError:
+                    continue
+                response_path = full_path + suffix
+                headers["Content-Encoding"] = encoding
+                break
+
+        response = FileResponse(
+            response_path,
+            status_code=status_code,
+            stat_result=response_stat,
+            media_type=media_type,
+            headers=headers,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "static/dashboard"
+    output = sys.argv[2] if len(sys.argv) > 2 else os.path.join(source, DIST_DIRNAME)
+    result = build_assets(source, output)
+    for original, hashed in result.items():
+        print(f"{original} -> {hashed}")
+    print(f"Assets generados en {output} (brotli: {'sí' if brotli else 'no'})")
@@ -0,0 +1,260 @@
+# src/walletindex.py
+"""
+Índice inverso en memoria: (cadena, wallet, token) -> usuarios que lo siguen.
+
+Responde en O(1) a "¿a quién le interesa esta transferencia?" sin consultar
+`users` ni `user_tokens` por cada evento (escáner, webhooks de proveedores).
+Se construye con una sola consulta al arrancar, los comandos del bot lo
+actualizan al momento (`/setwallet`, `/addtoken`, `/removetoken`, `/reset`)
+y una tarea lo reconcilia con la BD cada `wallet_index_reconcile_interval`
+segundos. Cada proceso tiene el suyo: con el bot y el sondeador separados,
+los cambios de un proceso llegan al otro en la siguiente reconciliación.
+
+Para ocupar poco con cientos de miles de wallets, una wallet con un solo
+token se guarda como la tupla (token, *usuarios) en lugar de un dict, las
+direcciones de token se internan (se repiten entre wallets), cada wallet es
+un único str compartido por todas las estructuras y los usuarios son tuplas
+ordenadas.
+"""
+import sys
+import time
+from typing import Callable, Collection, Dict, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import select
+
+from src import metrics
+from src.config.logger_config import logger
+from src.models import AsyncSessionLocal, User, UserToken
+from src.utils.cache import SingleFlight
+
+Users = Tuple[int, ...]
+# Una wallet: (token, *usuarios) si sigue un solo token; si no, {token: usuarios}
+Entry = Union[Tuple[Union[str, int], ...], Dict[str, Users]]
+
+
+def _tokens(entry: Optional[Entry]) -> List[Tuple[str, Users]]:
+    if entry is None:
+        return []
+    if isinstance(entry, tuple):
+        return [(entry[0], entry[1:])]
+    return list(entry.items())
+
+
+class _IndexData:
+    """Las estructuras del índice; `WalletIndex` las sustituye al reconciliar."""
+
+    def __init__(self):
+        self.chains: Dict[str, Dict[str, Entry]] = {}
+        self.user_wallets: Dict[int, str] = {}
+        # Pares (wallet, token) por contrato y cadena, para `contracts`
+        self.token_counts: Dict[str, Dict[str, int]] = {}
+
+    def users_for(self, chain: str, wallet: str, token: str) -> Users:
+        wallets = self.chains.get(chain)
+        entry = wallets.get(wallet) if wallets is not None else None
+        if entry is None:
+            return ()
+        if isinstance(entry, tuple):
+            return entry[1:] if entry[0] == token else ()
+        return entry.get(token, ())
+
+    def _store(self, chain: str, wallet: str, token: str, users: Users):
+        wallets = self.chains.setdefault(chain, {})
+        items = dict(_tokens(wallets.get(wallet)))
+        counts = self.token_counts.setdefault(chain, {})
+        if token in items:
+            counts[token] -= 1
+        if users:
+            items[token] = users
+            counts[token] = counts.get(token, 0) + 1
+        else:
+            items.pop(token, None)
+        if not counts.get(token):
+            counts.pop(token, None)
+        if not items:
+            wallets.pop(wallet, None)
+        elif len(items) == 1:
+            ((only, only_users),) = items.items()
+            wallets[wallet] = (only, *only_users)
+        else:
+            wallets[wallet] = items
+
+    def set_wallet(self, user_id: int, wallet: str):
+        old = self.user_wallets.get(user_id)
+        self.user_wallets[user_id] = wallet
+        if old is None or old == wallet:
+            return
+        # Los tokens del usuario pasan de la wallet antigua a la nueva
+        for chain, wallets in self.chains.items():
+            for token, users in _tokens(wallets.get(old)):
+                if user_id in users:
+                    self._store(chain, old, token, tuple(u for u in users if u != user_id))
+                    self.add_token(user_id, chain, token)
+
+    def add_token(self, user_id: int, chain: str, token: str):
+        wallet = self.user_wallets.get(user_id)
+        if wallet is None:
+            return  # Sin wallet no hay nada que indexar
+        users = self.users_for(chain, wallet, token)
+        if user_id not in users:
+            self._store(chain, wallet, sys.intern(token), tuple(sorted(users + (user_id,))))
+
+    def remove_token(self, user_id: int, chain: str, token: str):
+        wallet = self.user_wallets.get(user_id)
+        users = self.users_for(chain, wallet, token) if wallet else ()
+        if user_id in users:
+            self._store(chain, wallet, token, tuple(u for u in users if u != user_id))
+
+    def remove_user_tokens(self, user_id: int):
+        wallet = self.user_wallets.get(user_id)
+        if wallet is None:
+            return
+        for chain, wallets in self.chains.items():
+            for token, _ in _tokens(wallets.get(wallet)):
+                self.remove_token(user_id, chain, token)
+
+    def remove_user(self, user_id: int):
+        self.remove_user_tokens(user_id)
+        self.user_wallets.pop(user_id, None)
+
+
+class WalletIndex:
+    def __init__(self):
+        self._data = _IndexData()
+        self.loaded = False
+        # Cambios aplicados durante una recarga, para repetirlos sobre el índice nuevo
+        self._replay: Optional[List[Tuple[Callable, tuple]]] = None
+        self._loads = SingleFlight()
+
+    # --- Consultas (O(1)) ---
+
+    def users_for(self, chain: str, wallet: str, token: str) -> Users:
+        """Usuarios que siguen `token` en `wallet` (direcciones en minúsculas)."""
+        return self._data.users_for(chain, wallet, token)
+
+    def wallets(self, chain: str) -> Collection[str]:
+        """Wallets con algún token en la cadena (vista con `in` O(1))."""
+        return self._data.chains.get(chain, {}).keys()
+
+    def contracts(self, chain: str) -> Set[str]:
+        return set(self._data.token_counts.get(chain, {}))
+
+    def stats(self) -> Dict[str, int]:
+        data = self._data
+        return {
+            "users": len(data.user_wallets),
+            "wallets": sum(len(w) for w in data.chains.values()),
+            "pairs": sum(sum(c.values()) for c in data.token_counts.values()),
+        }
+
+    # --- Cambios incrementales (tras confirmar el cambio en la BD) ---
+
+    def _apply(self, op: Callable, *args):
+        if not self.loaded and self._replay is None:
+            return  # Sin cargar (p. ej. el proceso del bot): se recogerá al cargar
+        op(self._data, *args)
+        if self._replay is not None:
+            self._replay.append((op, args))
+
+    def set_wallet(self, user_id: int, wallet: str):
+        self._apply(_IndexData.set_wallet, user_id, wallet.lower())
+
+    def add_token(self, user_id: int, chain: str, token: str):
+        self._apply(_IndexData.add_token, user_id, chain, token.lower())
+
+    def remove_token(self, user_id: int, chain: str, token: str):
+        self._apply(_IndexData.remove_token, user_id, chain, token.lower())
+
+    def remove_user_tokens(self, user_id: int):
+        self._apply(_IndexData.remove_user_tokens, user_id)
+
+    def remove_user(self, user_id: int):
+        self._apply(_IndexData.remove_user, user_id)
+
+    async def refresh_user(self, user_id: int):
+        """
+        Saca al usuario del índice y lo vuelve a indexar con lo que hay en la BD
+        (`/reset`): corrige su deriva sin esperar a la reconciliación.
+        """
+        if not self.loaded and self._replay is None:
+            return
+        async with AsyncSessionLocal() as session:
+            rows = (
+                await session.execute(_rows_query().where(User.user_id == user_id))
+            ).all()
+        self.remove_user(user_id)
+        for _, wallet, chain, token in rows:
+            self.set_wallet(user_id, wallet)
+            if token is not None:
+                self.add_token(user_id, chain, token)
+
+    # --- Carga y reconciliación con la BD ---
+
+    async def _build(self) -> _IndexData:
+        data = _IndexData()
+        async with AsyncSessionLocal() as session:
+            rows = await session.execute(_rows_query())
+            for user_id, wallet, chain, token in rows:
+                if user_id not in data.user_wallets:
+                    data.set_wallet(user_id, wallet.lower())
+                if token is not None:
+                    data.add_token(user_id, chain, token.lower())
+        return data
+
+    async def load(self) -> int:
+        """
+        Reconstruye el índice desde la BD (una consulta) y lo sustituye entero.
+        Devuelve cuántas wallets han cambiado respecto al índice anterior; si ya
+        hay una carga en curso se espera a ella.
+        """
+        drift, _ = await self._loads.run("load", self._load)
+        return drift
+
+    async def _load(self) -> int:
+        started = time.perf_counter()
+        self._replay = []
+        try:
+            data = await self._build()
+            for op, args in self._replay:
+                op(data, *args)
+        finally:
+            self._replay = None
+        drift = _diff(self._data, data) if self.loaded else 0
+        self._data, self.loaded = data, True
+        for kind, value in self.stats().items():
+            metrics.WALLET_INDEX_ENTRIES.labels(kind=kind).set(value)
+        if drift:
+            metrics.WALLET_INDEX_DRIFT.inc(drift)
+            logger.warning(f"Índice de wallets reconciliado: {drift} wallets corregidas.")
+        logger.debug(
+            f"Índice de wallets cargado en {time.perf_counter() - started:.2f}s: {self.stats()}"
+        )
+        return drift
+
+
+def _rows_query():
+    """(usuario, wallet, cadena, token) por usuario con wallet; token None si no sigue ninguno."""
+    return (
+        select(
+            User.user_id,
+            User.wallet_address,
+            UserToken.chain,
+            UserToken.token_address,
+        )
+        .outerjoin(UserToken, UserToken.user_id == User.user_id)
+        .where(User.wallet_address != "")
+    )
+
+
+def _diff(old: _IndexData, new: _IndexData) -> int:
+    """Número de (cadena, wallet) cuyo contenido difiere entre dos índices."""
+    changed = 0
+    for chain in old.chains.keys() | new.chains.keys():
+        old_wallets = old.chains.get(chain, {})
+        new_wallets = new.chains.get(chain, {})
+        changed += sum(1 for w, e in new_wallets.items() if old_wallets.get(w) != e)
+        changed += sum(1 for w in old_wallets if w not in new_wallets)
+    return changed
+
+
+wallet_index = WalletIndex()
@@ -0,0 +1,71 @@
+# src/watcher/base.py
+import aiohttp
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional, Tuple
+from src.config.settings import settings
+from src.chains import DEFAULT_CHAIN, get_chain
+from src.deposits import Deposit
+
+
+class WatcherBackend(ABC):
+    """
+    Fuente de depósitos ERC-20 de una cadena. Todas las implementaciones
+    devuelven registros `Deposit` normalizados (más recientes primero).
+    """
+
+    name: str = ""
+    chain: str = DEFAULT_CHAIN
+
+    @abstractmethod
+    async def get_wallet_deposits(
+        self,
+        wallet_address: str,
+        token_addresses_to_monitor: List[str],
+        client_session: aiohttp.ClientSession,
+    ) -> List[Deposit]: ...
+
+    @abstractmethod
+    async def get_block_number(self, client_session: aiohttp.ClientSession) -> int:
+        """Último bloque de la cadena."""
+
+    @abstractmethod
+    async def get_transaction_blocks(
+        self, tx_hashes: List[str], client_session: aiohttp.ClientSession
+    ) -> Dict[str, Optional[int]]:
+        """
+        Bloque en el que está incluida cada transacción, o None si la cadena
+        ya no la conoce (p. ej. tras un reorg).
+        """
+
+    def available(self) -> bool:
+        """
+        False si la fuente se sabe caída (circuito abierto): el sondeo se salta
+        el ciclo en lugar de fallar usuario a usuario.
+        """
+        return True
+
+
+_backends: Dict[Tuple[str, str], WatcherBackend] = {}
+
+
+def get_backend(
+    name: Optional[str] = None, chain: str = DEFAULT_CHAIN
+) -> WatcherBackend:
+    """
+    Devuelve (y reutiliza) el backend configurado en `settings.watcher_backend`
+    para la cadena indicada.
+    """
+    name = (name or settings.watcher_backend).lower()
+    chain = get_chain(chain).name
+    if (name, chain) not in _backends:
+        if name == "moralis":
+            from src.watcher.moralis import MoralisBackend
+
+            _backends[name, chain] = MoralisBackend(chain=chain)
+        elif name == "rpc":
+            from src.watcher.rpc import RpcBackend
+
+            _backends[name, chain] = RpcBackend(chain=chain)
+        else:
+            raise ValueError(f"Backend de watcher desconocido: {name}")
+    return _backends[name, chain]
@@ -0,0 +1,181 @@
+# src/watcher/decoding.py
+"""
+Decodificación de las respuestas de Moralis a registros compactos.
+
+Solo se conservan los campos que usan `get_wallet_deposits` y
+`get_wallet_token_balances`; el resto de cada transacción (logs, transfers
+nativos, NFTs, etiquetas...) se descarta al decodificar. El decodificador se
+elige con `settings.json_decoder`:
+
+- "msgspec": decodifica directamente a las dataclasses, sin crear los dicts
+  intermedios ni los campos que no se usan (el más rápido y el que menos
+  memoria usa).
+- "orjson": decodificación rápida a dicts que luego se compactan.
+- "json": la librería estándar, siempre disponible.
+- "auto" (por defecto): el primero instalado de los anteriores
+  (`pip install .[fast-json]`).
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from src.config.settings import settings
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depende del entorno
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+DECODERS = ("auto", "msgspec", "orjson", "json")
+
+
+class PayloadDecodeError(ValueError):
+    """La respuesta de Moralis no es JSON válido o no tiene la forma esperada."""
+
+
+@dataclass(slots=True)
+class Erc20Transfer:
+    address: Optional[str] = None
+    token_symbol: Optional[str] = None
+    value: Optional[str] = None
+    value_formatted: Optional[str] = None
+    from_address: Optional[str] = None
+    to_address: Optional[str] = None
+
+
+@dataclass(slots=True)
+class HistoryTransaction:
+    hash: Optional[str] = None
+    block_timestamp: Optional[str] = None
+    block_number: Union[int, str, None] = None
+    # Moralis a veces manda null en vez de []: todos los decodificadores lo normalizan
+    erc20_transfers: Optional[List[Erc20Transfer]] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.erc20_transfers is None:
+            self.erc20_transfers = []
+
+
+@dataclass(slots=True)
+class HistoryPage:
+    result: Optional[List[HistoryTransaction]] = field(default_factory=list)
+    cursor: Optional[str] = None
+
+    def __post_init__(self):
+        if self.result is None:
+            self.result = []
+
+
+@dataclass(slots=True)
+class TokenBalanceEntry:
+    token_address: Optional[str] = None
+    symbol: Optional[str] = None
+    decimals: Union[int, str, None] = None
+    balance: Optional[str] = None
+    usd_value: Optional[float] = None
+
+
+@dataclass(slots=True)
+class TokenBalancesPage:
+    result: Optional[List[TokenBalanceEntry]] = field(default_factory=list)
+    cursor: Optional[str] = None
+
+    def __post_init__(self):
+        if self.result is None:
+            self.result = []
+
+
+def _pick(data: Dict[str, Any], cls) -> Dict[str, Any]:
+    return {name: data.get(name) for name in cls.__slots__}
+
+
+def _history_from_dict(data: Dict[str, Any]) -> HistoryPage:
+    return HistoryPage(
+        result=[
+            HistoryTransaction(
+                hash=tx.get("hash"),
+                block_timestamp=tx.get("block_timestamp"),
+                block_number=tx.get("block_number"),
+                erc20_transfers=[
+                    Erc20Transfer(**_pick(transfer, Erc20Transfer))
+                    for transfer in tx.get("erc20_transfers") or []
+                ],
+            )
+            for tx in data.get("result") or []
+        ],
+        cursor=data.get("cursor"),
+    )
+
+
+def _balances_from_dict(data: Dict[str, Any]) -> TokenBalancesPage:
+    return TokenBalancesPage(
+        result=[
+            TokenBalanceEntry(**_pick(token, TokenBalanceEntry))
+            for token in data.get("result") or []
+        ],
+        cursor=data.get("cursor"),
+    )
+
+
+def resolve_decoder(name: Optional[str] = None) -> str:
+    """Nombre del decodificador efectivo para `name` (o el configurado)."""
+    name = (name or settings.json_decoder).lower()
+    if name not in DECODERS:
+        raise ValueError(f"Decodificador JSON desconocido: {name}")
+    if name == "auto":
+        if msgspec is not None:
+            return "msgspec"
+        return "orjson" if orjson is not None else "json"
+    if (name == "msgspec" and msgspec is None) or (name == "orjson" and orjson is None):
+        raise ValueError(f"json_decoder={name} pero la librería no está instalada")
+    return name
+
+
+def _make_decoder(page_cls, from_dict: Callable, name: str) -> Callable[[bytes], Any]:
+    if name == "msgspec":
+        decoder = msgspec.json.Decoder(page_cls)
+
+        def decode(body: bytes):
+            try:
+                return decoder.decode(body)
+            except msgspec.MsgspecError as e:
+                raise PayloadDecodeError(str(e)) from e
+
+        return decode
+
+    loads = orjson.loads if name == "orjson" else json.loads
+
+    def decode(body: bytes):
+        try:
+            data = loads(body)
+        except ValueError as e:  # JSONDecodeError y orjson.JSONDecodeError
+            raise PayloadDecodeError(str(e)) from e
+        if not isinstance(data, dict):
+            raise PayloadDecodeError(f"Se esperaba un objeto JSON: {type(data).__name__}")
+        return from_dict(data)
+
+    return decode
+
+
+_decoders: Dict[tuple, Callable[[bytes], Any]] = {}
+
+
+def _decoder_for(page_cls, from_dict: Callable, name: Optional[str]):
+    resolved = resolve_decoder(name)
+    key = (page_cls, resolved)
+    if key not in _decoders:
+        _decoders[key] = _make_decoder(page_cls, from_dict, resolved)
+    return _decoders[key]
+
+
+def decode_history_page(body: bytes, decoder: Optional[str] = None) -> HistoryPage:
+    return _decoder_for(HistoryPage, _history_from_dict, decoder)(body)
+
+
+def decode_token_balances(body: bytes, decoder: Optional[str] = None) -> TokenBalancesPage:
+    return _decoder_for(TokenBalancesPage, _balances_from_dict, decoder)(body)
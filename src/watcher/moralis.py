@@ -1,7 +1,8 @@
 import aiohttp
 import json  # Importar json para JsonDecodeError
+import logging
 from src.config.settings import settings
-from typing import List, Dict, Any
+from typing import List, Dict
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -10,14 +11,179 @@ from tenacity import (
 )
 from aiohttp import ClientError, ClientResponseError
 import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from src import metrics, tracing
 from src.config.logger_config import logger  # Importar el logger
+from src.chains import DEFAULT_CHAIN, get_chain
+from src.deposits import Deposit, parse_timestamp
+from src.watcher.base import WatcherBackend
+from src.utils.circuitbreaker import CircuitBreaker, CircuitOpenError
+from src.utils.offload import decode_json, maybe_offload
+from src.watcher.decoding import (
+    HistoryTransaction,
+    PayloadDecodeError,
+    TokenBalanceEntry,
+    decode_history_page,
+    decode_token_balances,
+)
+
+MORALIS_BASE = settings.moralis_base_url.rstrip("/")
+
+# El límite de Moralis es por API key, no por cadena: todas las cadenas comparten
+# el mismo semáforo (uno por event loop)
+_request_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _moralis_slot() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _request_slots:
+        _request_slots[loop] = asyncio.Semaphore(settings.moralis_max_concurrency)
+    return _request_slots[loop]
+
+
+# Un circuito por endpoint: con Moralis caído las llamadas fallan al instante
+# en lugar de agotar los reintentos de tenacity para cada usuario
+_breakers: Dict[str, CircuitBreaker] = {}
+
+_CIRCUIT_STATE_VALUES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
+
+
+def circuit_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(
+            endpoint,
+            settings.moralis_circuit_failures,
+            settings.moralis_circuit_reset,
+        )
+    return breaker
+
+
+def available(endpoint: str = "wallet_history") -> bool:
+    """False mientras el circuito del endpoint está abierto (Moralis no responde)."""
+    return circuit_breaker(endpoint).state != CircuitBreaker.OPEN
+
+
+def _collect_circuit_metrics():
+    for endpoint, breaker in list(_breakers.items()):
+        metrics.MORALIS_CIRCUIT_STATE.labels(endpoint=endpoint).set(
+            _CIRCUIT_STATE_VALUES[breaker.state]
+        )
 
-MORALIS_BASE = "https://deep-index.moralis.io/api/v2.2"
+
+metrics.REGISTRY.add_collector(_collect_circuit_metrics)
+
+
+@asynccontextmanager
+async def _moralis_get(
+    endpoint: str, client_session: aiohttp.ClientSession, url: str, **kwargs
+):
+    """
+    GET a Moralis con el límite compartido, el circuito del endpoint y las
+    métricas. Lanza CircuitOpenError sin llamar si el circuito está abierto.
+    """
+    breaker = circuit_breaker(endpoint)
+    async with _moralis_slot():
+        # Se comprueba ya con hueco: las peticiones en cola también fallan rápido
+        if not breaker.allow():
+            metrics.MORALIS_CIRCUIT_REJECTED.labels(endpoint=endpoint).inc()
+            raise CircuitOpenError(f"moralis:{endpoint}", breaker.retry_after())
+        started = time.perf_counter()
+        recorded = False
+        try:
+            async with client_session.get(url, **kwargs) as resp:
+                metrics.MORALIS_RESPONSES.labels(
+                    endpoint=endpoint, status=resp.status
+                ).inc()
+                if resp.status == 429:
+                    metrics.MORALIS_RATE_LIMITED.labels(endpoint=endpoint).inc()
+                # Un 429 es nuestro límite, no una caída: solo cuentan los 5xx
+                if resp.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                recorded = True
+                yield resp
+        except (ClientError, asyncio.TimeoutError):
+            if not recorded:
+                breaker.record_failure()
+            raise
+        finally:
+            metrics.MORALIS_REQUEST_SECONDS.labels(endpoint=endpoint).observe(
+                time.perf_counter() - started
+            )
+
+
+def _record_retry(endpoint: str):
+    """`before_sleep` de tenacity: cuenta el reintento con la clave del endpoint."""
+
+    def record(retry_state):
+        metrics.MORALIS_RETRIES.labels(endpoint=endpoint).inc()
+
+    return record
+
+
+def _stop_if_circuit_open(endpoint: str):
+    """Condición de parada de tenacity: con el circuito del endpoint abierto no se reintenta."""
+
+    def stop(retry_state) -> bool:
+        return not available(endpoint)
+
+    return stop
+
+
+def _extract_deposits(
+    all_transactions: List[HistoryTransaction],
+    wallet_address: str,
+    token_addresses_to_monitor: List[str],
+    chain: str,
+) -> List[Deposit]:
+    """Aplana las transferencias ERC20 entrantes de los tokens monitorizados."""
+    wallet = wallet_address.lower()
+    monitored = {addr.lower() for addr in token_addresses_to_monitor}
+    processed_deposits = []
+    for tx in all_transactions:
+        timestamp = None
+        # Consideramos solo ERC20_transfers para depósitos de tokens
+        for erc20_transfer in tx.erc20_transfers:
+            # Es un depósito si to_address coincide con nuestra wallet_address
+            # y el token está en nuestra lista de monitorización
+            token_address = (erc20_transfer.address or "").lower()
+            if (
+                (erc20_transfer.to_address or "").lower() == wallet
+                and token_address in monitored
+            ):
+                if timestamp is None:
+                    timestamp = parse_timestamp(tx.block_timestamp)
+                processed_deposits.append(
+                    Deposit(
+                        tx_hash=tx.hash or "",
+                        token_address=token_address,
+                        token_symbol=erc20_transfer.token_symbol or "UNKNOWN",
+                        amount_raw=int(erc20_transfer.value or 0),
+                        amount=erc20_transfer.value_formatted or "0",
+                        timestamp=timestamp,
+                        from_address=(erc20_transfer.from_address or "").lower(),
+                        to_address=wallet,
+                        block_number=int(tx.block_number or 0),
+                        chain=chain,
+                    )
+                )
+    return processed_deposits
 
 
 # Decorador de reintentos para excepciones de cliente, timeout y errores 5x
 @retry(
-    stop=stop_after_attempt(3),  # Intentar 3 veces
+    # 3 intentos, o menos si Moralis no responde
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("wallet_history"),
     wait=wait_exponential(
         multiplier=1, min=4, max=10
     ),  # Espera exponencial entre 4 y 10 segundos
@@ -26,12 +192,14 @@ MORALIS_BASE = "https://deep-index.moralis.io/api/v2.2"
         | retry_if_exception_type(ClientError)
         | retry_if_exception_type(asyncio.TimeoutError)
     ),
+    before_sleep=_record_retry("wallet_history"),
 )
 async def get_wallet_deposits(
     wallet_address: str,
     token_addresses_to_monitor: List[str],
     client_session: aiohttp.ClientSession,
-) -> List[Dict[Any, Any]]:
+    chain: str = DEFAULT_CHAIN,
+) -> List[Deposit]:
     """
     Obtiene todos los depósitos entrantes para tokens específicos en una wallet
     usando Moralis Wallet History API, implementando paginación y aplanando
@@ -44,13 +212,15 @@ async def get_wallet_deposits(
 
     all_transactions = []
     cursor = None
+    pages = 0
+    total_bytes = 0
     page_limit = (
         50  # Aumentar el límite de la página para obtener más transacciones por llamada
     )
 
     while True:
         params = {
-            "chain": "polygon",
+            "chain": get_chain(chain).moralis_id,
             "order": "DESC",
             "limit": page_limit,
         }
@@ -58,8 +228,12 @@ async def get_wallet_deposits(
             params["cursor"] = cursor
         logger.debug(f"Moralis - get_wallet_deposits: Request Params: {params}")
 
-        async with client_session.get(
-            url, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=30)
+        async with _moralis_get(
+            "wallet_history",
+            client_session,
+            url,
+            headers=headers,
+            params=params,
         ) as resp:
             logger.debug(
                 f"Moralis - get_wallet_deposits: Response Status: {resp.status}"
@@ -77,12 +251,18 @@ async def get_wallet_deposits(
                     message=f"Moralis API error: {text}",
                     headers=resp.headers,
                 )
-            try:
-                data = await resp.json()
+            body = await resp.read()
+            tracing.record(pages=1, bytes=len(body))
+            total_bytes += len(body)
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(
-                    f"Moralis - get_wallet_deposits: Response Data: {json.dumps(data)}"
+                    f"Moralis - get_wallet_deposits: Response Data: {body.decode(errors='replace')}"
                 )
-            except json.JSONDecodeError as e:
+            try:
+                page = await maybe_offload(
+                    len(body), settings.offload_json_bytes, decode_history_page, body
+                )
+            except PayloadDecodeError as e:
                 text = await resp.text()
                 logger.error(
                     f"Error decodificando JSON de Moralis en get_wallet_deposits: {e}. Respuesta: {text}",
@@ -90,55 +270,168 @@ async def get_wallet_deposits(
                 )
                 raise ClientError("Error de formato JSON de Moralis") from e
 
-            all_transactions.extend(data.get("result", []))
+            all_transactions.extend(page.result)
+            pages += 1
 
-            cursor = data.get("cursor")
+            cursor = page.cursor
             if not cursor:
                 break  # No hay más páginas
 
-    processed_deposits = []
-    for tx in all_transactions:
-        tx_hash = tx.get("hash")
-        block_timestamp = tx.get("block_timestamp")
-        # Consideramos solo ERC20_transfers para depósitos de tokens
-        for erc20_transfer in tx.get("erc20_transfers", []):
-            # Es un depósito si to_address coincide con nuestra wallet_address
-            # y el token está en nuestra lista de monitorización
-            if erc20_transfer.get(
-                "to_address", ""
-            ).lower() == wallet_address.lower() and erc20_transfer.get(
-                "address", ""
-            ).lower() in [
-                addr.lower() for addr in token_addresses_to_monitor
-            ]:
-                processed_deposits.append(
-                    {
-                        "hash": tx_hash,
-                        "token_address": erc20_transfer.get("address", ""),
-                        "token_symbol": erc20_transfer.get("token_symbol", "UNKNOWN"),
-                        "amount_raw": erc20_transfer.get("value", "0"),  # Raw amount
-                        "amount": erc20_transfer.get(
-                            "value_formatted", "0"
-                        ),  # Formatted amount for display
-                        "block_timestamp": block_timestamp,
-                        "from_address": erc20_transfer.get("from_address", ""),
-                    }
-                )
-    return processed_deposits
+    metrics.MORALIS_PAGES_PER_WALLET.labels(chain=chain).observe(pages)
+
+    # Historiales enormes: el aplanado se hace fuera del event loop
+    return await maybe_offload(
+        total_bytes,
+        settings.offload_json_bytes,
+        _extract_deposits,
+        all_transactions,
+        wallet_address,
+        token_addresses_to_monitor,
+        chain,
+    )
 
 
 @retry(
-    stop=stop_after_attempt(3),
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("date_to_block"),
     wait=wait_exponential(multiplier=1, min=4, max=10),
     retry=(
         retry_if_exception_type(ClientResponseError)
         | retry_if_exception_type(ClientError)
         | retry_if_exception_type(asyncio.TimeoutError)
     ),
+    before_sleep=_record_retry("date_to_block"),
+)
+async def get_latest_block_number(
+    client_session: aiohttp.ClientSession, chain: str = DEFAULT_CHAIN
+) -> int:
+    """
+    Obtiene el último bloque de la cadena usando el endpoint dateToBlock con la
+    fecha actual.
+    """
+    url = f"{MORALIS_BASE}/dateToBlock"
+    headers = {"X-API-Key": settings.moralis_api_key, "accept": "application/json"}
+    params = {"chain": get_chain(chain).moralis_id, "date": str(int(time.time()))}
+    logger.debug(f"Moralis - get_latest_block_number: Request Params: {params}")
+
+    async with _moralis_get(
+        "date_to_block",
+        client_session,
+        url,
+        headers=headers,
+        params=params,
+    ) as resp:
+        if resp.status != 200:
+            text = await resp.text()
+            logger.error(
+                f"Moralis API error en get_latest_block_number {resp.status}: {text}"
+            )
+            raise ClientResponseError(
+                request_info=resp.request_info,
+                history=resp.history,
+                status=resp.status,
+                message=f"Moralis API error: {text}",
+                headers=resp.headers,
+            )
+        data = await resp.json()
+        return int(data.get("block", 0))
+
+
+@retry(
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("transaction"),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    retry=(
+        retry_if_exception_type(ClientResponseError)
+        | retry_if_exception_type(ClientError)
+        | retry_if_exception_type(asyncio.TimeoutError)
+    ),
+    before_sleep=_record_retry("transaction"),
+)
+async def get_transaction_block(
+    tx_hash: str, client_session: aiohttp.ClientSession, chain: str = DEFAULT_CHAIN
+) -> int | None:
+    """
+    Devuelve el bloque de una transacción, o None si Moralis ya no la encuentra
+    (404), por ejemplo porque un reorg la ha eliminado.
+    """
+    url = f"{MORALIS_BASE}/transaction/{tx_hash}"
+    headers = {"X-API-Key": settings.moralis_api_key, "accept": "application/json"}
+    params = {"chain": get_chain(chain).moralis_id}
+
+    async with _moralis_get(
+        "transaction",
+        client_session,
+        url,
+        headers=headers,
+        params=params,
+    ) as resp:
+        if resp.status == 404:
+            return None
+        if resp.status != 200:
+            text = await resp.text()
+            logger.error(f"Moralis API error en get_transaction_block {resp.status}: {text}")
+            raise ClientResponseError(
+                request_info=resp.request_info,
+                history=resp.history,
+                status=resp.status,
+                message=f"Moralis API error: {text}",
+                headers=resp.headers,
+            )
+        data = await resp.json()
+        block_number = data.get("block_number")
+        return int(block_number) if block_number else None
+
+
+class MoralisBackend(WatcherBackend):
+    """Backend por wallet sobre la Wallet History API de Moralis, para una cadena."""
+
+    name = "moralis"
+
+    def __init__(self, chain: str = DEFAULT_CHAIN):
+        self.chain = get_chain(chain).name
+
+    async def get_wallet_deposits(
+        self,
+        wallet_address: str,
+        token_addresses_to_monitor: List[str],
+        client_session: aiohttp.ClientSession,
+    ) -> List[Deposit]:
+        return await get_wallet_deposits(
+            wallet_address, token_addresses_to_monitor, client_session, self.chain
+        )
+
+    async def get_block_number(self, client_session: aiohttp.ClientSession) -> int:
+        return await get_latest_block_number(client_session, self.chain)
+
+    def available(self) -> bool:
+        return available("wallet_history")
+
+    async def get_transaction_blocks(
+        self, tx_hashes: List[str], client_session: aiohttp.ClientSession
+    ) -> Dict[str, int | None]:
+        # Moralis no tiene batch: la concurrencia la limita el semáforo compartido
+        async def fetch(tx_hash: str):
+            return tx_hash, await get_transaction_block(
+                tx_hash, client_session, self.chain
+            )
+
+        return dict(await asyncio.gather(*(fetch(h) for h in tx_hashes)))
+
+
+@retry(
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("wallet_tokens"),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    retry=(
+        retry_if_exception_type(ClientResponseError)
+        | retry_if_exception_type(ClientError)
+        | retry_if_exception_type(asyncio.TimeoutError)
+    ),
+    before_sleep=_record_retry("wallet_tokens"),
 )
 async def get_wallet_token_balances(
-    wallet_address: str, client_session: aiohttp.ClientSession
-) -> List[Dict[Any, Any]]:
+    wallet_address: str,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+) -> List[TokenBalanceEntry]:
     """
     Obtiene los balances de todos los tokens ERC20 para una wallet específica,
     usando el endpoint de Moralis Wallet API y manejando paginación.
@@ -148,21 +441,25 @@ async def get_wallet_token_balances(
     logger.debug(f"Moralis - get_wallet_token_balances: Request URL: {url}")
     logger.debug(f"Moralis - get_wallet_token_balances: Headers: {headers}")
 
-    all_tokens = []
+    all_tokens: List[TokenBalanceEntry] = []
     cursor = None
     page_limit = 50  # Número de tokens por página
 
     while True:
         params = {
-            "chain": "polygon",
+            "chain": get_chain(chain).moralis_id,
             "limit": page_limit,
         }
         if cursor:
             params["cursor"] = cursor
         logger.debug(f"Moralis - get_wallet_token_balances: Request Params: {params}")
 
-        async with client_session.get(
-            url, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=30)
+        async with _moralis_get(
+            "wallet_tokens",
+            client_session,
+            url,
+            headers=headers,
+            params=params,
         ) as resp:
             logger.debug(
                 f"Moralis - get_wallet_token_balances: Response Status: {resp.status}"
@@ -181,11 +478,15 @@ async def get_wallet_token_balances(
                     headers=resp.headers,
                 )
             try:
-                data = await resp.json()
-                logger.debug(
-                    f"Moralis - get_wallet_token_balances: Response Data: {json.dumps(data)}"
+                body = await resp.read()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        f"Moralis - get_wallet_token_balances: Response Data: {body.decode(errors='replace')}"
+                    )
+                page = await maybe_offload(
+                    len(body), settings.offload_json_bytes, decode_token_balances, body
                 )
-            except json.JSONDecodeError as e:
+            except PayloadDecodeError as e:
                 text = await resp.text()
                 logger.error(
                     f"Error decodificando JSON de Moralis en get_wallet_token_balances: {e}. Respuesta: {text}",
@@ -193,9 +494,9 @@ async def get_wallet_token_balances(
                 )
                 raise ClientError("Error de formato JSON de Moralis") from e
 
-            all_tokens.extend(data.get("result", []))
+            all_tokens.extend(page.result)
 
-            cursor = data.get("cursor")
+            cursor = page.cursor
             if not cursor:
                 break
 
@@ -203,16 +504,19 @@ async def get_wallet_token_balances(
 
 
 @retry(
-    stop=stop_after_attempt(3),
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("wallet_net_worth"),
     wait=wait_exponential(multiplier=1, min=4, max=10),
     retry=(
         retry_if_exception_type(ClientResponseError)
         | retry_if_exception_type(ClientError)
         | retry_if_exception_type(asyncio.TimeoutError)
     ),
+    before_sleep=_record_retry("wallet_net_worth"),
 )
 async def get_wallet_net_worth(
-    wallet_address: str, client_session: aiohttp.ClientSession
+    wallet_address: str,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
 ) -> str:
     """
     Obtiene el valor neto total en USD de una wallet.
@@ -220,14 +524,18 @@ async def get_wallet_net_worth(
     url = f"{MORALIS_BASE}/wallets/{wallet_address.lower()}/net-worth"
     headers = {"X-API-Key": settings.moralis_api_key, "accept": "application/json"}
     params = {
-        "chain": "polygon",
+        "chain": get_chain(chain).moralis_id,
         "exclude_spam": "true",
     }
     logger.debug(f"Moralis - get_wallet_net_worth: Request URL: {url}")
     logger.debug(f"Moralis - get_wallet_net_worth: Request Params: {params}")
 
-    async with client_session.get(
-        url, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=30)
+    async with _moralis_get(
+        "wallet_net_worth",
+        client_session,
+        url,
+        headers=headers,
+        params=params,
     ) as resp:
         logger.debug(f"Moralis - get_wallet_net_worth: Response Status: {resp.status}")
         if resp.status != 200:
@@ -245,10 +553,11 @@ async def get_wallet_net_worth(
             )
 
         try:
-            data = await resp.json()
-            logger.debug(
-                f"Moralis - get_wallet_net_worth: Response Data: {json.dumps(data)}"
-            )  # Usar json.dumps
+            data = await decode_json(await resp.read())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Moralis - get_wallet_net_worth: Response Data: {json.dumps(data)}"
+                )
         except json.JSONDecodeError as e:
             text = await resp.text()
             logger.error(
@@ -261,17 +570,21 @@ async def get_wallet_net_worth(
 
 
 @retry(
-    stop=stop_after_attempt(3),
+    stop=stop_after_attempt(3) | _stop_if_circuit_open("wallet_tokens"),
     wait=wait_exponential(multiplier=1, min=4, max=10),
     retry=(
         retry_if_exception_type(ClientResponseError)
         | retry_if_exception_type(ClientError)
         | retry_if_exception_type(asyncio.TimeoutError)
     ),
+    before_sleep=_record_retry("wallet_tokens"),
 )
 async def get_token_metadata(
-    wallet_address: str, token_address: str, client_session: aiohttp.ClientSession
-) -> Dict[str, Any] | None:
+    wallet_address: str,
+    token_address: str,
+    client_session: aiohttp.ClientSession,
+    chain: str = DEFAULT_CHAIN,
+) -> TokenBalanceEntry | None:
     """
     Obtiene los metadatos de un token ERC20 específico buscando
     dentro de los balances de la wallet.
@@ -283,7 +596,9 @@ async def get_token_metadata(
     )
 
     # Re-use the existing, reliable function
-    all_balances = await get_wallet_token_balances(wallet_address, client_session)
+    all_balances = await get_wallet_token_balances(
+        wallet_address, client_session, chain
+    )
 
     if not all_balances:
         logger.warning(
@@ -293,7 +608,7 @@ async def get_token_metadata(
 
     # Find the specific token in the list
     for token_data in all_balances:
-        if token_data.get("token_address", "").lower() == token_address.lower():
+        if (token_data.token_address or "").lower() == token_address.lower():
             logger.debug(
                 f"Metadatos encontrados para {token_address} via balances: {token_data}"
             )
@@ -0,0 +1,427 @@
+# src/watcher/rpc.py
+import asyncio
+import itertools
+from decimal import Decimal
+from typing import Any, Collection, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp import ClientError
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    retry_if_exception_type,
+)
+
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.chains import DEFAULT_CHAIN, get_chain
+from src.deposits import Deposit
+from src.utils.cache import TTLCache
+from src.watcher.base import WatcherBackend
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+DECIMALS_SELECTOR = "0x313ce567"  # decimals()
+SYMBOL_SELECTOR = "0x95d89b41"  # symbol()
+
+# Errores con los que los nodos indican que el rango de bloques es demasiado grande
+_RANGE_ERROR_CODES = {-32000, -32005, -32602, -32600}
+_RANGE_ERROR_HINTS = ("range", "limit", "too many", "more than", "exceed", "timeout")
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+
+    @property
+    def is_range_error(self) -> bool:
+        message = self.message.lower()
+        return self.code in _RANGE_ERROR_CODES and any(
+            hint in message for hint in _RANGE_ERROR_HINTS
+        )
+
+
+def address_to_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address.lower()[2:]
+
+
+def topic_to_address(topic: str) -> str:
+    return "0x" + topic[-40:].lower()
+
+
+def format_amount(raw: int, decimals: int) -> str:
+    value = (Decimal(raw) / (Decimal(10) ** decimals)).normalize()
+    return format(value, "f")
+
+
+def _decode_abi_string(result: str) -> Optional[str]:
+    data = bytes.fromhex(result[2:]) if result and result != "0x" else b""
+    if len(data) >= 64:
+        # string dinámico: offset (32) + longitud (32) + datos
+        offset = int.from_bytes(data[:32], "big")
+        length = int.from_bytes(data[offset : offset + 32], "big")
+        raw = data[offset + 32 : offset + 32 + length]
+    else:
+        raw = data.rstrip(b"\x00")  # Tokens antiguos devuelven bytes32
+    return raw.decode("utf-8", errors="ignore") or None
+
+
+class RpcClient:
+    """Cliente JSON-RPC mínimo con soporte de batch sobre una sesión aiohttp."""
+
+    def __init__(self, url: str, client_session: aiohttp.ClientSession):
+        self.url = url
+        self.client_session = client_session
+        self._ids = itertools.count(1)
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=(
+            retry_if_exception_type(ClientError)
+            | retry_if_exception_type(asyncio.TimeoutError)
+        ),
+    )
+    async def batch(self, calls: Sequence[Tuple[str, list]]) -> List[Any]:
+        """
+        Envía varias llamadas en una sola petición HTTP. Devuelve los resultados
+        en el mismo orden; los errores individuales se devuelven como `RpcError`.
+        Lanza `RpcError` si el nodo omite la respuesta de alguna llamada.
+        """
+        if not calls:
+            return []
+        payload = [
+            {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+            for method, params in calls
+        ]
+        async with self.client_session.post(
+            self.url, json=payload
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                logger.error(f"RPC error HTTP {resp.status}: {text}")
+                raise ClientError(f"RPC HTTP {resp.status}")
+            data = await resp.json(content_type=None)
+
+        if isinstance(data, dict):  # Algunos nodos responden un único error al batch entero
+            error = data.get("error") or {}
+            raise RpcError(error.get("code", 0), error.get("message", str(data)))
+        by_id = {item.get("id"): item for item in data}
+        results = []
+        for request in payload:
+            item = by_id.get(request["id"])
+            if item is None:
+                # Un resultado vacío pasaría por "no encontrado" (p. ej. recibo nulo)
+                raise RpcError(
+                    -32603, f"Respuesta batch sin id {request['id']} ({request['method']})"
+                )
+            if "error" in item:
+                results.append(
+                    RpcError(item["error"].get("code", 0), item["error"].get("message", ""))
+                )
+            else:
+                results.append(item.get("result"))
+        return results
+
+    async def call(self, method: str, params: list) -> Any:
+        (result,) = await self.batch([(method, params)])
+        if isinstance(result, RpcError):
+            raise result
+        return result
+
+
+class RpcBackend(WatcherBackend):
+    """
+    Backend que lee los eventos `Transfer` directamente de un nodo con eth_getLogs.
+    Un mismo escaneo de un rango de bloques sirve para cualquier número de
+    wallets: los logs se filtran por contrato en el nodo y por destinatario
+    contra un índice de wallets en memoria. Cada instancia apunta al nodo de
+    una cadena (`settings.rpc_urls`, o `rpc_url` para polygon).
+    """
+
+    name = "rpc"
+
+    def __init__(
+        self,
+        rpc_url: Optional[str] = None,
+        max_block_range: Optional[int] = None,
+        min_block_range: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        chain: str = DEFAULT_CHAIN,
+    ):
+        self.chain = get_chain(chain).name
+        self.rpc_url = rpc_url or settings.rpc_urls.get(self.chain)
+        if not self.rpc_url and self.chain == DEFAULT_CHAIN:
+            self.rpc_url = settings.rpc_url
+        self.max_block_range = max_block_range or settings.rpc_max_block_range
+        self.min_block_range = min_block_range or settings.rpc_min_block_range
+        self.batch_size = batch_size or settings.rpc_batch_size
+        # Tamaño de rango actual: se adapta según las respuestas del nodo.
+        # Tras un rechazo se busca por bisección entre el mayor rango aceptado
+        # y el menor rechazado; el techo se olvida tras una racha de éxitos.
+        self.block_range = self.max_block_range
+        self._range_ok = 0
+        self._range_ceiling: Optional[int] = None
+        self._range_successes = 0
+        self._block_timestamps = TTLCache(maxsize=50_000)
+        self._token_metadata: Dict[str, Tuple[int, str]] = {}
+
+    def client(self, client_session: aiohttp.ClientSession) -> RpcClient:
+        if not self.rpc_url:
+            raise ValueError(
+                f"watcher_backend='rpc' requiere configurar un nodo para {self.chain}"
+            )
+        return RpcClient(self.rpc_url, client_session)
+
+    async def get_block_number(self, client_session: aiohttp.ClientSession) -> int:
+        return int(await self.client(client_session).call("eth_blockNumber", []), 16)
+
+    async def get_logs(
+        self,
+        rpc: RpcClient,
+        from_block: int,
+        to_block: int,
+        token_addresses: Collection[str],
+        to_topics: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        eth_getLogs de `Transfer` sobre [from_block, to_block] en trozos de tamaño
+        adaptativo, enviando hasta `batch_size` trozos por petición HTTP. Si el
+        nodo rechaza un rango se reduce a la mitad; tras un batch correcto crece.
+        """
+        topics = [TRANSFER_TOPIC, None, to_topics] if to_topics else [TRANSFER_TOPIC]
+        addresses = sorted({addr.lower() for addr in token_addresses})
+        logs: List[Dict[str, Any]] = []
+        start = from_block
+
+        while start <= to_block:
+            ranges = []
+            chunk_start = start
+            while chunk_start <= to_block and len(ranges) < self.batch_size:
+                chunk_end = min(chunk_start + self.block_range - 1, to_block)
+                ranges.append((chunk_start, chunk_end))
+                chunk_start = chunk_end + 1
+
+            results = await rpc.batch(
+                [
+                    (
+                        "eth_getLogs",
+                        [
+                            {
+                                "fromBlock": hex(range_start),
+                                "toBlock": hex(range_end),
+                                "address": addresses,
+                                "topics": topics,
+                            }
+                        ],
+                    )
+                    for range_start, range_end in ranges
+                ]
+            )
+
+            failed = False
+            for (range_start, range_end), result in zip(ranges, results):
+                if isinstance(result, RpcError):
+                    if not result.is_range_error or self.block_range <= self.min_block_range:
+                        raise result
+                    self._shrink_block_range()
+                    logger.debug(
+                        f"RPC - rango demasiado grande en {range_start}-{range_end}, "
+                        f"reduciendo a {self.block_range} bloques"
+                    )
+                    start = range_start  # Se reintenta desde el primer trozo fallido
+                    failed = True
+                    break
+                logs.extend(result or [])
+                start = range_end + 1
+
+            if not failed:
+                self._grow_block_range(max(end - begin + 1 for begin, end in ranges))
+
+        return logs
+
+    def _shrink_block_range(self) -> None:
+        failed_size = self.block_range
+        self._range_ceiling = min(self._range_ceiling or failed_size, failed_size)
+        self._range_successes = 0
+        if self._range_ok and self._range_ok < failed_size:
+            self.block_range = self._range_ok
+        else:
+            self.block_range = failed_size // 2
+            self._range_ok = 0
+        self.block_range = max(self.min_block_range, self.block_range)
+
+    def _grow_block_range(self, largest_ok: int) -> None:
+        if largest_ok < self.block_range:
+            return  # Último trozo del escaneo: no ha probado el tamaño completo
+        self._range_ok = max(self._range_ok, largest_ok)
+        self._range_successes += 1
+        if self._range_ceiling and self._range_successes >= 50:
+            self._range_ceiling = None  # Los límites del nodo pueden haber cambiado
+        if self._range_ceiling:
+            if self._range_ceiling - self._range_ok > 1:
+                self.block_range = (self._range_ok + self._range_ceiling) // 2
+            else:
+                self.block_range = self._range_ok
+        else:
+            self.block_range = self.block_range * 2
+        self.block_range = min(self.max_block_range, self.block_range)
+
+    async def _load_block_timestamps(
+        self, rpc: RpcClient, block_numbers: Collection[int]
+    ) -> Dict[int, int]:
+        """
+        Timestamps de los bloques pedidos. Se devuelven en un dict propio y no
+        se leen luego de la caché: con muchos bloques en un mismo escaneo, la
+        caché puede haber expulsado ya los primeros que se cargaron.
+        """
+        timestamps: Dict[int, int] = {}
+        missing = []
+        for number in sorted(set(block_numbers)):
+            cached = self._block_timestamps.get(number)
+            if cached is None:
+                missing.append(number)
+            else:
+                timestamps[number] = cached
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i : i + self.batch_size]
+            results = await rpc.batch(
+                [("eth_getBlockByNumber", [hex(n), False]) for n in chunk]
+            )
+            for number, block in zip(chunk, results):
+                if isinstance(block, RpcError):
+                    raise block
+                timestamps[number] = int(block["timestamp"], 16)
+                self._block_timestamps.set(number, timestamps[number])
+        return timestamps
+
+    async def _load_token_metadata(
+        self, rpc: RpcClient, token_addresses: Collection[str]
+    ) -> None:
+        missing = sorted(
+            {addr.lower() for addr in token_addresses} - self._token_metadata.keys()
+        )
+        if not missing:
+            return
+        calls = []
+        for token in missing:
+            calls.append(("eth_call", [{"to": token, "data": DECIMALS_SELECTOR}, "latest"]))
+            calls.append(("eth_call", [{"to": token, "data": SYMBOL_SELECTOR}, "latest"]))
+        results = await rpc.batch(calls)
+        for index, token in enumerate(missing):
+            decimals_result, symbol_result = results[2 * index], results[2 * index + 1]
+            decimals = (
+                int(decimals_result, 16)
+                if isinstance(decimals_result, str) and decimals_result != "0x"
+                else 18
+            )
+            symbol = (
+                _decode_abi_string(symbol_result)
+                if isinstance(symbol_result, str)
+                else None
+            )
+            self._token_metadata[token] = (decimals, symbol or "UNKNOWN")
+
+    async def scan_transfers(
+        self,
+        from_block: int,
+        to_block: int,
+        token_addresses: Collection[str],
+        wallet_index: Collection[str],
+        client_session: aiohttp.ClientSession,
+    ) -> List[Deposit]:
+        """
+        Devuelve los depósitos del rango de bloques cuyo destinatario está en
+        `wallet_index` (cualquier colección con `in` O(1): set o dict por wallet).
+        Cada depósito incluye además `to_address`, `block_number` y `log_index`.
+        """
+        if not token_addresses or not wallet_index or from_block > to_block:
+            return []
+        rpc = self.client(client_session)
+        to_topics = (
+            [address_to_topic(w) for w in wallet_index]
+            if len(wallet_index) <= settings.rpc_max_topic_addresses
+            else None  # Demasiadas wallets para el filtro del nodo: se filtra aquí
+        )
+        logs = await self.get_logs(rpc, from_block, to_block, token_addresses, to_topics)
+
+        matched = []
+        for log in logs:
+            topics = log.get("topics") or []
+            if len(topics) < 3 or topics[0] != TRANSFER_TOPIC:
+                continue
+            to_address = topic_to_address(topics[2])
+            if to_address in wallet_index:
+                matched.append((log, to_address))
+        if not matched:
+            return []
+
+        timestamps = await self._load_block_timestamps(
+            rpc, [int(log["blockNumber"], 16) for log, _ in matched]
+        )
+        await self._load_token_metadata(rpc, {log["address"] for log, _ in matched})
+
+        deposits = []
+        for log, to_address in matched:
+            token_address = log["address"].lower()
+            block_number = int(log["blockNumber"], 16)
+            decimals, symbol = self._token_metadata[token_address]
+            raw_amount = int(log.get("data") or "0x0", 16)
+            deposits.append(
+                Deposit(
+                    tx_hash=log["transactionHash"],
+                    token_address=token_address,
+                    token_symbol=symbol,
+                    amount_raw=raw_amount,
+                    amount=format_amount(raw_amount, decimals),
+                    timestamp=timestamps[block_number],
+                    from_address=topic_to_address(log["topics"][1]),
+                    to_address=to_address,
+                    block_number=block_number,
+                    log_index=int(log.get("logIndex") or "0x0", 16),
+                    chain=self.chain,
+                )
+            )
+        return deposits
+
+    async def get_transaction_blocks(
+        self, tx_hashes: List[str], client_session: aiohttp.ClientSession
+    ) -> Dict[str, Optional[int]]:
+        rpc = self.client(client_session)
+        blocks: Dict[str, Optional[int]] = {}
+        for i in range(0, len(tx_hashes), self.batch_size):
+            chunk = tx_hashes[i : i + self.batch_size]
+            receipts = await rpc.batch(
+                [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in chunk]
+            )
+            for tx_hash, receipt in zip(chunk, receipts):
+                if isinstance(receipt, RpcError):
+                    raise receipt
+                blocks[tx_hash] = (
+                    int(receipt["blockNumber"], 16)
+                    if receipt and receipt.get("blockNumber")
+                    else None
+                )
+        return blocks
+
+    async def get_wallet_deposits(
+        self,
+        wallet_address: str,
+        token_addresses_to_monitor: List[str],
+        client_session: aiohttp.ClientSession,
+    ) -> List[Deposit]:
+        """Depósitos de una sola wallet en los últimos `rpc_lookback_blocks` bloques."""
+        latest = await self.get_block_number(client_session)
+        deposits = await self.scan_transfers(
+            max(0, latest - settings.rpc_lookback_blocks),
+            latest,
+            token_addresses_to_monitor,
+            {wallet_address.lower()},
+            client_session,
+        )
+        # Mismo orden que Moralis (más recientes primero)
+        deposits.sort(key=lambda d: (d.block_number, d.log_index), reverse=True)
+        return deposits
@@ -0,0 +1,104 @@
+# src/watcher/scanner.py
+import aiohttp
+from typing import Dict, List, Optional, Set
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.chains import DEFAULT_CHAIN
+from src.deposits import Deposit
+from src import metrics
+from src.models import AsyncSessionLocal, ScanState
+from src.services import persist_deposits
+from src.walletindex import WalletIndex, wallet_index
+from src.watcher.base import get_backend
+from src.watcher.rpc import RpcBackend
+
+
+def monitored_contracts(index: WalletIndex, chain: str = DEFAULT_CHAIN) -> Set[str]:
+    contracts = index.contracts(chain)
+    if chain == DEFAULT_CHAIN:  # Los contratos MYST están en Polygon
+        contracts |= {addr.lower() for addr in settings.myst_contracts}
+    return contracts
+
+
+class BlockScanner:
+    """
+    Modo escáner: en lugar de consultar el historial de cada usuario, recorre
+    una sola vez los bloques nuevos de la cadena buscando `Transfer` de todos
+    los contratos monitorizados y reparte cada evento entre los usuarios que
+    siguen esa (wallet, token). El trabajo por ciclo depende de las
+    transferencias nuevas, no del número de usuarios. Hay un escáner (y una
+    marca de agua) por cadena: `name` es la cadena. Los destinatarios salen
+    del índice de wallets en memoria (`src.walletindex`).
+    """
+
+    def __init__(
+        self,
+        backend: Optional[RpcBackend] = None,
+        name: str = DEFAULT_CHAIN,
+        index: Optional[WalletIndex] = None,
+    ):
+        self.backend = backend or get_backend("rpc", chain=name)
+        self.name = name
+        self.index = index if index is not None else wallet_index
+
+    async def _load_watermark(self) -> Optional[int]:
+        async with AsyncSessionLocal() as session:
+            state = await session.get(ScanState, self.name)
+            return state.last_block if state else None
+
+    async def run_cycle(
+        self, client_session: aiohttp.ClientSession
+    ) -> Dict[int, List[Deposit]]:
+        """
+        Escanea desde la marca de agua hasta la cabeza de la cadena (como mucho
+        `scanner_max_blocks` bloques), guarda los depósitos nuevos y avanza la
+        marca en la misma transacción. Devuelve {user_id: depósitos nuevos}.
+        """
+        if not self.index.loaded:
+            await self.index.load()
+        wallets = self.index.wallets(self.name)
+        head = await self.backend.get_block_number(client_session)
+        last_block = await self._load_watermark()
+        from_block = (
+            last_block + 1
+            if last_block is not None
+            else max(0, head - settings.rpc_lookback_blocks)
+        )
+        to_block = min(head, from_block + settings.scanner_max_blocks - 1)
+        if from_block > to_block:
+            return {}
+
+        deposits = []
+        if wallets:
+            deposits = await self.backend.scan_transfers(
+                from_block,
+                to_block,
+                monitored_contracts(self.index, self.name),
+                wallets,
+                client_session,
+            )
+
+        deposits_by_user: Dict[int, List[Deposit]] = {}
+        for d in deposits:
+            for user_id in self.index.users_for(self.name, d.to_address, d.token_address):
+                deposits_by_user.setdefault(user_id, []).append(d)
+
+        db_timer = metrics.DB_TRANSACTION_SECONDS.labels(operation="scanner_cycle").time()
+        async with AsyncSessionLocal() as session:
+            async with db_timer, session.begin():
+                new_by_user = await persist_deposits(
+                    session, deposits_by_user, chain=self.name
+                )
+                state = await session.get(ScanState, self.name)
+                if state:
+                    state.last_block = to_block
+                else:
+                    session.add(ScanState(scanner=self.name, last_block=to_block))
+
+        logger.info(
+            f"Escáner {self.name}: bloques {from_block}-{to_block}, "
+            f"{len(deposits)} transferencias relevantes, "
+            f"{sum(len(v) for v in new_by_user.values())} depósitos nuevos "
+            f"para {len(new_by_user)} usuarios."
+        )
+        return new_by_user
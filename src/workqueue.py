@@ -0,0 +1,130 @@
+# src/workqueue.py
+"""
+Cola local sobre la tabla `work_queue` para separar el bot en procesos.
+
+Con process_role="bot" un proceso atiende los comandos de Telegram y envía los
+avisos; con process_role="poller" otro sondea y resuelve los /check. El bot
+encola las peticiones de /check (TOPIC_CHECK) y el sondeador encola los
+avisos (TOPIC_NOTIFY), así cada lado se dimensiona y reinicia por separado.
+
+La entrega es al menos una vez: un consumidor reclama un lote hasta
+`visible_at` y borra cada mensaje al procesarlo. Si muere antes, el mensaje
+vuelve a la cola al pasar `queue_visibility_timeout`; tras
+`queue_max_attempts` intentos se descarta.
+"""
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+
+from src.config.settings import settings
+from src.config.logger_config import logger
+from src.leases import poller_id
+from src.models import AsyncSessionLocal, QueueMessage
+
+TOPIC_CHECK = "check"  # {"user_id", "reset"?}: bot -> poller
+TOPIC_NOTIFY = "notify"  # {"chat_id", "text", "parse_mode"}: poller -> bot
+
+
+async def enqueue(topic: str, payload: dict):
+    now = time.time()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            session.add(
+                QueueMessage(
+                    topic=topic,
+                    payload=json.dumps(payload),
+                    created_at=now,
+                    visible_at=now,
+                )
+            )
+
+
+async def claim(
+    topic: str, owner: Optional[str] = None, limit: Optional[int] = None
+) -> List[Tuple[int, dict]]:
+    """Reclama hasta `limit` mensajes visibles, en orden de llegada."""
+    now = time.time()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            visible = (
+                select(QueueMessage.id)
+                .where(QueueMessage.topic == topic, QueueMessage.visible_at <= now)
+                .order_by(QueueMessage.id)
+                .limit(limit or settings.queue_batch_size)
+            )
+            result = await session.execute(
+                update(QueueMessage)
+                .where(QueueMessage.id.in_(visible))
+                .values(
+                    claimed_by=owner or poller_id(),
+                    visible_at=now + settings.queue_visibility_timeout,
+                    attempts=QueueMessage.attempts + 1,
+                )
+                .returning(QueueMessage.id, QueueMessage.payload, QueueMessage.attempts)
+            )
+            rows = sorted(result.all())
+            exhausted = [id_ for id_, _, attempts in rows if attempts > settings.queue_max_attempts]
+            if exhausted:
+                logger.error(
+                    f"Descartados {len(exhausted)} mensajes de {topic} tras "
+                    f"{settings.queue_max_attempts} intentos: {exhausted}"
+                )
+                await session.execute(
+                    delete(QueueMessage).where(QueueMessage.id.in_(exhausted))
+                )
+    return [
+        (id_, json.loads(payload))
+        for id_, payload, attempts in rows
+        if attempts <= settings.queue_max_attempts
+    ]
+
+
+async def ack(message_id: int):
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(delete(QueueMessage).where(QueueMessage.id == message_id))
+
+
+async def consume_once(
+    topic: str, handler: Callable[[dict], Awaitable[None]], owner: Optional[str] = None
+) -> int:
+    """
+    Procesa un lote en orden. Un mensaje que falla se queda sin confirmar y
+    se reintenta cuando vuelve a ser visible. Devuelve los mensajes reclamados.
+    """
+    messages = await claim(topic, owner)
+    for message_id, payload in messages:
+        try:
+            await handler(payload)
+        except Exception as e:
+            logger.error(f"Error procesando el mensaje {message_id} de {topic}: {e}", exc_info=True)
+            continue
+        await ack(message_id)
+    return len(messages)
+
+
+async def consume(topic: str, handler: Callable[[dict], Awaitable[None]]):
+    """Tarea en segundo plano: consume la cola mientras viva el proceso."""
+    owner = poller_id()
+    while True:
+        try:
+            if await consume_once(topic, handler, owner):
+                continue
+        except Exception as e:
+            logger.error(f"ERROR general consumiendo {topic}: {e}", exc_info=True)
+        await asyncio.sleep(settings.queue_poll_interval)
+
+
+class QueuedBot:
+    """
+    Sustituye a telegram.Bot en el proceso sondeador: `send_message` encola el
+    aviso para que lo envíe el proceso del bot.
+    """
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None, **kwargs):
+        await enqueue(
+            TOPIC_NOTIFY, {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+        )
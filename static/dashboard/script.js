@@ -77,7 +77,8 @@ function displayTrackedTokens(tokens) {
     listElement.innerHTML = tokens.map(token => {
         const symbol = String(token.token_symbol || "UNKNOWN").replace(/</g, "&lt;").replace(/>/g, "&gt;");
         const address = String(token.token_address).replace(/</g, "&lt;").replace(/>/g, "&gt;");
-        return `<li><strong>${symbol}</strong>: <code>${address}</code></li>`;
+        const chain = String(token.chain || "").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+        return `<li><strong>${symbol}</strong> (${chain}): <code>${address}</code></li>`;
     }).join('');
 }
 
@@ -106,6 +107,27 @@ function displayTrackedTransactions(transactions) {
     }).join('');
 }
 
+function displayPortfolio(portfolio) {
+    const listElement = document.getElementById('portfolio-balances');
+    const totalElement = document.getElementById('portfolio-total');
+    if (!listElement || !totalElement) return;
+
+    const nonZero = portfolio.balances.filter(token => token.balance !== '0');
+    if (nonZero.length === 0) {
+        listElement.innerHTML = '<li>Los balances de tus tokens monitorizados son 0.</li>';
+    } else {
+        listElement.innerHTML = nonZero.map(token => {
+            const symbol = String(token.token_symbol || "UNKNOWN").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+            const balance = String(token.balance).replace(/</g, "&lt;").replace(/>/g, "&gt;");
+            return `<li><strong>${symbol}</strong>: ${balance} ($${token.usd_value})</li>`;
+        }).join('');
+    }
+
+    const updatedAt = new Date(portfolio.updated_at * 1000).toLocaleString();
+    const staleNote = portfolio.stale ? ' (actualizando...)' : '';
+    totalElement.textContent = `$${portfolio.total_usd} · ${updatedAt}${staleNote}`;
+}
+
 
 // --- Data Fetching Functions ---
 
@@ -148,6 +170,40 @@ async function fetchTransactionsTracked() {
     }
 }
 
+async function fetchPortfolio() {
+    try {
+        const response = await fetchAuthenticated('/api/me/portfolio');
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const portfolio = await response.json();
+        displayPortfolio(portfolio);
+    } catch (error) {
+        console.error('Error fetching portfolio:', error);
+        if(document.getElementById('portfolio-balances')) {
+            document.getElementById('portfolio-balances').innerHTML = '<li>Error al cargar los balances</li>';
+        }
+    }
+}
+
+async function downloadTransactionsExport(format = 'csv') {
+    try {
+        const response = await fetchAuthenticated(`/api/me/transactions/export?format=${format}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const blob = await response.blob();
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = `depositos.${format}`;
+        link.click();
+        URL.revokeObjectURL(link.href);
+    } catch (error) {
+        console.error('Error exporting transactions:', error);
+        alert('Error al exportar el historial: ' + error.message);
+    }
+}
+
 
 // --- UI Management and Initialization ---
 
@@ -170,8 +226,10 @@ function checkLoginStatus() {
         authenticatedView.style.display = 'block';
         loggedInUserInfoSpan.textContent = userFirstName || `Usuario ID: ${userId}`;
         logoutButton.addEventListener('click', logout);
+        document.getElementById('export-csv-button').addEventListener('click', () => downloadTransactionsExport('csv'));
         fetchTokensTracked();
         fetchTransactionsTracked();
+        fetchPortfolio();
     } else {
         loginView.style.display = 'block';
         authenticatedView.style.display = 'none';
@@ -0,0 +1,137 @@
+# tests/fakeMoralisServer.py
+"""
+Servidor Moralis falso para tests y benchmarks.
+
+Responde a /wallets/{addr}/history, /wallets/{addr}/tokens y
+/wallets/{addr}/net-worth con datos sintéticos y deterministas por wallet:
+cada historial tiene `pages_per_wallet` páginas de `page_size` transacciones
+con un `Transfer` del primer token hacia la wallet. Permite simular latencia,
+errores 500 y respuestas 429 con una tasa configurable (semilla fija).
+"""
+import asyncio
+import hashlib
+import random
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+DEFAULT_TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+SENDER = "0x" + "5" * 40
+HEAD_TIMESTAMP = 1_700_000_000
+
+
+@dataclass
+class FakeMoralisServer:
+    pages_per_wallet: int = 1
+    page_size: int = 10
+    latency: float = 0.0  # Segundos por petición
+    error_rate: float = 0.0  # Fracción de respuestas 500
+    rate_limit_rate: float = 0.0  # Fracción de respuestas 429
+    tokens: List[str] = field(default_factory=lambda: [DEFAULT_TOKEN])
+    seed: int = 1234
+    new_deposits: int = 0  # Depósitos añadidos al principio del historial (advance)
+    calls: Dict[str, int] = field(default_factory=dict)
+    bytes_sent: int = 0
+    _rng: Optional[random.Random] = None
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def advance(self, deposits: int = 1):
+        """Simula depósitos nuevos en todas las wallets para el siguiente ciclo."""
+        self.new_deposits += deposits
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    # --- Datos sintéticos ---
+
+    def _transaction(self, wallet: str, n: int) -> Dict[str, Any]:
+        # n crece hacia el pasado: n negativos son los depósitos de advance()
+        timestamp = datetime.fromtimestamp(HEAD_TIMESTAMP - n * 60, timezone.utc)
+        return {
+            "hash": "0x" + hashlib.sha256(f"{wallet}:{n}".encode()).hexdigest(),
+            "block_number": str(50_000_000 - n),
+            "block_timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "erc20_transfers": [
+                {
+                    "address": self.tokens[0],
+                    "token_symbol": "MYST",
+                    "value": str(10**18),
+                    "value_formatted": "1",
+                    "from_address": SENDER,
+                    "to_address": wallet,
+                }
+            ],
+        }
+
+    def _history_page(self, wallet: str, page: int) -> Dict[str, Any]:
+        start = page * self.page_size - self.new_deposits
+        result = [
+            self._transaction(wallet, n) for n in range(start, start + self.page_size)
+        ]
+        has_more = page + 1 < self.pages_per_wallet
+        return {"result": result, "cursor": str(page + 1) if has_more else None}
+
+    # --- Servidor HTTP ---
+
+    async def _maybe_fail(self) -> Optional[web.Response]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return web.json_response({"message": "Too many requests"}, status=429)
+        if roll < self.rate_limit_rate + self.error_rate:
+            return web.json_response({"message": "Internal error"}, status=500)
+        return None
+
+    def _count(self, endpoint: str):
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def _json(self, data: Any) -> web.Response:
+        response = web.json_response(data)
+        self.bytes_sent += len(response.body)
+        return response
+
+    async def history(self, request: web.Request) -> web.Response:
+        self._count("history")
+        if failure := await self._maybe_fail():
+            return failure
+        page = int(request.query.get("cursor") or 0)
+        return self._json(self._history_page(request.match_info["address"], page))
+
+    async def tokens_balances(self, request: web.Request) -> web.Response:
+        self._count("tokens")
+        if failure := await self._maybe_fail():
+            return failure
+        return self._json(
+            {
+                "result": [
+                    {
+                        "token_address": token,
+                        "symbol": "MYST",
+                        "decimals": 18,
+                        "balance": str(10**18 * (i + 1)),
+                        "usd_value": 0.25 * (i + 1),
+                    }
+                    for i, token in enumerate(self.tokens)
+                ],
+                "cursor": None,
+            }
+        )
+
+    async def net_worth(self, request: web.Request) -> web.Response:
+        self._count("net-worth")
+        if failure := await self._maybe_fail():
+            return failure
+        return self._json({"total_networth_usd": "123.45"})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/wallets/{address}/history", self.history)
+        app.router.add_get("/wallets/{address}/tokens", self.tokens_balances)
+        app.router.add_get("/wallets/{address}/net-worth", self.net_worth)
+        return app
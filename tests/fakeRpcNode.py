@@ -0,0 +1,170 @@
+# tests/fakeRpcNode.py
+"""
+Nodo JSON-RPC falso para tests y benchmarks del backend RPC.
+
+Mantiene en memoria una cadena de bloques con logs `Transfer` y responde a
+eth_blockNumber, eth_getLogs, eth_getBlockByNumber, eth_call (decimals/symbol)
+y eth_getTransactionReceipt, tanto en llamadas sueltas como en batch.
+`max_block_range` simula los límites de rango de los proveedores reales.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from src.watcher.rpc import (
+    DECIMALS_SELECTOR,
+    SYMBOL_SELECTOR,
+    TRANSFER_TOPIC,
+    address_to_topic,
+)
+
+GENESIS_TIMESTAMP = 1_700_000_000
+BLOCK_TIME = 2
+
+
+@dataclass
+class FakeRpcNode:
+    head: int = 1000
+    max_block_range: Optional[int] = None
+    tokens: Dict[str, tuple] = field(default_factory=dict)  # address -> (decimals, symbol)
+    logs: List[Dict[str, Any]] = field(default_factory=list)
+    removed_tx_hashes: set = field(default_factory=set)  # Simula reorgs
+    dropped_methods: set = field(default_factory=set)  # Se omiten en las respuestas batch
+    http_requests: int = 0
+    calls: Dict[str, int] = field(default_factory=dict)
+
+    def add_token(self, address: str, decimals: int = 18, symbol: str = "TKN"):
+        self.tokens[address.lower()] = (decimals, symbol)
+
+    def add_transfer(
+        self,
+        block: int,
+        token: str,
+        from_address: str,
+        to_address: str,
+        amount: int,
+        tx_hash: Optional[str] = None,
+    ) -> str:
+        tx_hash = tx_hash or f"0x{len(self.logs) + 1:064x}"
+        self.logs.append(
+            {
+                "address": token.lower(),
+                "topics": [
+                    TRANSFER_TOPIC,
+                    address_to_topic(from_address),
+                    address_to_topic(to_address),
+                ],
+                "data": hex(amount),
+                "blockNumber": hex(block),
+                "transactionHash": tx_hash,
+                "logIndex": hex(len(self.logs)),
+            }
+        )
+        return tx_hash
+
+    # --- Métodos JSON-RPC ---
+
+    def eth_blockNumber(self):
+        return hex(self.head)
+
+    def eth_getLogs(self, query):
+        from_block = int(query["fromBlock"], 16)
+        to_block = min(int(query["toBlock"], 16), self.head)
+        if self.max_block_range and to_block - from_block + 1 > self.max_block_range:
+            raise _JsonRpcError(-32005, "block range too large, limit exceeded")
+        addresses = query.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {a.lower() for a in addresses} if addresses else None
+        topics = query.get("topics") or []
+
+        def matches(log):
+            if not from_block <= int(log["blockNumber"], 16) <= to_block:
+                return False
+            if addresses is not None and log["address"] not in addresses:
+                return False
+            for position, expected in enumerate(topics):
+                if expected is None:
+                    continue
+                options = expected if isinstance(expected, list) else [expected]
+                if log["topics"][position] not in options:
+                    return False
+            return log["transactionHash"] not in self.removed_tx_hashes
+
+        return [log for log in self.logs if matches(log)]
+
+    def eth_getBlockByNumber(self, number, full_transactions=False):
+        block = int(number, 16)
+        return {
+            "number": number,
+            "timestamp": hex(GENESIS_TIMESTAMP + block * BLOCK_TIME),
+        }
+
+    def eth_call(self, call, block_tag="latest"):
+        decimals, symbol = self.tokens.get(call["to"].lower(), (18, "TKN"))
+        if call["data"] == DECIMALS_SELECTOR:
+            return "0x" + decimals.to_bytes(32, "big").hex()
+        if call["data"] == SYMBOL_SELECTOR:
+            encoded = symbol.encode()
+            return (
+                "0x"
+                + (32).to_bytes(32, "big").hex()
+                + len(encoded).to_bytes(32, "big").hex()
+                + encoded.ljust(32, b"\x00").hex()
+            )
+        raise _JsonRpcError(-32000, "execution reverted")
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        if tx_hash in self.removed_tx_hashes:
+            return None
+        for log in self.logs:
+            if log["transactionHash"] == tx_hash:
+                return {
+                    "transactionHash": tx_hash,
+                    "blockNumber": log["blockNumber"],
+                    "status": "0x1",
+                }
+        return None
+
+    # --- Servidor HTTP ---
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method = request.get("method", "")
+        self.calls[method] = self.calls.get(method, 0) + 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        handler = getattr(self, method, None) if method.startswith("eth_") else None
+        if handler is None:
+            response["error"] = {"code": -32601, "message": "method not found"}
+            return response
+        try:
+            response["result"] = handler(*request.get("params", []))
+        except _JsonRpcError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+        return response
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.http_requests += 1
+        payload = await request.json()
+        if isinstance(payload, list):
+            responses = [self._dispatch(item) for item in payload]
+            return web.json_response(
+                [
+                    response
+                    for response, item in zip(responses, payload)
+                    if item.get("method") not in self.dropped_methods
+                ]
+            )
+        return web.json_response(self._dispatch(payload))
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        return app
+
+
+class _JsonRpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
@@ -0,0 +1,88 @@
+# tests/fakeTelegram.py
+"""
+Telegram falso para tests: la Bot API y un emisor de updates.
+
+`FakeTelegramServer` responde a los métodos de la Bot API que usa el bot
+(getMe, sendMessage, setWebhook...) y guarda los mensajes enviados. Se apunta
+el bot a él con TELEGRAM_API_BASE_URL=<url>/bot.
+
+`FakeUpdateSender` hace de Telegram en el otro sentido: envía updates de
+comandos al webhook, con el update_id creciente y la cabecera del secreto.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "test_bot"}
+
+
+@dataclass
+class FakeTelegramServer:
+    latency: float = 0.0  # Segundos por llamada a la Bot API
+    sent: List[Dict[str, Any]] = field(default_factory=list)
+    calls: Dict[str, int] = field(default_factory=dict)
+
+    def texts_for(self, chat_id: int) -> List[str]:
+        return [m["text"] for m in self.sent if int(m["chat_id"]) == chat_id]
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            result: Any = BOT_USER
+        elif method == "sendMessage":
+            self.sent.append(params)
+            result = {
+                "message_id": len(self.sent),
+                "date": 0,
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params["text"],
+            }
+        else:  # setWebhook, setMyCommands, deleteWebhook...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._method)
+        return app
+
+
+class FakeUpdateSender:
+    """Envía updates como lo haría Telegram a un webhook."""
+
+    def __init__(self, client: httpx.AsyncClient, path: str, secret: Optional[str] = None):
+        self.client = client
+        self.path = path
+        self.secret = secret
+        self._update_id = 0
+
+    def command(self, user_id: int, text: str) -> Dict[str, Any]:
+        self._update_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        return {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": user,
+                "text": text,
+                "entities": [
+                    {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+                ],
+            },
+        }
+
+    async def send(self, update: Dict[str, Any]) -> httpx.Response:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret} if self.secret else {}
+        return await self.client.post(self.path, json=update, headers=headers)
@@ -0,0 +1,107 @@
+# tests/pollerWorker.py
+"""
+Proceso de sondeo independiente para los tests y benchmarks multi-proceso.
+
+Recorre todas las franjas de un ciclo con `run_slot`, igual que varios
+`polling_job` compitiendo por `poll_lease`, contra la BD de DATABASE_URL y
+un Moralis (falso) en --moralis. Imprime en la última línea un JSON con las
+franjas que ha hecho, los avisos enviados (chat_id, texto) y los segundos.
+
+Uso:
+    DATABASE_URL=sqlite+aiosqlite:///poll.db python -m tests.pollerWorker \\
+        --moralis http://127.0.0.1:8080 --slots 12 --cycle 1 --owner w1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import List
+
+os.environ.setdefault("TELEGRAM_TOKEN", "worker_token")
+os.environ.setdefault("MORALIS_API_KEY", "worker_key")
+
+import aiohttp  # noqa: E402
+
+from src.bot.main import run_slot  # noqa: E402
+from src.chains import DEFAULT_CHAIN  # noqa: E402
+from src.models import engine  # noqa: E402
+from src.watcher import moralis  # noqa: E402
+
+
+class RecordingBot:
+    """Sustituye a telegram.Bot: guarda los mensajes sin enviarlos."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+async def run_worker(args) -> dict:
+    logging.getLogger("token_tracker_bot").setLevel(logging.WARNING)
+    moralis.MORALIS_BASE = args.moralis.rstrip("/")
+    bot = RecordingBot()
+    done = []
+    started = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession() as client_session:
+            for slot in range(args.slots):
+                if await run_slot(
+                    bot, client_session, DEFAULT_CHAIN, args.cycle, slot, args.slots, args.owner
+                ):
+                    done.append(slot)
+    finally:
+        await engine.dispose()
+    return {
+        "owner": args.owner,
+        "slots": done,
+        "notifications": bot.sent,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+async def spawn_workers(
+    n: int, database_url: str, moralis_url: str, slots: int, cycle: int = 1
+) -> List[dict]:
+    """Lanza n procesos a la vez sobre la misma BD y devuelve sus resultados."""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    processes = [
+        await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "tests.pollerWorker",
+            "--moralis",
+            moralis_url,
+            "--slots",
+            str(slots),
+            "--cycle",
+            str(cycle),
+            "--owner",
+            f"worker-{i}",
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        for i in range(n)
+    ]
+    results = []
+    for process in processes:
+        stdout, _ = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"El worker terminó con código {process.returncode}")
+        results.append(json.loads(stdout.decode().strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--moralis", required=True, help="URL base del Moralis falso")
+    parser.add_argument("--slots", type=int, default=12)
+    parser.add_argument("--cycle", type=int, default=1)
+    parser.add_argument("--owner", required=True)
+    print(json.dumps(asyncio.run(run_worker(parser.parse_args()))))
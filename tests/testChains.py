@@ -0,0 +1,163 @@
+import asyncio
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.deposits import Deposit
+from src.models import Base, User, UserToken, Transaction, upgrade_schema
+from src.utils.format import format_deposit_msg
+from src.walletindex import WalletIndex
+from src.watcher.rpc import RpcBackend
+from src.watcher.scanner import BlockScanner
+from tests.fakeRpcNode import FakeRpcNode
+
+TOKEN = "0x" + "1" * 40
+WALLET = "0x" + "a" * 40
+SENDER = "0x" + "c" * 40
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.watcher.scanner.AsyncSessionLocal", session_local)
+    mocker.patch("src.walletindex.AsyncSessionLocal", session_local)
+    mocker.patch("src.watcher.scanner.wallet_index", WalletIndex())
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET))
+            # Misma dirección de contrato en dos redes: son tokens distintos
+            session.add(UserToken(user_id=1, token_address=TOKEN, token_symbol="POL"))
+            session.add(
+                UserToken(user_id=1, chain="base", token_address=TOKEN, token_symbol="BAS")
+            )
+    yield session_local
+    await engine.dispose()
+
+
+async def _start_node(fake: FakeRpcNode) -> TestServer:
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    fake.url = str(server.make_url("/"))
+    return server
+
+
+async def test_scanners_run_per_chain_concurrently(TestSessionLocal, mocker):
+    mocker.patch("src.watcher.scanner.settings.rpc_lookback_blocks", 500)
+    polygon, base = FakeRpcNode(head=1000), FakeRpcNode(head=2000)
+    polygon.add_transfer(900, TOKEN, SENDER, WALLET, 1, tx_hash="0x" + "1" * 64)
+    base.add_transfer(1900, TOKEN, SENDER, WALLET, 2, tx_hash="0x" + "1" * 64)
+    servers = [await _start_node(polygon), await _start_node(base)]
+    try:
+        scanners = [
+            BlockScanner(backend=RpcBackend(rpc_url=polygon.url), name="polygon"),
+            BlockScanner(
+                backend=RpcBackend(rpc_url=base.url, chain="base"), name="base"
+            ),
+        ]
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*(s.run_cycle(session) for s in scanners))
+    finally:
+        for server in servers:
+            await server.close()
+
+    assert [r[1][0].chain for r in results] == ["polygon", "base"]
+    async with TestSessionLocal() as session:
+        rows = (await session.execute(select(Transaction.chain, Transaction.amount))).all()
+    # El mismo hash en dos redes son dos depósitos distintos
+    assert sorted(rows) == [("base", "2"), ("polygon", "1")]
+
+
+def test_deposit_message_links_to_chain_explorer():
+    deposit = Deposit(
+        tx_hash="0xabc",
+        token_address="0x" + "d" * 40,
+        token_symbol="USDC",
+        amount_raw=10**6,
+        amount="1",
+        timestamp=1704067200,
+        from_address=SENDER,
+    )
+    msg = format_deposit_msg(deposit)
+    assert "https://polygonscan.com/tx/0xabc" in msg
+    assert "2024\\-01\\-01T00:00:00\\.000Z" in msg
+    deposit.chain = "arbitrum"
+    msg = format_deposit_msg(deposit)
+    assert "https://arbiscan.io/tx/0xabc" in msg
+    assert "Arbitrum" in msg
+
+
+def test_upgrade_schema_rebuilds_tables_whose_primary_key_changed(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE user_tokens (user_id INTEGER, token_address VARCHAR,"
+                " token_symbol VARCHAR, PRIMARY KEY (user_id, token_address))"
+            )
+        )
+        conn.execute(text("INSERT INTO user_tokens VALUES (1, '0xt', 'T')"))
+        conn.execute(
+            text("CREATE TABLE last_tx (user_id INTEGER PRIMARY KEY, last_timestamp VARCHAR)")
+        )
+        conn.execute(text("INSERT INTO last_tx VALUES (1, 'ts')"))
+        upgrade_schema(conn)
+
+        inspector = inspect(conn)
+        assert inspector.get_pk_constraint("last_tx")["constrained_columns"] == [
+            "user_id",
+            "chain",
+        ]
+        assert conn.execute(text("SELECT * FROM user_tokens")).all() == [
+            (1, "polygon", "0xt", "T")
+        ]
+        assert conn.execute(text("SELECT chain, last_timestamp FROM last_tx")).all() == [
+            ("polygon", "ts")
+        ]
+
+
+def test_upgrade_schema_rebuilds_tables_whose_unique_constraints_changed(
+    tmp_path, mocker
+):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    insert = text(
+        "INSERT INTO transactions (user_id, chain, token_address, amount, tx_hash,"
+        " block_timestamp, from_address) VALUES (1, :chain, '0xt', '1', '0xh', 'ts', 'f')"
+    )
+    with engine.begin() as conn:
+        # Esquema de partida: la unicidad de transactions no incluía la cadena
+        conn.execute(
+            text(
+                "CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,"
+                " token_address VARCHAR NOT NULL, token_symbol VARCHAR, amount VARCHAR NOT NULL,"
+                " tx_hash VARCHAR NOT NULL, block_timestamp VARCHAR NOT NULL,"
+                " from_address VARCHAR NOT NULL, CONSTRAINT _user_tx_token_uc"
+                " UNIQUE (user_id, tx_hash, token_address))"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO transactions VALUES (1, 1, '0xt', 'T', '1', '0xh', 'ts', 'f')"
+            )
+        )
+        upgrade_schema(conn)
+
+        conn.execute(insert, {"chain": "base"})
+        with pytest.raises(IntegrityError):
+            with conn.begin_nested():
+                conn.execute(insert, {"chain": "polygon"})
+        assert conn.execute(
+            text("SELECT id, chain FROM transactions ORDER BY id")
+        ).all() == [(1, "polygon"), (2, "base")]
+
+        # Con el esquema ya al día no se vuelve a reconstruir ninguna tabla
+        rebuild = mocker.patch("src.models._rebuild_table")
+        Base.metadata.create_all(conn)
+        upgrade_schema(conn)
+        rebuild.assert_not_called()
@@ -0,0 +1,180 @@
+import time
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from tenacity import RetryError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src import portfolio, services
+from src.bot import main as bot_main
+from src.config.settings import settings
+from src.models import Base, User, UserToken
+from src.scheduler import PollScheduler
+from src.utils.cache import SWRCache, TTLCache
+from src.utils.circuitbreaker import CircuitBreaker, CircuitOpenError
+from src.utils.format import format_check_summary
+from src.watcher import moralis
+from tests.fakeMoralisServer import DEFAULT_TOKEN, FakeMoralisServer
+
+
+@pytest.fixture
+def clock(mocker):
+    monotonic = mocker.patch("src.utils.circuitbreaker.time").monotonic
+    monotonic.return_value = 100.0
+    return monotonic
+
+
+@pytest.fixture
+async def fake_moralis(mocker):
+    fake = FakeMoralisServer(page_size=2)
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    mocker.patch.object(moralis, "MORALIS_BASE", str(server.make_url("")).rstrip("/"))
+    # Circuitos y cachés propios del test
+    mocker.patch.dict(moralis._breakers, clear=True)
+    mocker.patch.multiple(settings, moralis_circuit_failures=1, moralis_circuit_reset=30.0)
+    mocker.patch.object(services, "_recent_checks", TTLCache())
+    mocker.patch.object(services, "_last_success", TTLCache())
+    mocker.patch.object(portfolio, "_wallet_snapshots", SWRCache(ttl=0, max_stale=3600))
+    yield fake
+    await server.close()
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.services.AsyncSessionLocal", session_local)
+    mocker.patch("src.bot.main.AsyncSessionLocal", session_local)
+    async with session_local() as session:
+        for user_id in range(1, 21):
+            session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+            session.add(UserToken(user_id=user_id, token_address=DEFAULT_TOKEN))
+        await session.commit()
+    yield session_local
+    await engine.dispose()
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    breaker = CircuitBreaker("api", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.check()
+    assert exc.value.retry_after == 30
+
+    # Pasado el reset, una sola prueba; si falla vuelve a abrirse entero
+    clock.return_value = 130.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.return_value = 160.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+async def test_outage_skips_poll_cycle_then_recovers(
+    fake_moralis, TestSessionLocal, clock, mocker
+):
+    notify = mocker.patch.object(bot_main, "notify_deposits")
+    fake_moralis.error_rate = 1.0
+    async with aiohttp.ClientSession() as session:
+        started = time.perf_counter()
+        await bot_main.run_poll_cycle(None, session)
+        # Un único fallo abre el circuito: sin reintentos ni 19 usuarios más fallando
+        assert time.perf_counter() - started < 2
+        assert fake_moralis.calls["history"] == 1
+        assert not moralis.available()
+
+        await bot_main.run_poll_cycle(None, session)
+        assert fake_moralis.calls["history"] == 1
+
+        # Moralis vuelve: la primera petición es la prueba y el ciclo sigue
+        fake_moralis.error_rate = 0.0
+        clock.return_value += settings.moralis_circuit_reset
+        await bot_main.run_poll_cycle(None, session)
+    assert fake_moralis.calls["history"] == 21
+    assert notify.call_count == 20
+    assert moralis.available()
+
+
+async def test_check_and_stats_answer_from_cache_while_open(
+    fake_moralis, TestSessionLocal, clock, mocker
+):
+    mocker.patch.object(settings, "check_cooldown", 0)
+    wallet = "0x" + "1".rjust(40, "0")
+    async with aiohttp.ClientSession() as session:
+        first = await services.check_and_process_all_chains(1, session)
+        cached_portfolio = await portfolio.get_portfolio(wallet, [DEFAULT_TOKEN], session)
+        calls = fake_moralis.total_calls
+
+        for endpoint in ("wallet_history", "wallet_tokens"):
+            moralis.circuit_breaker(endpoint).record_failure()
+
+        result = await services.check_and_process_all_chains(1, session)
+        degraded_portfolio = await portfolio.get_portfolio(
+            wallet, [DEFAULT_TOKEN], session
+        )
+        with pytest.raises(CircuitOpenError):
+            await portfolio.get_portfolio("0x" + "2".rjust(40, "0"), [DEFAULT_TOKEN], session)
+
+    assert fake_moralis.total_calls == calls
+    assert not first.degraded
+    assert result.degraded and result.deposits == []
+    assert result.checked_at == pytest.approx(first.checked_at, abs=1)
+    assert "Moralis no responde" in format_check_summary(result, 0)
+    assert degraded_portfolio.degraded
+    assert degraded_portfolio.total_usd == cached_portfolio.total_usd
+
+
+async def test_retries_stop_only_for_the_endpoint_whose_circuit_is_open(
+    fake_moralis, clock, mocker
+):
+    first_attempt = mocker.Mock(attempt_number=1)
+    fake_moralis.error_rate = 1.0
+    moralis.circuit_breaker("wallet_tokens").record_failure()
+    tokens_stop = moralis.get_wallet_token_balances.retry.stop
+    history_stop = moralis.get_wallet_deposits.retry.stop
+    assert tokens_stop(first_attempt)
+    assert not history_stop(first_attempt)
+
+    # El fallo de history abre solo su circuito y corta sus propios reintentos
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(RetryError):
+            await moralis.get_wallet_deposits("0x" + "a" * 40, [DEFAULT_TOKEN], session)
+    assert fake_moralis.calls["history"] == 1
+    assert history_stop(first_attempt)
+    assert not moralis.get_wallet_net_worth.retry.stop(first_attempt)
+
+
+async def test_adaptive_batch_requeues_unchecked_users_without_backoff(
+    fake_moralis, TestSessionLocal, clock, mocker
+):
+    mocker.patch("src.scheduler.AsyncSessionLocal", TestSessionLocal)
+    fake_moralis.error_rate = 1.0
+    scheduler = PollScheduler()
+    await scheduler.refresh()
+    due = scheduler.pop_due()
+    intervals = {uid: s.interval for uid, s in scheduler._schedules.items()}
+
+    async with aiohttp.ClientSession() as session:
+        await bot_main.poll_due_users(
+            None, scheduler, due, session, "polygon", moralis.MoralisBackend()
+        )
+
+    # El primer fallo abre el circuito: nadie se reprograma ni se aleja
+    assert fake_moralis.calls["history"] == 1
+    assert sorted(scheduler.pop_due()) == sorted(due)
+    assert {uid: s.interval for uid, s in scheduler._schedules.items()} == intervals
+    assert not scheduler._dirty
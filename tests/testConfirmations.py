@@ -0,0 +1,109 @@
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.confirmations import confirm_pending
+from src.deposits import Deposit
+from src.models import Base, User, Transaction, upgrade_schema
+from src.services import persist_deposits
+from src.watcher.rpc import RpcBackend
+from tests.fakeRpcNode import FakeRpcNode
+
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+WALLET = "0x" + "a" * 40
+SENDER = "0x" + "c" * 40
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.confirmations.AsyncSessionLocal", session_local)
+    mocker.patch("src.config.settings.settings.confirmation_depth", 10)
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET))
+    yield session_local
+    await engine.dispose()
+
+
+@pytest.fixture
+async def node():
+    fake = FakeRpcNode(head=1000)
+    fake.add_token(TOKEN, symbol="MYST")
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    fake.url = str(server.make_url("/"))
+    yield fake
+    await server.close()
+
+
+def _deposit(tx_hash, block_number):
+    return Deposit(
+        tx_hash=tx_hash,
+        token_address=TOKEN,
+        token_symbol="MYST",
+        amount_raw=10**18,
+        amount="1",
+        timestamp=1704067200 + block_number,
+        from_address=SENDER,
+        block_number=block_number,
+    )
+
+
+async def test_pending_deposits_are_confirmed_or_dropped(TestSessionLocal, node):
+    kept = node.add_transfer(995, TOKEN, SENDER, WALLET, 10**18)
+    reorged = node.add_transfer(996, TOKEN, SENDER, WALLET, 10**18)
+    node.removed_tx_hashes.add(reorged)
+
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            new_by_user = await persist_deposits(
+                session, {1: [_deposit(kept, 995), _deposit(reorged, 996)]}
+            )
+    assert [d.status for d in new_by_user[1]] == ["pending", "pending"]
+
+    backend = RpcBackend(rpc_url=node.url)
+    async with aiohttp.ClientSession() as session:
+        # Aún sin profundidad suficiente: no se consulta ningún recibo
+        assert await confirm_pending(session, backend) == ({}, {})
+        assert node.calls.get("eth_getTransactionReceipt", 0) == 0
+
+        node.head = 1010
+        confirmed, dropped = await confirm_pending(session, backend)
+
+    assert [d.tx_hash for d in confirmed[1]] == [kept]
+    assert confirmed[1][0].amount == "1"
+    assert confirmed[1][0].amount_raw == 10**18
+    assert [d.tx_hash for d in dropped[1]] == [reorged]
+
+    async with TestSessionLocal() as session:
+        rows = (await session.scalars(select(Transaction))).all()
+        assert [(tx.tx_hash, tx.status) for tx in rows] == [(kept, "confirmed")]
+
+
+def test_upgrade_schema_adds_new_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER,"
+                " token_address VARCHAR, token_symbol VARCHAR, amount VARCHAR,"
+                " tx_hash VARCHAR, block_timestamp VARCHAR, from_address VARCHAR)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO transactions VALUES (1, 1, 't', 'T', '1', '0x1', 'ts', 'f')"
+            )
+        )
+        upgrade_schema(conn)
+        columns = {c["name"] for c in inspect(conn).get_columns("transactions")}
+        assert {"amount_formatted", "block_number", "status"} <= columns
+        status = conn.execute(text("SELECT status FROM transactions")).scalar()
+        assert status == "confirmed"
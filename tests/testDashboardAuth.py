@@ -0,0 +1,87 @@
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import dashboardApp
+from src.models import Base, User, UserToken
+from src.portfolio import Portfolio
+from src.utils.cache import TTLCache
+
+
+def make_token(user_id: int, minutes: int = 60) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    return jwt.encode(
+        {"sub": str(user_id), "id": user_id, "exp": expire},
+        dashboardApp.SECRET_KEY,
+        algorithm=dashboardApp.ALGORITHM,
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    dashboardApp._verified_tokens.clear()
+    dashboardApp._user_contexts.clear()
+    yield
+
+
+def test_ttl_cache_evicts_lru_and_expired():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")  # "a" pasa a ser el más reciente
+    cache.set("c", 3, ttl=60)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+
+    cache.set("old", 4, expires_at=time.time() - 1)
+    assert cache.get("old") is None
+
+
+def test_verify_access_token_uses_cache(mocker):
+    token = make_token(42)
+    decode_spy = mocker.spy(dashboardApp.jwt, "decode")
+    exc = HTTPException(status_code=401)
+
+    assert dashboardApp.verify_access_token(token, exc) == 42
+    assert dashboardApp.verify_access_token(token, exc) == 42
+    assert decode_spy.call_count == 1
+
+
+def test_verify_access_token_rejects_expired_token():
+    token = make_token(42, minutes=-1)
+    with pytest.raises(HTTPException):
+        dashboardApp.verify_access_token(token, HTTPException(status_code=401))
+    assert len(dashboardApp._verified_tokens) == 0
+
+
+async def test_user_context_keeps_the_same_contract_on_each_chain(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(bind=engine, class_=AsyncSession)
+    mocker.patch("dashboardApp.AsyncSessionLocal", session_local)
+    token = "0x" + "1" * 40
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address="0xwallet"))
+            session.add(UserToken(user_id=1, token_address=token, token_symbol="POL"))
+            session.add(
+                UserToken(user_id=1, chain="base", token_address=token, token_symbol="BAS")
+            )
+    get_portfolio = mocker.patch.object(
+        dashboardApp, "get_portfolio", return_value=Portfolio("0xwallet")
+    )
+
+    context = await dashboardApp.get_user_context(1)
+    tokens = await dashboardApp.get_user_tokens(context)
+    await dashboardApp.get_user_portfolio(mocker.MagicMock(), context)
+    await engine.dispose()
+
+    assert sorted((t["chain"], t["token_symbol"]) for t in tokens) == [
+        ("base", "BAS"),
+        ("polygon", "POL"),
+    ]
+    # El portfolio de Moralis es de la cadena por defecto: solo sus contratos
+    assert list(get_portfolio.call_args.args[1]) == [token]
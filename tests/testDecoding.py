@@ -0,0 +1,98 @@
+import json
+import pytest
+from src.watcher import decoding
+from src.watcher.decoding import PayloadDecodeError
+
+AVAILABLE = ["json"] + [
+    name
+    for name, module in (("orjson", decoding.orjson), ("msgspec", decoding.msgspec))
+    if module is not None
+]
+
+HISTORY = {
+    "cursor": "abc",
+    "page_size": 1,
+    "result": [
+        {
+            "hash": "0x01",
+            "block_number": "123",
+            "block_timestamp": "2024-01-01T00:00:00.000Z",
+            "summary": "Received 1 MYST",
+            "logs": [{"data": "0x" + "0" * 64}],
+            "native_transfers": [],
+            "erc20_transfers": [
+                {
+                    "address": "0xtoken",
+                    "token_symbol": None,
+                    "value": "1000",
+                    "value_formatted": "0.001",
+                    "from_address": "0xfrom",
+                    "to_address": "0xto",
+                    "possible_spam": False,
+                }
+            ],
+        },
+        {"hash": "0x02", "block_number": "124", "block_timestamp": "x"},
+    ],
+}
+
+
+@pytest.mark.parametrize("decoder", AVAILABLE)
+def test_history_page_keeps_only_used_fields(decoder):
+    page = decoding.decode_history_page(json.dumps(HISTORY).encode(), decoder)
+
+    assert page.cursor == "abc"
+    first, second = page.result
+    assert first.hash == "0x01"
+    assert first.erc20_transfers[0].to_address == "0xto"
+    assert first.erc20_transfers[0].token_symbol is None
+    assert second.erc20_transfers == []
+    assert not hasattr(first, "__dict__")  # Registros con __slots__
+
+
+@pytest.mark.parametrize("decoder", AVAILABLE)
+def test_token_balances_and_errors(decoder):
+    body = json.dumps(
+        {"result": [{"token_address": "0xa", "decimals": 6, "balance": "5", "usd_value": 1}]}
+    ).encode()
+    entry = decoding.decode_token_balances(body, decoder).result[0]
+    assert (entry.token_address, entry.decimals, entry.usd_value) == ("0xa", 6, 1)
+
+    with pytest.raises(PayloadDecodeError):
+        decoding.decode_history_page(b"<html>502</html>", decoder)
+
+
+def test_auto_prefers_installed_fast_decoder():
+    assert decoding.resolve_decoder("auto") == AVAILABLE[-1]
+    with pytest.raises(ValueError):
+        decoding.resolve_decoder("simdjson")
+
+
+NULL_LISTS = {
+    "cursor": None,
+    "result": [
+        {"hash": "0x01", "block_number": 5, "erc20_transfers": None},
+        {"hash": "0x02", "block_number": "6"},
+    ],
+}
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [HISTORY, NULL_LISTS, {"result": None}, {}],
+    ids=["full", "null-transfers", "null-result", "empty"],
+)
+def test_every_decoder_gives_the_same_history_page(payload):
+    body = json.dumps(payload).encode()
+    pages = {name: decoding.decode_history_page(body, name) for name in AVAILABLE}
+    assert all(page == pages["json"] for page in pages.values()), pages
+    for tx in pages["json"].result:
+        assert tx.erc20_transfers is not None
+
+
+@pytest.mark.parametrize("payload", [{"result": None}, {"result": [], "cursor": "c"}])
+def test_every_decoder_gives_the_same_token_balances(payload):
+    body = json.dumps(payload).encode()
+    pages = {name: decoding.decode_token_balances(body, name) for name in AVAILABLE}
+    assert all(page == pages["json"] for page in pages.values()), pages
+    assert pages["json"].result == []
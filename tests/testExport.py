@@ -0,0 +1,73 @@
+import csv
+import io
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.models import Base, User, Transaction
+from src import export
+
+BIG_AMOUNT = "123456789012345678901234567890"
+
+
+@pytest.fixture
+async def populated_session_local(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    TestSessionLocal = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.export.AsyncSessionLocal", TestSessionLocal)
+
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address="0xwallet"))
+            session.add(User(user_id=2, wallet_address="0xother"))
+            for i in range(25):
+                session.add(
+                    Transaction(
+                        user_id=1,
+                        token_address="0xtoken",
+                        token_symbol="MYST",
+                        amount=BIG_AMOUNT,
+                        tx_hash=f"0x{i:064x}",
+                        block_timestamp=f"2024-01-01T00:00:{i:02d}.000Z",
+                        from_address="0xsender",
+                        status="pending" if i == 24 else "confirmed",
+                    )
+                )
+            session.add(
+                Transaction(
+                    user_id=2,
+                    token_address="0xtoken",
+                    amount="1",
+                    tx_hash="0xforeign",
+                    block_timestamp="2024-01-01T00:00:00.000Z",
+                    from_address="0xsender",
+                )
+            )
+    yield TestSessionLocal
+    await engine.dispose()
+
+
+async def test_stream_csv_in_chunks_keeps_precision(populated_session_local):
+    chunks = [chunk async for chunk in export.stream_csv(1, chunk_size=10)]
+    assert len(chunks) == 3  # 25 filas en bloques de 10
+
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == export.EXPORT_COLUMNS
+    assert len(rows) == 26
+    assert {row[4] for row in rows[1:]} == {BIG_AMOUNT}
+    assert rows[1][0] < rows[-1][0]  # Orden cronológico
+    status = [row[export.EXPORT_COLUMNS.index("status")] for row in rows[1:]]
+    assert status == ["confirmed"] * 24 + ["pending"]
+
+
+@pytest.mark.skipif(not export.parquet_available(), reason="pyarrow no instalado")
+async def test_stream_parquet_round_trip(populated_session_local):
+    import pyarrow.parquet as pq
+
+    data = b"".join([chunk async for chunk in export.stream_parquet(1, chunk_size=10)])
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 25
+    assert set(table.column("amount").to_pylist()) == {BIG_AMOUNT}
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 3
@@ -0,0 +1,56 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src import metrics
+from src.config.settings import settings
+from src.utils.http import create_client_session, pool_stats
+
+
+async def test_pool_reuses_connections_and_reports_waiters(mocker):
+    mocker.patch.multiple(settings, http_pool_limit_per_host=2)
+    release = asyncio.Event()
+    connections = set()
+
+    async def handler(request):
+        connections.add(request.transport)
+        if request.query.get("wait"):
+            await release.wait()
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    server = TestServer(app)
+    await server.start_server()
+    url = str(server.make_url("/"))
+    try:
+        async with create_client_session("test") as session:
+            # Peticiones seguidas: la conexión vuelve al pool y se reutiliza
+            for _ in range(5):
+                async with session.get(url) as resp:
+                    await resp.json()
+            assert len(connections) == 1
+            assert pool_stats(session)["idle"] == 1
+
+            # Más peticiones simultáneas que el tope por host: el resto espera
+            tasks = [
+                asyncio.create_task(session.get(url, params={"wait": "1"}))
+                for _ in range(4)
+            ]
+            await asyncio.sleep(0.1)
+            stats = pool_stats(session)
+            assert stats["in_use"] == 2
+            assert stats["waiters"] == 2
+            assert stats["limit_per_host"] == 2
+
+            text = metrics.REGISTRY.render()
+            assert 'http_pool_connections{pool="test",state="in_use"} 2' in text
+            assert 'http_pool_waiters{pool="test"} 2' in text
+
+            release.set()
+            for resp in await asyncio.gather(*tasks):
+                await resp.json()
+                resp.release()
+            assert len(connections) == 2
+    finally:
+        await server.close()
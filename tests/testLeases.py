@@ -0,0 +1,119 @@
+import time
+
+import pytest
+from aiohttp.test_utils import TestServer
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src import leases
+from src.models import Base, PollLease, User, UserToken
+from src.scheduler import abandoned_slots, claim_slot, finish_slot
+from tests.fakeMoralisServer import DEFAULT_TOKEN, FakeMoralisServer
+from tests.pollerWorker import spawn_workers
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.leases.AsyncSessionLocal", session_local)
+    mocker.patch("src.scheduler.AsyncSessionLocal", session_local)
+    yield session_local
+    await engine.dispose()
+
+
+async def test_lease_is_exclusive_until_it_expires(TestSessionLocal):
+    assert await leases.acquire_lease("updater", "a", ttl=60)
+    assert await leases.acquire_lease("updater", "a", ttl=60)  # Renovación
+    assert not await leases.acquire_lease("updater", "b", ttl=60)
+
+    await leases.release_lease("updater", "a")
+    assert await leases.acquire_lease("updater", "b", ttl=0.01)
+    time.sleep(0.02)
+    assert await leases.acquire_lease("updater", "a", ttl=60)
+
+
+async def test_leader_election_switches_roles(TestSessionLocal, mocker):
+    events = []
+
+    def election(owner):
+        return leases.LeaderElection(
+            "updater",
+            on_elected=mocker.AsyncMock(side_effect=lambda: events.append(f"{owner}+")),
+            on_demoted=mocker.AsyncMock(side_effect=lambda: events.append(f"{owner}-")),
+            owner=owner,
+            ttl=60,
+        )
+
+    first, second = election("a"), election("b")
+    await first.step()
+    await second.step()
+    assert (first.is_leader, second.is_leader) == (True, False)
+
+    await leases.release_lease("updater", "a")
+    await second.step()
+    await first.step()
+    assert (first.is_leader, second.is_leader) == (False, True)
+    assert events == ["a+", "b+", "a-"]
+
+
+async def test_unfinished_slot_is_retaken_after_expiry(TestSessionLocal):
+    assert await claim_slot("polygon", 0, cycle=5, owner="a", ttl=0.01)
+    assert await claim_slot("polygon", 1, cycle=5, owner="a", ttl=60)
+    assert await finish_slot("polygon", 1, cycle=5, owner="a")
+    time.sleep(0.02)
+
+    assert await abandoned_slots("polygon", 5) == [0]
+    assert await claim_slot("polygon", 0, cycle=5, owner="b")
+    assert not await claim_slot("polygon", 1, cycle=5, owner="b")
+    async with TestSessionLocal() as session:
+        assert (await session.get(PollLease, ("polygon", 0))).owner == "b"
+
+
+async def test_worker_processes_split_users_without_duplicates(tmp_path):
+    users, slots = 30, 12
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'poll.db'}"
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            for user_id in range(1, users + 1):
+                session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+                session.add(
+                    UserToken(user_id=user_id, token_address=DEFAULT_TOKEN, token_symbol="MYST")
+                )
+    await engine.dispose()
+
+    fake = FakeMoralisServer(pages_per_wallet=1, page_size=3, latency=0.01)
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    try:
+        results = await spawn_workers(3, database_url, str(server.make_url("")), slots)
+    finally:
+        await server.close()
+
+    assert sorted(s for r in results for s in r["slots"]) == list(range(slots))
+    notifications = [tuple(n) for r in results for n in r["notifications"]]
+    assert len(notifications) == users * 3
+    assert len(set(notifications)) == len(notifications)
+    # Cada wallet se ha consultado una sola vez entre los tres procesos
+    assert fake.calls["history"] == users
+
+
+async def test_failed_election_releases_the_lease(TestSessionLocal, mocker):
+    on_elected = mocker.AsyncMock(side_effect=[ConnectionError("Telegram"), None])
+    on_demoted = mocker.AsyncMock()
+    first = leases.LeaderElection("updater", on_elected, on_demoted, owner="a", ttl=60)
+    await first.step()
+    assert not first.is_leader
+    on_demoted.assert_awaited_once()
+
+    # El lease queda libre: otro proceso (o el mismo en el siguiente paso) lo toma
+    assert await leases.acquire_lease("updater", "b", ttl=60)
+    await leases.release_lease("updater", "b")
+    await first.step()
+    assert first.is_leader
+    assert on_elected.await_count == 2
@@ -0,0 +1,141 @@
+import socket
+
+import aiohttp
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from tenacity import wait_none
+from src import metrics
+from src.config.settings import settings
+from src.watcher import moralis
+
+
+def test_registry_renders_prometheus_text_format():
+    registry = metrics.Registry()
+    counter = metrics.Counter("jobs", "Trabajos.", ("result",), registry=registry)
+    histogram = metrics.Histogram(
+        "latency_seconds", "Latencia.", buckets=(0.1, 1), registry=registry
+    )
+    gauge = metrics.Gauge("queue_size", "Cola.", registry=registry)
+
+    counter.labels(result="ok").inc()
+    counter.labels(result="ok").inc(2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    gauge.set(3)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{result="ok"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+    assert "queue_size 3" in lines
+
+    with pytest.raises(ValueError):
+        counter.inc()  # Faltan las etiquetas
+
+
+async def test_moralis_requests_are_instrumented(mocker):
+    async def date_to_block(request):
+        return web.json_response({"block": 123})
+
+    app = web.Application()
+    app.router.add_get("/dateToBlock", date_to_block)
+    server = TestServer(app)
+    await server.start_server()
+    mocker.patch.object(moralis, "MORALIS_BASE", str(server.make_url("")).rstrip("/"))
+
+    responses = metrics.MORALIS_RESPONSES.labels(endpoint="date_to_block", status=200)
+    latency = metrics.MORALIS_REQUEST_SECONDS.labels(endpoint="date_to_block")
+    responses_before, latency_before = responses.value, latency.count
+    try:
+        async with aiohttp.ClientSession() as session:
+            assert await moralis.get_latest_block_number(session) == 123
+    finally:
+        await server.close()
+
+    assert responses.value == responses_before + 1
+    assert latency.count == latency_before + 1
+
+
+async def test_moralis_retries_are_labelled_by_endpoint(mocker):
+    replies = [web.json_response({}, status=500), web.json_response({"block": 7})]
+
+    async def date_to_block(request):
+        return replies.pop(0)
+
+    app = web.Application()
+    app.router.add_get("/dateToBlock", date_to_block)
+    server = TestServer(app)
+    await server.start_server()
+    mocker.patch.object(moralis, "MORALIS_BASE", str(server.make_url("")).rstrip("/"))
+    mocker.patch.dict(moralis._breakers, clear=True)
+    mocker.patch.object(moralis.get_latest_block_number.retry, "wait", wait_none())
+
+    retries = metrics.MORALIS_RETRIES.labels(endpoint="date_to_block")
+    retries_before = retries.value
+    try:
+        async with aiohttp.ClientSession() as session:
+            assert await moralis.get_latest_block_number(session) == 7
+    finally:
+        await server.close()
+
+    assert retries.value == retries_before + 1
+    assert "get_latest_block_number" not in metrics.REGISTRY.render()
+
+
+async def test_dashboard_metrics_require_token_or_localhost(mocker):
+    import dashboardApp
+
+    async def get(client_host: str, headers=None) -> int:
+        transport = httpx.ASGITransport(app=dashboardApp.app, client=(client_host, 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/metrics", headers=headers)).status_code
+
+    mocker.patch.object(settings, "dashboard_metrics_token", "")
+    assert await get("127.0.0.1") == 200
+    assert await get("203.0.113.5") == 403
+
+    mocker.patch.object(settings, "dashboard_metrics_token", "scrape")
+    assert await get("127.0.0.1") == 401
+    assert await get("203.0.113.5", {"Authorization": "Bearer wrong"}) == 401
+    assert await get("203.0.113.5", {"Authorization": "Bearer scrape"}) == 200
+
+
+async def test_bot_metrics_server_exposes_registry():
+    metrics.NOTIFICATIONS.labels(result="sent").inc()
+    async with TestClient(TestServer(metrics.make_metrics_app())) as client:
+        resp = await client.get("/metrics")
+        body = await resp.text()
+    assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'telegram_notifications_total{result="sent"}' in body
+    assert "# TYPE poll_cycle_seconds histogram" in body
+
+
+def test_metric_subclasses_must_implement_children_and_samples():
+    class Incomplete(metrics._Metric):
+        kind = "untyped"
+
+        def _new_child(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Sin _samples.", registry=metrics.Registry())
+
+
+async def test_bot_keeps_running_when_metrics_port_is_taken(mocker):
+    from src.bot import main as bot_main
+
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        mocker.patch.multiple(
+            settings, metrics_host="127.0.0.1", metrics_port=taken.getsockname()[1]
+        )
+        assert await bot_main.serve_metrics() is False
+    mocker.patch.object(settings, "metrics_port", 0)
+    assert await bot_main.serve_metrics() is False
@@ -0,0 +1,20 @@
+import json
+import threading
+from src.utils.offload import decode_json, maybe_offload
+
+
+def _thread_name() -> str:
+    return threading.current_thread().name
+
+
+async def test_maybe_offload_only_moves_large_work():
+    assert await maybe_offload(10, 100, _thread_name) == threading.current_thread().name
+    assert (await maybe_offload(100, 100, _thread_name)).startswith("offload")
+    assert await maybe_offload(10**6, 0, _thread_name) == threading.current_thread().name
+
+
+async def test_decode_json_large_payload(mocker):
+    mocker.patch("src.utils.offload.settings.offload_json_bytes", 1024)
+    payload = {"result": [{"hash": f"0x{i:064x}"} for i in range(100)]}
+    assert await decode_json(json.dumps(payload).encode()) == payload
+    assert await decode_json(b'{"cursor": null}') == {"cursor": None}
@@ -1,84 +1,72 @@
 import pytest
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from src.models import Base, User  # Import your models and Base
-from src.watcher.storage import TxStorage
+from src.models import Base, User, Transaction, LastTx
+from src.deposits import Deposit, parse_timestamp
+from src.services import persist_deposits
 
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
 
-# Setup a test database engine and session
-@pytest.fixture(name="test_engine")
-async def test_engine_fixture():
+
+@pytest.fixture(name="TestSessionLocal")
+async def test_session_local_fixture():
     engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    yield engine
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address="0x" + "a" * 40))
+            session.add(User(user_id=2, wallet_address="0x" + "b" * 40))
+    yield session_local
     await engine.dispose()
 
 
-@pytest.fixture(name="TestSessionLocal")
-async def test_session_local_fixture(test_engine, mocker):
-    """Fixture that returns a SQLAlchemy AsyncSessionLocal for tests and patches global engine/session."""
-    TestSessionLocal = async_sessionmaker(
-        bind=test_engine, class_=AsyncSession, expire_on_commit=False
+def _deposit(tx_hash: str, timestamp: str) -> Deposit:
+    return Deposit(
+        tx_hash=tx_hash,
+        token_address=TOKEN,
+        token_symbol="MYST",
+        amount_raw=10**18,
+        amount="1",
+        timestamp=parse_timestamp(timestamp),
+        from_address="0x" + "c" * 40,
     )
-    mocker.patch("src.models.engine", test_engine)
-    mocker.patch("src.models.AsyncSessionLocal", TestSessionLocal)
-    return TestSessionLocal
 
 
-@pytest.fixture
-async def db_session(TestSessionLocal):
-    """Fixture that provides a 'session' for testing."""
-    async with TestSessionLocal() as session:
-        yield session
-
+async def _persist(session_local, deposits_by_user, chain="polygon"):
+    async with session_local() as session:
+        async with session.begin():
+            return await persist_deposits(session, deposits_by_user, chain=chain)
 
-@pytest.fixture
-async def populated_db(db_session):
-    # Setup for tests that need initial data
-    user = User(user_id=123, wallet_address="0xtestwallet123")
-    db_session.add(user)
-    await db_session.commit()
-    await db_session.refresh(user)  # Refresh user to get any relationships loaded
-    yield db_session
 
+async def test_persist_deposits_skips_duplicates(TestSessionLocal):
+    first = _deposit("0x01", "2024-01-01T00:00:01.000Z")
+    second = _deposit("0x02", "2024-01-01T00:00:02.000Z")
 
-@pytest.mark.asyncio
-async def test_tx_storage_save_and_load_last(TestSessionLocal):
-    storage = TxStorage(user_id=1, session_factory=TestSessionLocal)
-    await storage.save_last("2023-01-01T00:00:00Z")
-    last_timestamp = await storage.load_last()
-    assert last_timestamp == "2023-01-01T00:00:00Z"
+    new_by_user = await _persist(TestSessionLocal, {1: [first, first], 2: [first]})
+    assert {uid: len(d) for uid, d in new_by_user.items()} == {1: 1, 2: 1}
 
+    new_by_user = await _persist(TestSessionLocal, {1: [first, second]})
+    assert [d.tx_hash for d in new_by_user[1]] == ["0x02"]
 
-@pytest.mark.asyncio
-async def test_tx_storage_filter_new(TestSessionLocal):
-    storage = TxStorage(user_id=2, session_factory=TestSessionLocal)
-    # No last timestamp, all deposits should be new
-    deposits_1 = [
-        {"block_timestamp": "2023-01-01T01:00:00Z"},
-        {"block_timestamp": "2023-01-01T02:00:00Z"},
-    ]
-    new_deposits_1 = await storage.filter_new(deposits_1)
-    assert len(new_deposits_1) == 2
+    async with TestSessionLocal() as session:
+        stored = await session.scalar(select(func.count()).select_from(Transaction))
+        last_tx = await session.get(LastTx, (1, "polygon"))
+    assert stored == 3
+    assert last_tx.last_timestamp == "2024-01-01T00:00:02.000Z"
 
-    # Save a timestamp, some deposits should be filtered
-    await storage.save_last("2023-01-01T01:30:00Z")
-    deposits_2 = [
-        {"block_timestamp": "2023-01-01T01:00:00Z"},  # Old
-        {"block_timestamp": "2023-01-01T02:00:00Z"},  # New
-        {"block_timestamp": "2023-01-01T03:00:00Z"},  # New
-    ]
-    new_deposits_2 = await storage.filter_new(deposits_2)
-    assert len(new_deposits_2) == 2
-    assert new_deposits_2[0]["block_timestamp"] == "2023-01-01T02:00:00Z"
 
+async def test_last_tx_is_tracked_per_chain(TestSessionLocal):
+    deposit = _deposit("0x01", "2024-01-01T00:00:01.000Z")
+    await _persist(TestSessionLocal, {1: [deposit]}, chain="polygon")
+    new_by_user = await _persist(
+        TestSessionLocal, {1: [_deposit("0x01", "2024-01-01T00:00:01.000Z")]}, chain="base"
+    )
+    assert len(new_by_user[1]) == 1
 
-@pytest.mark.asyncio
-async def test_tx_storage_reset(TestSessionLocal):
-    storage = TxStorage(user_id=3, session_factory=TestSessionLocal)
-    await storage.save_last("2023-01-01T00:00:00Z")
-    await storage.reset()
-    last_timestamp = await storage.load_last()
-    assert last_timestamp is None
+    async with TestSessionLocal() as session:
+        assert await session.get(LastTx, (1, "polygon")) is not None
+        assert await session.get(LastTx, (1, "base")) is not None
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import pytest
+from decimal import Decimal
+from src.portfolio import build_portfolio
+from src.utils.cache import SWRCache
+from src.watcher.decoding import TokenBalanceEntry
+
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+
+
+def test_build_portfolio_only_counts_monitored_tokens():
+    snapshot = {
+        "balances": [
+            TokenBalanceEntry(
+                token_address=TOKEN,
+                balance="1500000000000000000",
+                decimals=18,
+                symbol="MYST",
+                usd_value=0.25,
+            ),
+            TokenBalanceEntry(
+                token_address="0x" + "f" * 40,
+                balance="1",
+                decimals=0,
+                symbol="OTHER",
+                usd_value=100,
+            ),
+        ],
+        "net_worth_usd": "100.25",
+    }
+    portfolio = build_portfolio("0xwallet", snapshot, [TOKEN.upper()])
+
+    assert [t.symbol for t in portfolio.balances] == ["MYST"]
+    assert portfolio.balances[0].formatted_balance == "1.5"
+    assert portfolio.total_usd == Decimal("0.25")
+    assert portfolio.net_worth_usd == "100.25"
+
+
+@pytest.mark.asyncio
+async def test_swr_cache_serves_stale_and_refreshes_in_background():
+    cache = SWRCache(ttl=60, max_stale=3600)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return len(calls)
+
+    value, _ = await cache.get("wallet", loader)
+    assert value == 1
+
+    # Forzamos que la entrada esté caducada: se devuelve el valor viejo sin esperar
+    cache._entries.set("wallet", (1, time.time() - 120))
+    value, fetched_at = await cache.get("wallet", loader)
+    assert value == 1
+    assert time.time() - fetched_at > 60
+
+    await asyncio.sleep(0.01)
+    value, _ = await cache.get("wallet", loader)
+    assert value == 2
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_swr_cache_coalesces_concurrent_misses():
+    cache = SWRCache(ttl=60, max_stale=3600)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "data"
+
+    results = await asyncio.gather(*(cache.get("wallet", loader) for _ in range(5)))
+    assert {value for value, _ in results} == {"data"}
+    assert len(calls) == 1
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import time
+import pytest
+from src import profiling
+from src.bot.handlers import profile_command
+
+
+def _busy(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+async def _fake_cycle():
+    await asyncio.sleep(0)
+    _busy(500_000)
+
+
+@pytest.fixture
+def profile_dir(tmp_path, mocker):
+    mocker.patch("src.profiling.settings.profile_dir", str(tmp_path))
+    mocker.patch("src.profiling.settings.profile_sample_interval", 0.001)
+    return tmp_path
+
+
+@pytest.mark.parametrize("mode,suffix", [("cprofile", ".prof"), ("sample", ".folded")])
+async def test_profiler_covers_requested_cycles(profile_dir, mode, suffix):
+    profiler = profiling.CycleProfiler()
+    profiler.request(2, mode)
+    with pytest.raises(RuntimeError):
+        profiler.request(1, mode)
+
+    for _ in range(3):
+        with profiler.cycle():
+            await _fake_cycle()
+
+    assert not profiler.armed
+    assert profiler.cycles_done == 2
+    data_path, summary_path = profiler.last_results
+    assert data_path.endswith(suffix) and os.path.getsize(data_path) > 0
+    with open(summary_path, encoding="utf-8") as f:
+        summary = f.read()
+    assert summary.startswith("2 ciclos")
+    assert "_busy" in summary
+
+
+async def test_dump_tasks_and_loop_lag(profile_dir):
+    waiter = asyncio.create_task(asyncio.sleep(10), name="idle-waiter")
+    await asyncio.sleep(0)
+    try:
+        path, count = profiling.dump_tasks()
+    finally:
+        waiter.cancel()
+    with open(path, encoding="utf-8") as f:
+        assert "=== idle-waiter" in f.read()
+    assert count >= 2
+    assert 0 <= await profiling.measure_loop_lag(samples=2, interval=0.01) < 1
+
+
+async def test_profile_command_is_admin_only(mocker):
+    mocker.patch("src.utils.decorators.settings.admin_user_ids", [42])
+    mocker.patch.object(profiling.profiler, "runs_cycles", True)
+    request = mocker.patch.object(profiling.profiler, "request")
+    update = mocker.MagicMock()
+    update.message.reply_text = mocker.AsyncMock()
+    context = mocker.MagicMock(args=["3", "sample"])
+
+    update.effective_user.id = 7
+    await profile_command(update, context)
+    request.assert_not_called()
+
+    update.effective_user.id = 42
+    await profile_command(update, context)
+    request.assert_called_once_with(3, "sample")
+
+
+async def test_profile_command_refuses_without_poll_jobs(mocker):
+    mocker.patch("src.utils.decorators.settings.admin_user_ids", [42])
+    mocker.patch("src.bot.handlers.settings.process_role", "bot")
+    request = mocker.patch.object(profiling.profiler, "request")
+    update = mocker.MagicMock()
+    update.effective_user.id = 42
+    update.message.reply_text = mocker.AsyncMock()
+
+    await profile_command(update, mocker.MagicMock(args=["3"]))
+
+    request.assert_not_called()
+    assert "no ejecuta ciclos de sondeo" in update.message.reply_text.call_args.args[0]
+    assert not profiling.profiler.armed
+
+
+async def test_watchdog_reports_blocked_loop(caplog):
+    watchdog = profiling.LoopWatchdog(interval=0.02, threshold=0.05)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING, logger="token_tracker_bot"):
+            time.sleep(0.3)  # Bloquea el loop como lo haría un cálculo pesado
+            await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+
+    assert watchdog.stalls == 1
+    assert watchdog.max_lag >= 0.2
+    stall = next(r.message for r in caplog.records if "bloqueado" in r.message)
+    assert "test_watchdog_reports_blocked_loop" in stall
@@ -0,0 +1,30 @@
+import pytest
+from src.utils.ratelimit import RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_in_memory_rate_limiter_blocks_over_limit():
+    limiter = RateLimiter(limit=2, window=60)
+    assert await limiter.hit(1)
+    assert await limiter.hit(1)
+    assert not await limiter.hit(1)
+    assert await limiter.hit(2)  # Otra clave, otro contador
+
+
+@pytest.mark.asyncio
+async def test_shared_rate_limiter_counts_across_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    # Dos instancias sobre el mismo fichero simulan dos workers
+    worker_a = RateLimiter(limit=3, window=60, shared_path=path)
+    worker_b = RateLimiter(limit=3, window=60, shared_path=path)
+    assert await worker_a.hit(1)
+    assert await worker_b.hit(1)
+    assert await worker_a.hit(1)
+    assert not await worker_b.hit(1)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_disabled_with_zero_limit():
+    limiter = RateLimiter(limit=0, window=60)
+    for _ in range(100):
+        assert await limiter.hit(1)
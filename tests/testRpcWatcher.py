@@ -0,0 +1,105 @@
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from src.utils.cache import TTLCache
+from src.watcher.rpc import RpcBackend, RpcError
+from tests.fakeRpcNode import BLOCK_TIME, GENESIS_TIMESTAMP, FakeRpcNode
+
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+OTHER_TOKEN = "0x" + "e" * 40
+WALLET = "0x" + "a" * 40
+OTHER_WALLET = "0x" + "b" * 40
+SENDER = "0x" + "c" * 40
+
+
+@pytest.fixture
+async def node():
+    fake = FakeRpcNode(head=1000)
+    fake.add_token(TOKEN, decimals=18, symbol="MYST")
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    fake.url = str(server.make_url("/"))
+    yield fake
+    await server.close()
+
+
+async def test_scan_transfers_matches_wallet_index(node):
+    node.add_transfer(100, TOKEN, SENDER, WALLET, 15 * 10**17)
+    node.add_transfer(200, TOKEN, SENDER, OTHER_WALLET, 10**18)
+    node.add_transfer(300, OTHER_TOKEN, SENDER, WALLET, 10**18)  # Token no monitorizado
+
+    backend = RpcBackend(rpc_url=node.url, max_block_range=500, batch_size=4)
+    async with aiohttp.ClientSession() as session:
+        deposits = await backend.scan_transfers(
+            0, 1000, [TOKEN], {WALLET, OTHER_WALLET}, session
+        )
+
+    assert sorted(d.to_address for d in deposits) == [WALLET, OTHER_WALLET]
+    first = next(d for d in deposits if d.to_address == WALLET)
+    assert first.token_symbol == "MYST"
+    assert first.amount_raw == 15 * 10**17
+    assert first.amount == "1.5"
+    assert first.from_address == SENDER
+    assert first.block_timestamp.endswith(".000Z")
+    # 1001 bloques en trozos de 500 caben en una sola petición batch
+    assert node.calls["eth_getLogs"] == 3
+
+
+async def test_scan_keeps_timestamps_evicted_from_the_cache(node):
+    for block in (100, 200, 300):
+        node.add_transfer(block, TOKEN, SENDER, WALLET, 1)
+
+    backend = RpcBackend(rpc_url=node.url, max_block_range=1000, batch_size=1)
+    # Una caché más pequeña que los bloques del escaneo expulsa los primeros
+    backend._block_timestamps = TTLCache(maxsize=1)
+    async with aiohttp.ClientSession() as session:
+        deposits = await backend.scan_transfers(0, 1000, [TOKEN], {WALLET}, session)
+
+    assert sorted(d.timestamp for d in deposits) == [
+        GENESIS_TIMESTAMP + block * BLOCK_TIME for block in (100, 200, 300)
+    ]
+
+
+async def test_get_logs_shrinks_range_when_node_rejects_it(node):
+    node.max_block_range = 100
+    node.add_transfer(950, TOKEN, SENDER, WALLET, 1)
+
+    backend = RpcBackend(
+        rpc_url=node.url, max_block_range=1000, min_block_range=10, batch_size=10
+    )
+    async with aiohttp.ClientSession() as session:
+        for _ in range(10):
+            deposits = await backend.scan_transfers(0, 1000, [TOKEN], {WALLET}, session)
+            assert len(deposits) == 1
+
+    # La bisección converge al límite real del nodo
+    assert backend.block_range == 100
+
+
+async def test_get_wallet_deposits_uses_lookback_window(node, mocker):
+    mocker.patch("src.watcher.rpc.settings.rpc_lookback_blocks", 100)
+    node.add_transfer(500, TOKEN, SENDER, WALLET, 1)  # Fuera de la ventana
+    node.add_transfer(950, TOKEN, SENDER, WALLET, 2)
+    node.add_transfer(990, TOKEN, SENDER, WALLET, 3)
+
+    backend = RpcBackend(rpc_url=node.url)
+    async with aiohttp.ClientSession() as session:
+        deposits = await backend.get_wallet_deposits(WALLET, [TOKEN], session)
+
+    assert [d.amount_raw for d in deposits] == [3, 2]  # Más recientes primero
+
+
+async def test_batch_missing_response_raises_instead_of_reporting_reorg(node):
+    tx_hash = node.add_transfer(990, TOKEN, SENDER, WALLET, 1)
+    node.dropped_methods.add("eth_getTransactionReceipt")
+
+    backend = RpcBackend(rpc_url=node.url)
+    async with aiohttp.ClientSession() as session:
+        # Sin respuesta no se sabe si la transacción sigue en la cadena
+        with pytest.raises(RpcError):
+            await backend.get_transaction_blocks([tx_hash], session)
+
+        node.dropped_methods.clear()
+        assert await backend.get_transaction_blocks([tx_hash], session) == {
+            tx_hash: 990
+        }
@@ -0,0 +1,77 @@
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.models import Base, User, UserToken, Transaction, LastTx, ScanState
+from src.walletindex import WalletIndex
+from src.watcher.rpc import RpcBackend
+from src.watcher.scanner import BlockScanner
+from tests.fakeRpcNode import FakeRpcNode
+
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+WALLET_A = "0x" + "a" * 40
+WALLET_B = "0x" + "b" * 40
+SENDER = "0x" + "c" * 40
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.watcher.scanner.AsyncSessionLocal", session_local)
+    mocker.patch("src.walletindex.AsyncSessionLocal", session_local)
+    mocker.patch("src.watcher.scanner.wallet_index", WalletIndex())
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET_A))
+            session.add(User(user_id=2, wallet_address=WALLET_B))
+            session.add(User(user_id=3, wallet_address=WALLET_B))  # Misma wallet
+            session.add(UserToken(user_id=1, token_address=TOKEN, token_symbol="MYST"))
+            session.add(UserToken(user_id=2, token_address=TOKEN, token_symbol="MYST"))
+            # El usuario 3 no monitoriza ningún token
+    yield session_local
+    await engine.dispose()
+
+
+@pytest.fixture
+async def node():
+    fake = FakeRpcNode(head=1000)
+    fake.add_token(TOKEN, symbol="MYST")
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    fake.url = str(server.make_url("/"))
+    yield fake
+    await server.close()
+
+
+async def test_scanner_serves_all_users_from_one_pass(TestSessionLocal, node, mocker):
+    mocker.patch("src.watcher.scanner.settings.rpc_lookback_blocks", 500)
+    node.add_transfer(600, TOKEN, SENDER, WALLET_A, 10**18)
+    node.add_transfer(700, TOKEN, SENDER, WALLET_B, 2 * 10**18)
+    node.add_transfer(100, TOKEN, SENDER, WALLET_A, 1)  # Anterior a la ventana inicial
+
+    scanner = BlockScanner(backend=RpcBackend(rpc_url=node.url))
+    async with aiohttp.ClientSession() as session:
+        new_by_user = await scanner.run_cycle(session)
+        assert sorted(new_by_user) == [1, 2]
+        assert [d.amount_raw for d in new_by_user[1]] == [10**18]
+
+        # Sin bloques nuevos no hay trabajo ni depósitos repetidos
+        getlogs_before = node.calls["eth_getLogs"]
+        assert await scanner.run_cycle(session) == {}
+        assert node.calls["eth_getLogs"] == getlogs_before
+
+        node.head = 1100
+        node.add_transfer(1050, TOKEN, SENDER, WALLET_A, 5)
+        new_by_user = await scanner.run_cycle(session)
+        assert list(new_by_user) == [1]
+
+    async with TestSessionLocal() as session:
+        assert await session.scalar(select(func.count(Transaction.id))) == 3
+        assert (await session.get(ScanState, "polygon")).last_block == 1100
+        assert (await session.get(LastTx, (1, "polygon"))).last_timestamp is not None
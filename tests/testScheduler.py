@@ -0,0 +1,145 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.config.settings import settings
+from src.models import Base, PollSchedule, User, UserToken
+from src.scheduler import PollScheduler, SlotClock, claim_slot, slot_for
+
+TOKEN = "0x3c3e8eb3b432b6e4ab7b113f9c7f5bb8c2f993ce"
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    async with session_local() as session:
+        async with session.begin():
+            for user_id in (1, 2, 3):
+                session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+                session.add(
+                    UserToken(user_id=user_id, token_address=TOKEN, token_symbol="MYST")
+                )
+    mocker.patch("src.scheduler.AsyncSessionLocal", session_local)
+    mocker.patch.multiple(
+        settings,
+        poll_min_interval=100,
+        poll_max_interval=1000,
+        poll_backoff_factor=2.0,
+        poll_tier_min_intervals={"pro": 30},
+    )
+    yield session_local
+    await engine.dispose()
+
+
+async def test_new_users_are_due_and_backoff_is_capped(TestSessionLocal):
+    scheduler = PollScheduler()
+    await scheduler.refresh(now=NOW)
+    assert sorted(scheduler.pop_due(now=NOW)) == [1, 2, 3]
+    assert scheduler.pop_due(now=NOW) == []
+
+    now = NOW
+    for expected in (200, 400, 800, 1000, 1000):
+        scheduler.record(1, found_deposits=False, now=now)
+        assert scheduler.seconds_until_next(now) is not None
+        assert scheduler.pop_due(now=now + expected - 1) == []
+        assert scheduler.pop_due(now=now + expected) == [1]
+        now += expected
+
+    scheduler.record(1, found_deposits=True, now=now)
+    assert scheduler.pop_due(now=now + 100) == [1]
+
+
+async def test_schedule_is_persisted_with_tier_minimum(TestSessionLocal):
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            session.add(
+                PollSchedule(
+                    user_id=2, chain="polygon", next_check_at=NOW + 500, interval=500, tier="pro"
+                )
+            )
+
+    scheduler = PollScheduler()
+    await scheduler.refresh(now=NOW)
+    assert sorted(scheduler.pop_due(now=NOW)) == [1, 3]
+    assert scheduler.seconds_until_next(NOW) == 500
+
+    assert scheduler.pop_due(now=NOW + 500) == [2]
+    scheduler.record(2, found_deposits=True, now=NOW + 500)
+    await scheduler.flush()
+
+    async with TestSessionLocal() as session:
+        stored = await session.get(PollSchedule, (2, "polygon"))
+    assert stored.interval == 30
+    assert stored.next_check_at == NOW + 530
+
+    # Un planificador nuevo (reinicio) retoma la fecha guardada
+    restarted = PollScheduler()
+    await restarted.refresh(now=NOW + 510)
+    assert 2 not in restarted.pop_due(now=NOW + 510)
+    assert 2 in restarted.pop_due(now=NOW + 530)
+
+
+def test_slots_are_stable_and_spread():
+    counts = [0] * 24
+    for user_id in range(10_000):
+        counts[slot_for(user_id, 24)] += 1
+    assert slot_for(123456789, 24) == slot_for(123456789, 24)
+    assert min(counts) > 10_000 / 24 * 0.8
+
+
+def test_slot_clock_walks_the_interval_from_the_current_cycle():
+    clock = SlotClock(interval=100, slots=4)
+    # Arranque a mitad del ciclo 17: las franjas ya pasadas vencen enseguida
+    assert [clock.next(now=1750) for _ in range(5)] == [
+        (17, 0, 1700),
+        (17, 1, 1725),
+        (17, 2, 1750),
+        (17, 3, 1775),
+        (18, 0, 1800),
+    ]
+    # Tras quedarse atrás un ciclo entero se salta al actual
+    assert clock.next(now=2010) == (20, 0, 2000)
+
+    jittered = SlotClock(interval=100, slots=4, jitter=0.5)
+    _, _, at = jittered.next(now=1700)
+    assert 1700 <= at <= 1712.5
+
+
+async def test_each_slot_is_claimed_once_per_cycle(TestSessionLocal):
+    assert await claim_slot("polygon", 3, cycle=10, owner="a")
+    assert not await claim_slot("polygon", 3, cycle=10, owner="b")
+    assert await claim_slot("base", 3, cycle=10, owner="b")
+    assert await claim_slot("polygon", 3, cycle=11, owner="b")
+    assert not await claim_slot("polygon", 3, cycle=10, owner="a")
+
+
+async def test_flush_keeps_tier_edits_made_in_the_database(TestSessionLocal):
+    scheduler = PollScheduler()
+    await scheduler.refresh(now=NOW)
+    assert scheduler.pop_due(now=NOW)
+    scheduler.record(1, found_deposits=False, now=NOW)
+    await scheduler.flush()
+
+    # Un operador sube al usuario de nivel mientras el planificador corre
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            stored = await session.get(PollSchedule, (1, "polygon"))
+            stored.tier = "pro"
+            stored.min_interval = 50
+
+    scheduler.record(1, found_deposits=False, now=NOW + 200)
+    await scheduler.flush()
+    async with TestSessionLocal() as session:
+        stored = await session.get(PollSchedule, (1, "polygon"))
+    assert (stored.tier, stored.min_interval) == ("pro", 50)
+    assert stored.next_check_at == NOW + 600
+
+    # Tras refrescar, el nuevo mínimo se aplica a la siguiente comprobación
+    await scheduler.refresh(now=NOW + 600)
+    scheduler.record(1, found_deposits=True, now=NOW + 600)
+    assert scheduler.pop_due(now=NOW + 649) == []
+    assert scheduler.pop_due(now=NOW + 650) == [1]
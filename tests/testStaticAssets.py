@@ -0,0 +1,66 @@
+import gzip
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+from src.utils.static_assets import (
+    CachedStaticFiles,
+    IMMUTABLE_CACHE_CONTROL,
+    build_assets,
+)
+
+
+def make_client(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "index.html").write_text(
+        '<link rel="stylesheet" href="style.css"><script src="script.js"></script>'
+    )
+    (source / "script.js").write_text("console.log('hola');" * 50)
+    (source / "style.css").write_text("body { color: red; }")
+    output = tmp_path / "dist"
+    manifest = build_assets(str(source), str(output))
+    app = Starlette(
+        routes=[Mount("/", CachedStaticFiles(directory=str(output), html=True))]
+    )
+    return TestClient(app), manifest
+
+
+def test_build_rewrites_index_with_hashed_names(tmp_path):
+    client, manifest = make_client(tmp_path)
+    html = client.get("/", headers={"Accept-Encoding": "identity"}).text
+    assert manifest["script.js"] in html
+    assert manifest["style.css"] in html
+    assert 'src="script.js"' not in html
+
+
+def test_hashed_assets_are_immutable_and_precompressed(tmp_path):
+    client, manifest = make_client(tmp_path)
+    resp = client.get(
+        f"/{manifest['script.js']}", headers={"Accept-Encoding": "gzip"}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert "javascript" in resp.headers["content-type"]
+    assert "console.log" in resp.text  # El cliente descomprime la variante .gz
+    assert int(resp.headers["content-length"]) < len("console.log('hola');" * 50)
+
+
+def test_index_is_revalidated(tmp_path):
+    client, _ = make_client(tmp_path)
+    resp = client.get("/")
+    assert resp.headers["cache-control"] == "no-cache"
+
+    encoding = resp.headers.get("content-encoding", "identity")
+    not_modified = client.get(
+        "/", headers={"If-None-Match": resp.headers["etag"], "Accept-Encoding": encoding}
+    )
+    assert not_modified.status_code == 304
+
+
+def test_gzip_variant_matches_original(tmp_path):
+    make_client(tmp_path)
+    dist = tmp_path / "dist"
+    index = (dist / "index.html").read_bytes()
+    assert gzip.decompress((dist / "index.html.gz").read_bytes()) == index
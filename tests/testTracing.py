@@ -0,0 +1,41 @@
+import asyncio
+import json
+import logging
+from src import tracing
+
+
+async def _fake_check(delay: float, pages: int):
+    tracing.annotate(f"0x{pages:040x}")
+    with tracing.span("api"):
+        await asyncio.sleep(delay)
+        tracing.record(pages=pages, bytes=pages * 1000)
+    async with tracing.span("db_write"):
+        pass
+
+
+async def test_cycle_report_lists_slowest_users(caplog, mocker):
+    mocker.patch("src.tracing.settings.trace_top_n", 2)
+    with caplog.at_level(logging.INFO, logger="token_tracker_bot"):
+        with tracing.cycle_report("polygon") as report:
+            for user_id, delay, pages in [(1, 0.0, 1), (2, 0.05, 7), (3, 0.02, 3)]:
+                with tracing.trace_user(user_id, "polygon"):
+                    await _fake_check(delay, pages)
+
+    assert [t.user_id for t in report.slowest(2)] == [2, 3]
+    summary = json.loads(
+        next(r.message for r in caplog.records if "poll_cycle_summary" in r.message)
+    )
+    assert summary["users"] == 3
+    assert summary["pages"] == 11
+    assert summary["bytes"] == 11000
+    slowest = summary["slowest"][0]
+    assert slowest["user_id"] == 2
+    assert slowest["pages"] == 7
+    assert slowest["wallet"].endswith("7")
+    assert set(slowest["stages"]) == {"api", "db_write"}
+
+
+def test_span_without_trace_is_a_noop():
+    with tracing.span("api"):
+        tracing.record(pages=1)
+    tracing.annotate("0xabc")  # Sin traza activa no falla
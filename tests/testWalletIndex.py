@@ -0,0 +1,161 @@
+import tracemalloc
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src.bot import handlers
+from src.models import Base, User, UserToken
+from src.walletindex import WalletIndex
+
+TOKEN_A = "0x" + "1" * 40
+TOKEN_B = "0x" + "2" * 40
+WALLET_1 = "0x" + "a" * 40
+WALLET_2 = "0x" + "b" * 40
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.walletindex.AsyncSessionLocal", session_local)
+    async with session_local() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET_1.upper().replace("X", "x")))
+            session.add(User(user_id=2, wallet_address=WALLET_2))
+            session.add(User(user_id=3, wallet_address=WALLET_2))  # Misma wallet
+            session.add(User(user_id=4, wallet_address=WALLET_1))  # Sin tokens
+            session.add(UserToken(user_id=1, token_address=TOKEN_A))
+            session.add(UserToken(user_id=1, token_address=TOKEN_B))
+            session.add(UserToken(user_id=1, chain="base", token_address=TOKEN_A))
+            session.add(UserToken(user_id=2, token_address=TOKEN_A))
+            session.add(UserToken(user_id=3, token_address=TOKEN_A))
+    yield session_local
+    await engine.dispose()
+
+
+async def test_load_builds_reverse_index(TestSessionLocal):
+    index = WalletIndex()
+    assert await index.load() == 0
+
+    assert index.users_for("polygon", WALLET_1, TOKEN_A) == (1,)
+    assert index.users_for("polygon", WALLET_1, TOKEN_B) == (1,)
+    assert index.users_for("base", WALLET_1, TOKEN_A) == (1,)
+    assert index.users_for("polygon", WALLET_2, TOKEN_A) == (2, 3)
+    assert index.users_for("polygon", WALLET_2, TOKEN_B) == ()
+    assert index.users_for("base", WALLET_2, TOKEN_A) == ()
+    assert set(index.wallets("polygon")) == {WALLET_1, WALLET_2}
+    assert index.contracts("polygon") == {TOKEN_A, TOKEN_B}
+    assert index.stats() == {"users": 4, "wallets": 3, "pairs": 4}
+
+
+async def test_incremental_updates(TestSessionLocal):
+    index = WalletIndex()
+    await index.load()
+
+    # /setwallet: los tokens del usuario se mueven con él
+    index.set_wallet(2, WALLET_1)
+    assert index.users_for("polygon", WALLET_2, TOKEN_A) == (3,)
+    assert index.users_for("polygon", WALLET_1, TOKEN_A) == (1, 2)
+
+    index.add_token(4, "polygon", TOKEN_B.upper().replace("X", "x"))
+    assert index.users_for("polygon", WALLET_1, TOKEN_B) == (1, 4)
+
+    index.remove_token(3, "polygon", TOKEN_A)
+    assert WALLET_2 not in index.wallets("polygon")
+
+    index.remove_user_tokens(1)
+    assert index.users_for("base", WALLET_1, TOKEN_A) == ()
+    assert index.users_for("polygon", WALLET_1, TOKEN_A) == (2,)
+    assert index.contracts("base") == set()
+    assert index.stats() == {"users": 4, "wallets": 1, "pairs": 2}
+
+
+async def test_reconcile_fixes_drift_and_keeps_concurrent_updates(
+    TestSessionLocal, mocker
+):
+    index = WalletIndex()
+    await index.load()
+
+    # Cambio hecho por otro proceso: solo llega al reconciliar
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            await session.execute(delete(UserToken).where(UserToken.user_id == 3))
+    assert index.users_for("polygon", WALLET_2, TOKEN_A) == (2, 3)
+
+    # Un /addtoken que se aplica mientras se recarga no se pierde al sustituir el índice
+    build = index._build
+
+    async def build_with_concurrent_update():
+        data = await build()
+        index.add_token(2, "polygon", TOKEN_B)
+        return data
+
+    mocker.patch.object(index, "_build", build_with_concurrent_update)
+    assert await index.load() == 1
+    assert index.users_for("polygon", WALLET_2, TOKEN_A) == (2,)
+    assert index.users_for("polygon", WALLET_2, TOKEN_B) == (2,)
+
+
+def test_index_is_more_compact_than_nested_dicts():
+    wallets = [f"0x{n:040x}" for n in range(20_000)]
+    tokens = [f"0x{n:040x}".replace("0x0", "0xf", 1) for n in range(20)]
+
+    def measure(fill) -> int:
+        tracemalloc.start()
+        kept = fill()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert kept
+        return size
+
+    def naive():
+        index = {}
+        for user_id, wallet in enumerate(wallets):
+            index.setdefault(wallet, {}).setdefault(tokens[user_id % 20], []).append(user_id)
+        return index
+
+    def compact():
+        index = WalletIndex()
+        index.loaded = True
+        for user_id, wallet in enumerate(wallets):
+            index.set_wallet(user_id, wallet)
+            index.add_token(user_id, "polygon", tokens[user_id % 20])
+        return index
+
+    # Incluye el mapa usuario -> wallet que el índice anidado no tiene
+    assert measure(compact) < 0.8 * measure(naive)
+
+
+async def test_reset_reindexes_user_from_db(TestSessionLocal, mocker):
+    index = WalletIndex()
+    await index.load()
+    mocker.patch("src.bot.handlers.AsyncSessionLocal", TestSessionLocal)
+    mocker.patch("src.bot.handlers.wallet_index", index)
+
+    # Deriva de otro proceso: el usuario 1 ya no sigue TOKEN_B y el 3 se ha ido
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            await session.execute(
+                delete(UserToken).where(
+                    UserToken.user_id == 1, UserToken.token_address == TOKEN_B
+                )
+            )
+            await session.execute(delete(UserToken).where(UserToken.user_id == 3))
+            await session.execute(delete(User).where(User.user_id == 3))
+    update = mocker.MagicMock()
+    update.message.reply_text = mocker.AsyncMock()
+    for user_id in (1, 3):
+        update.effective_user.id = user_id
+        await handlers.reset(update, mocker.MagicMock())
+
+    assert index.users_for("polygon", WALLET_1, TOKEN_B) == ()
+    assert index.users_for("polygon", WALLET_1, TOKEN_A) == (1,)
+    assert index.users_for("base", WALLET_1, TOKEN_A) == (1,)
+    assert index.users_for("polygon", WALLET_2, TOKEN_A) == (2,)
+    assert index.stats() == {"users": 3, "wallets": 3, "pairs": 3}
+    # El índice ya coincide con la BD: la reconciliación no corrige nada
+    assert await index.load() == 0
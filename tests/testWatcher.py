@@ -1,23 +1,240 @@
+import asyncio
+
+import aiohttp
 import pytest
-from src.watcher.moralis import get_myst_deposits
-
-
-@pytest.mark.asyncio
-async def test_get_deposits(mocker):
-    # Prepare the mock response object
-    mock_response = mocker.AsyncMock()
-    mock_response.status = 200
-    mock_response.json.return_value = {"result": []}
-
-    # Patch aiohttp.ClientSession.get directly
-    # The return_value of the patched method needs to be an async context manager
-    mocker.patch(
-        "aiohttp.ClientSession.get",
-        return_value=mocker.AsyncMock(
-            __aenter__=mocker.AsyncMock(return_value=mock_response),
-            __aexit__=mocker.AsyncMock(return_value=None),
-        ),
+from aiohttp.test_utils import TestServer
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from telegram.ext import ConversationHandler
+from src import services
+from src.config.settings import settings
+from src.confirmations import confirm_pending
+from src.bot import handlers, main as bot_main
+from src.models import Base, User, UserToken, Transaction
+from src.watcher import moralis
+from tests.fakeMoralisServer import DEFAULT_TOKEN, FakeMoralisServer
+
+WALLET = "0x" + "a" * 40
+
+
+@pytest.fixture
+async def fake_moralis(mocker):
+    fake = FakeMoralisServer(pages_per_wallet=3, page_size=4)
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    mocker.patch.object(moralis, "MORALIS_BASE", str(server.make_url("")).rstrip("/"))
+    yield fake
+    await server.close()
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.services.AsyncSessionLocal", session_local)
+    mocker.patch("src.bot.main.AsyncSessionLocal", session_local)
+    yield session_local
+    await engine.dispose()
+
+
+async def test_get_wallet_deposits_follows_cursor(fake_moralis):
+    async with aiohttp.ClientSession() as session:
+        deposits = await moralis.get_wallet_deposits(WALLET, [DEFAULT_TOKEN], session)
+        other_token = await moralis.get_wallet_deposits(
+            WALLET, ["0x" + "f" * 40], session
+        )
+
+    assert fake_moralis.calls["history"] == 6
+    assert len(deposits) == 12
+    assert len({d.tx_hash for d in deposits}) == 12
+    assert deposits[0].timestamp > deposits[-1].timestamp
+    assert deposits[0].chain == "polygon"
+    assert deposits[0].amount_raw == 10**18
+    assert other_token == []
+
+
+async def test_poll_cycle_notifies_only_new_deposits(
+    fake_moralis, TestSessionLocal, mocker
+):
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET))
+            session.add(
+                UserToken(user_id=1, token_address=DEFAULT_TOKEN, token_symbol="MYST")
+            )
+    bot = mocker.AsyncMock()
+
+    async with aiohttp.ClientSession() as session:
+        await bot_main.run_poll_cycle(bot, session)
+        assert bot.send_message.await_count == 12
+
+        bot.send_message.reset_mock()
+        await bot_main.run_poll_cycle(bot, session)
+        assert bot.send_message.await_count == 0
+
+        fake_moralis.advance(2)
+        await bot_main.run_poll_cycle(bot, session)
+        assert bot.send_message.await_count == 2
+
+    async with TestSessionLocal() as session:
+        stored = await session.scalar(select(func.count()).select_from(Transaction))
+    assert stored == 14
+
+
+async def test_concurrent_checks_share_one_fetch_and_cooldown(
+    fake_moralis, TestSessionLocal, mocker
+):
+    mocker.patch.object(services, "_recent_checks", services.TTLCache())
+    fake_moralis.latency = 0.05
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET))
+            session.add(
+                UserToken(user_id=1, token_address=DEFAULT_TOKEN, token_symbol="MYST")
+            )
+    bot = mocker.AsyncMock()
+
+    async with aiohttp.ClientSession() as session:
+        first_task = asyncio.create_task(services.check_and_process_all_chains(1, session))
+        await asyncio.sleep(0.01)  # El /check ya está descargando el historial
+        second, polled = await asyncio.gather(
+            services.check_and_process_all_chains(1, session),
+            bot_main.poll_user(bot, 1, session, "polygon"),
+        )
+        first = await first_task
+        # Una sola descarga del historial (3 páginas) para las tres llamadas
+        assert fake_moralis.calls["history"] == 3
+        assert len(first.deposits) == 12 and not first.joined
+        assert second.deposits == [] and second.joined
+        assert polled is True
+        bot.send_message.assert_not_awaited()
+
+        fake_moralis.advance(1)
+        cached = await services.check_and_process_all_chains(1, session)
+        assert cached.cached and len(cached.deposits) == 12
+        # El sondeo se salta al usuario recién comprobado a mano
+        assert await bot_main.poll_user(bot, 1, session, "polygon") is False
+        assert fake_moralis.calls["history"] == 3
+
+
+async def test_addtoken_uses_symbol_from_token_metadata(
+    fake_moralis, TestSessionLocal, mocker
+):
+    mocker.patch("src.bot.handlers.AsyncSessionLocal", TestSessionLocal)
+    mocker.patch("src.utils.decorators.AsyncSessionLocal", TestSessionLocal)
+    async with TestSessionLocal() as session:
+        session.add(User(user_id=1, wallet_address=WALLET))
+        await session.commit()
+
+    update = mocker.MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = mocker.AsyncMock()
+    context = mocker.MagicMock(args=[DEFAULT_TOKEN.upper().replace("X", "x")], user_data={})
+    async with aiohttp.ClientSession() as session:
+        state = await handlers.add_token_start(update, context, session)
+
+    assert state == ConversationHandler.END
+    assert fake_moralis.calls["tokens"] == 1
+    assert "✅ Token MYST" in update.message.reply_text.call_args.args[0]
+    async with TestSessionLocal() as session:
+        token = await session.get(UserToken, (1, "polygon", DEFAULT_TOKEN))
+    assert token.token_symbol == "MYST"
+
+
+async def test_reset_clears_check_cooldown(fake_moralis, TestSessionLocal, mocker):
+    mocker.patch.object(services, "_recent_checks", services.TTLCache())
+    mocker.patch("src.bot.handlers.AsyncSessionLocal", TestSessionLocal)
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            session.add(User(user_id=1, wallet_address=WALLET))
+            session.add(UserToken(user_id=1, token_address=DEFAULT_TOKEN))
+    update = mocker.MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = mocker.AsyncMock()
+
+    async with aiohttp.ClientSession() as session:
+        await services.check_and_process_all_chains(1, session)
+        assert services.recently_checked(1)
+        await handlers.reset(update, mocker.MagicMock())
+        assert not services.recently_checked(1)
+        # El /check tras /reset vuelve a la API en lugar de repetir el resultado
+        result = await services.check_and_process_all_chains(1, session)
+
+    assert not result.cached
+    assert fake_moralis.calls["history"] == 6
+
+
+async def test_check_waits_for_confirmation_before_notifying(
+    fake_moralis, TestSessionLocal, mocker
+):
+    mocker.patch.object(services, "_recent_checks", services.TTLCache())
+    mocker.patch("src.confirmations.AsyncSessionLocal", TestSessionLocal)
+    mocker.patch.multiple(
+        settings, confirmation_depth=10, notify_on="confirmed", process_role="all"
     )
+    fake_moralis.pages_per_wallet = 1
+    async with TestSessionLocal() as session:
+        async with session.begin():
+            for user_id in (1, 2):
+                session.add(User(user_id=user_id, wallet_address=f"0x{user_id:040x}"))
+                session.add(UserToken(user_id=user_id, token_address=DEFAULT_TOKEN))
+    update = mocker.MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = mocker.AsyncMock()
+    update.message.reply_markdown_v2 = mocker.AsyncMock()
+    notify = mocker.patch.object(bot_main, "notify_deposits")
+    summary = mocker.patch.object(bot_main, "send_notification")
+    backend = mocker.Mock()
+    backend.get_block_number = mocker.AsyncMock(return_value=60_000_000)
+
+    async def get_transaction_blocks(tx_hashes, client_session):
+        async with TestSessionLocal() as session:
+            rows = await session.execute(
+                select(Transaction.tx_hash, Transaction.block_number)
+            )
+        return dict(rows.all())
+
+    backend.get_transaction_blocks = get_transaction_blocks
+
+    async with aiohttp.ClientSession() as session:
+        await handlers.check_deposits(update, mocker.MagicMock(), session)
+        await bot_main.handle_check_request(None, session, {"user_id": 2})
+        # /check guarda los depósitos como pendientes sin avisar todavía
+        update.message.reply_markdown_v2.assert_not_awaited()
+        notify.assert_not_called()
+        assert "4 depósitos nuevos pendientes" in update.message.reply_text.call_args.args[0]
+        assert "pendientes de confirmar" in summary.call_args.args[2]
+
+        confirmed, dropped = await confirm_pending(session, backend)
+
+    # El único aviso de cada depósito llega al confirmarse
+    assert {user_id: len(d) for user_id, d in confirmed.items()} == {1: 4, 2: 4}
+    assert dropped == {}
+
+
+async def test_addtoken_rejects_chains_this_deployment_does_not_poll(
+    TestSessionLocal, mocker
+):
+    mocker.patch("src.bot.handlers.AsyncSessionLocal", TestSessionLocal)
+    mocker.patch("src.utils.decorators.AsyncSessionLocal", TestSessionLocal)
+    mocker.patch.object(settings, "chains", ["polygon"])
+    async with TestSessionLocal() as session:
+        session.add(User(user_id=1, wallet_address=WALLET))
+        await session.commit()
+    update = mocker.MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = mocker.AsyncMock()
+    context = mocker.MagicMock(args=[DEFAULT_TOKEN, "base"], user_data={})
+
+    state = await handlers.add_token_start(update, context, None)
 
-    deposits = await get_myst_deposits("0x4c0ECdd578D76915be88e693cC98e32f85Bd93Ce")
-    assert deposits == []  # Test básico
+    assert state == ConversationHandler.END
+    reply = update.message.reply_text.call_args.args[0]
+    assert "no vigilada" in reply and "base" not in reply
+    assert handlers.parse_chain_arg(["0x", "base"], 1, monitored_only=False) == "base"
+    async with TestSessionLocal() as session:
+        assert await session.scalar(select(func.count()).select_from(UserToken)) == 0
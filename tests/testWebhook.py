@@ -0,0 +1,96 @@
+import asyncio
+import runpy
+import time
+
+import httpx
+import pytest
+from aiohttp.test_utils import TestServer
+from fastapi import FastAPI, Request
+from telegram.ext import CommandHandler
+from src.bot.webhook import TelegramWebhook
+from src.config.settings import settings
+from tests.fakeTelegram import FakeTelegramServer, FakeUpdateSender
+
+HANDLER_SECONDS = 0.05
+
+
+async def slow_echo(update, context):
+    # Los primeros mensajes tardan más: sin orden por usuario llegarían al revés
+    await asyncio.sleep(HANDLER_SECONDS / (1 + int(context.args[0])))
+    await update.message.reply_text(context.args[0])
+
+
+@pytest.fixture
+async def fake_telegram(mocker):
+    fake = FakeTelegramServer()
+    server = TestServer(fake.make_app())
+    await server.start_server()
+    mocker.patch.multiple(
+        settings,
+        telegram_api_base_url=str(server.make_url("/bot")),
+        telegram_webhook_secret="s3cret",
+        telegram_concurrent_updates=8,
+    )
+    yield fake
+    await server.close()
+
+
+@pytest.fixture
+async def sender(fake_telegram):
+    webhook = TelegramWebhook(handlers=[CommandHandler("echo", slow_echo)])
+    await webhook.start(None, register=False)
+    app = FastAPI()
+
+    @app.post("/hook")
+    async def hook(request: Request):
+        return await webhook.handle(request)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield FakeUpdateSender(client, "/hook", secret="s3cret")
+    await webhook.stop()
+
+
+async def _wait_for(fake, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while len(fake.sent) < count and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def test_updates_run_concurrently_but_in_order_per_user(fake_telegram, sender):
+    users, per_user = 5, 4
+    started = time.perf_counter()
+    for n in range(per_user):
+        for user_id in range(1, users + 1):
+            response = await sender.send(sender.command(user_id, f"/echo {n}"))
+            assert response.status_code == 200
+    await _wait_for(fake_telegram, users * per_user)
+    elapsed = time.perf_counter() - started
+
+    for user_id in range(1, users + 1):
+        assert fake_telegram.texts_for(user_id) == [str(n) for n in range(per_user)]
+    serial = users * sum(HANDLER_SECONDS / (1 + n) for n in range(per_user))
+    assert elapsed < serial / 2
+
+
+async def test_webhook_rejects_wrong_secret_and_bad_payloads(fake_telegram, sender):
+    sender.secret = "otro"
+    assert (await sender.send(sender.command(1, "/echo 0"))).status_code == 403
+    sender.secret = "s3cret"
+    assert (await sender.send({"no": "es un update"})).status_code == 400
+    await asyncio.sleep(HANDLER_SECONDS * 2)
+    assert fake_telegram.sent == []
+
+
+def test_gunicorn_refuses_several_workers_in_webhook_mode(mocker):
+    config = runpy.run_path("gunicorn.conf.py")
+    server = mocker.Mock()
+    server.cfg.workers = 4
+    mocker.patch.object(settings, "telegram_webhook_url", "")
+    config["on_starting"](server)
+
+    mocker.patch.object(settings, "telegram_webhook_url", "https://bot.example.com/hook")
+    with pytest.raises(RuntimeError, match="único worker"):
+        config["on_starting"](server)
+    server.cfg.workers = 1
+    config["on_starting"](server)
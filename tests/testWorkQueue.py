@@ -0,0 +1,102 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from src import workqueue
+from src.bot import main as bot_main
+from src.config.settings import settings
+from src.deposits import Deposit
+from src.services import CheckResult
+
+
+@pytest.fixture
+async def TestSessionLocal(mocker):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(workqueue.QueueMessage.metadata.create_all)
+    session_local = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    mocker.patch("src.workqueue.AsyncSessionLocal", session_local)
+    yield session_local
+    await engine.dispose()
+
+
+async def test_claimed_messages_are_hidden_until_timeout(TestSessionLocal, mocker):
+    clock = mocker.patch("src.workqueue.time").time
+    clock.return_value = 1000.0
+    for n in range(3):
+        await workqueue.enqueue("t", {"n": n})
+    await workqueue.enqueue("other", {"n": 99})
+
+    first = await workqueue.claim("t", "a", limit=2)
+    assert [p["n"] for _, p in first] == [0, 1]
+    assert [p["n"] for _, p in await workqueue.claim("t", "b")] == [2]
+    assert await workqueue.claim("t", "b") == []
+
+    await workqueue.ack(first[0][0])
+    clock.return_value += settings.queue_visibility_timeout
+    # Sin confirmar, el mensaje 1 (y el 2) vuelven a la cola al caducar
+    assert [p["n"] for _, p in await workqueue.claim("t", "b")] == [1, 2]
+
+
+async def test_failed_messages_are_retried_then_dropped(TestSessionLocal, mocker):
+    mocker.patch.multiple(settings, queue_visibility_timeout=-1, queue_max_attempts=2)
+    await workqueue.enqueue("t", {"ok": False})
+    await workqueue.enqueue("t", {"ok": True})
+    handled = []
+
+    async def handler(payload):
+        handled.append(payload["ok"])
+        if not payload["ok"]:
+            raise RuntimeError("fallo")
+
+    assert await workqueue.consume_once("t", handler) == 2
+    assert await workqueue.consume_once("t", handler) == 1
+    assert await workqueue.consume_once("t", handler) == 0
+    assert handled == [False, True, False]
+
+
+async def test_poller_answers_queued_check(TestSessionLocal, mocker):
+    deposit = Deposit(
+        tx_hash="0x01",
+        token_address="0x" + "3" * 40,
+        token_symbol="MYST",
+        amount_raw=10**18,
+        amount="1",
+        timestamp=1_700_000_000,
+        from_address="0x" + "5" * 40,
+    )
+    check = mocker.patch.object(
+        bot_main,
+        "check_and_process_all_chains",
+        side_effect=[CheckResult([deposit], 0.0), CheckResult([], 0.0)],
+    )
+    bot = workqueue.QueuedBot()
+    await workqueue.enqueue(workqueue.TOPIC_CHECK, {"user_id": 7})
+    await workqueue.enqueue(workqueue.TOPIC_CHECK, {"user_id": 8})
+
+    handler = lambda payload: bot_main.handle_check_request(bot, None, payload)  # noqa: E731
+    assert await workqueue.consume_once(workqueue.TOPIC_CHECK, handler) == 2
+    assert [c.args[0] for c in check.call_args_list] == [7, 8]
+
+    notifications = [p for _, p in await workqueue.claim(workqueue.TOPIC_NOTIFY)]
+    assert [(p["chat_id"], p["parse_mode"]) for p in notifications] == [
+        (7, "MarkdownV2"),
+        (8, None),
+    ]
+    assert "0x01" in notifications[0]["text"]
+
+
+async def test_queued_reset_clears_cooldown_on_the_poller(TestSessionLocal, mocker):
+    reset = mocker.patch.object(bot_main, "reset_check_cooldown")
+    check = mocker.patch.object(
+        bot_main, "check_and_process_all_chains", return_value=CheckResult([], 0.0)
+    )
+    await workqueue.enqueue(workqueue.TOPIC_CHECK, {"user_id": 7, "reset": True})
+    await workqueue.enqueue(workqueue.TOPIC_CHECK, {"user_id": 7})
+
+    handler = lambda payload: bot_main.handle_check_request(  # noqa: E731
+        workqueue.QueuedBot(), None, payload
+    )
+    assert await workqueue.consume_once(workqueue.TOPIC_CHECK, handler) == 2
+    reset.assert_called_once_with(7)
+    check.assert_awaited_once()